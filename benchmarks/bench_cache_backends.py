@@ -0,0 +1,128 @@
+"""Read and write latency of the cache backends on IPM-like payloads
+
+Usage::
+
+    python benchmarks/bench_cache_backends.py [--repeat 50]
+
+Each backend of ``cache.backend`` stores then reads back ``repeat`` responses
+of each payload: a DSS catalog (many small objects) and a year of hourly
+weather data from a weather adapter (large arrays of numbers). Reads include
+the JSON parsing of the response, as done by ``REST.get_one``.
+"""
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from urllib3.response import HTTPResponse
+
+from openalea.agroservices.cachebackends import BACKENDS, create_cache_backend
+
+
+def dss_catalog(n_dss=30, n_models=5):
+    schema = {
+        "type": "object",
+        "properties": {
+            "parameter%d" % i: {"type": "number", "title": "Parameter %d" % i}
+            for i in range(20)
+        },
+    }
+    return [
+        {
+            "id": "dss.%d" % i,
+            "name": "DSS %d" % i,
+            "models": [
+                {
+                    "id": "MODEL%d" % j,
+                    "name": "Model %d" % j,
+                    "crops": ["SOLTU", "DAUCS"],
+                    "pests": ["PSILRO"],
+                    "execution": {"input_schema": json.dumps(schema)},
+                }
+                for j in range(n_models)
+            ],
+        }
+        for i in range(n_dss)
+    ]
+
+
+def weather_data(n_hours=8760, n_parameters=5):
+    rng = random.Random(0)
+    return {
+        "timeStart": "2023-01-01T00:00:00+01:00",
+        "interval": 3600,
+        "weatherParameters": [1001, 1002, 2001, 3002, 4002][:n_parameters],
+        "locationWeatherData": [
+            {
+                "longitude": 10.78,
+                "latitude": 59.66,
+                "data": [
+                    [round(rng.uniform(-10, 30), 2) for _ in range(n_parameters)]
+                    for _ in range(n_hours)
+                ],
+            }
+        ],
+    }
+
+
+def make_response(url, payload):
+    response = requests.Response()
+    response._content = json.dumps(payload).encode()
+    response.status_code = 200
+    response.url = url
+    response.encoding = "utf-8"
+    response.headers["Content-Type"] = "application/json"
+    response.request = requests.Request("GET", url).prepare()
+    response.raw = HTTPResponse(
+        body=b"", status=200, request_url=url, preload_content=False
+    )
+    return response
+
+
+def bench(backend, cache_name, payload, repeat):
+    cache = create_cache_backend(backend, cache_name)
+    responses = [
+        make_response("https://platform.ipmdecisions.net/bench/%d" % i, payload)
+        for i in range(repeat)
+    ]
+    start = time.perf_counter()
+    for response in responses:
+        cache.save_response(response)
+    write = (time.perf_counter() - start) / repeat
+
+    keys = [cache.create_key(response.request) for response in responses]
+    start = time.perf_counter()
+    for key in keys:
+        cache.get_response(key).json()
+    read = (time.perf_counter() - start) / repeat
+    cache.clear()
+    return write, read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads = {"dss catalog": dss_catalog(), "weather data": weather_data()}
+    print(
+        "%-12s %-14s %10s %12s %12s" % ("backend", "payload", "size", "write", "read")
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in BACKENDS:
+            for name, payload in payloads.items():
+                size = len(json.dumps(payload))
+                cache_name = str(Path(tmp) / backend / name.replace(" ", "_"))
+                write, read = bench(backend, cache_name, payload, args.repeat)
+                print(
+                    "%-12s %-14s %8.0fkB %10.2fms %10.2fms"
+                    % (backend, name, size / 1e3, write * 1e3, read * 1e3)
+                )
+
+
+if __name__ == "__main__":
+    main()
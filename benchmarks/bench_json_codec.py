@@ -0,0 +1,77 @@
+"""Decoding and encoding time of the JSON codecs on weather data
+
+Usage::
+
+    python benchmarks/bench_json_codec.py [--days 365] [--repeat 5]
+
+The payload has the shape of ``ipm/data/weather_data.json`` (hourly rows of
+the weather parameters at a location), extended to the given number of days.
+Each available codec decodes and encodes it ``repeat`` times; the best time
+is reported.
+"""
+
+import argparse
+import json
+import time
+
+from openalea.agroservices.codec import get_codec
+from openalea.agroservices.ipm.datadir import datadir
+
+
+def weather_payload(days):
+    with open(datadir + "weather_data.json") as f:
+        doc = json.load(f)
+    location = doc["locationWeatherData"][0]
+    rows = location["data"]
+    n_rows = days * 24
+    location["data"] = [rows[i % len(rows)] for i in range(n_rows)]
+    location["length"] = n_rows
+    return doc
+
+
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    doc = weather_payload(args.days)
+    data = get_codec("json").dumps(doc)
+    print("payload: %d days, %.1f MB" % (args.days, len(data) / 1e6))
+
+    times = {}
+    for name in ("json", "orjson"):
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            print("%-8s not installed" % name)
+            continue
+        decode = best_time(lambda: codec.loads(data), args.repeat)
+        encode = best_time(lambda: codec.dumps(doc), args.repeat)
+        times[name] = decode, encode
+        print(
+            "%-8s decode %8.2f ms   encode %8.2f ms"
+            % (name, decode * 1e3, encode * 1e3)
+        )
+
+    if len(times) == 2:
+        print(
+            "speed-up: decode x%.1f, encode x%.1f"
+            % (
+                times["json"][0] / times["orjson"][0],
+                times["json"][1] / times["orjson"][1],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
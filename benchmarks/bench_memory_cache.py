@@ -0,0 +1,55 @@
+"""Cost of a hit of the in-memory cache of parsed results
+
+Usage::
+
+    python benchmarks/bench_memory_cache.py [--repeat 50]
+
+A :class:`~openalea.agroservices.memcache.MemoryCache` hit returns a copy of
+the kept result, so that callers may modify it. This measures the hit of a
+DSS catalog (many small objects) and of a year of hourly weather data (large
+arrays of numbers) with the copy of :func:`~memcache.copy_value`, with
+:func:`copy.deepcopy` (as before) and without copy (``copy=False``).
+"""
+
+import argparse
+import copy
+import time
+
+from bench_cache_backends import dss_catalog, weather_data
+
+from openalea.agroservices.memcache import MemoryCache
+
+
+class DeepCopyCache(MemoryCache):
+    def get(self, key, default=None):
+        return copy.deepcopy(super().get(key, default))
+
+
+def bench(cache, value, repeat):
+    cache.set("key", value)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        assert cache.get("key") is not None
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    payloads = {"catalog": dss_catalog(), "weather": weather_data()}
+    caches = {
+        "copy_value": MemoryCache(),
+        "deepcopy": DeepCopyCache(copy=False),
+        "no copy": MemoryCache(copy=False),
+    }
+    print("%-10s %-10s %12s" % ("payload", "copy", "hit"))
+    for name, value in payloads.items():
+        for label, cache in caches.items():
+            latency = bench(cache, value, args.repeat)
+            print("%-10s %-10s %10.3fms" % (name, label, latency * 1e3))
+
+
+if __name__ == "__main__":
+    main()
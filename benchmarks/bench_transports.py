@@ -0,0 +1,128 @@
+"""Throughput of the HTTP transports on IPM-like workloads against a local server
+
+Usage::
+
+    python benchmarks/bench_transports.py [--repeat 200] [--delay 20]
+
+Each transport of ``http.transport`` (httpx only if installed) runs the same
+workloads through :class:`~openalea.agroservices.services.REST`, without
+cache nor rate limit:
+
+- ``catalog``: sequential GETs of a DSS catalog (many small objects), where
+  the per-request overhead of the client shows
+- ``weather``: sequential GETs of a year of hourly weather data (large
+  arrays of numbers), where transfer and decoding dominate
+- ``run_model``: batches of concurrent POSTs of model inputs (see
+  ``REST.http_post``), answered after ``delay`` ms like a model run
+
+The local server speaks HTTP/1.1 over plain TCP, so the multiplexing of
+concurrent requests over one HTTP/2 connection (httpx transport) is not
+measured here: it requires a TLS server negotiating HTTP/2.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench_cache_backends import dss_catalog, weather_data
+
+from openalea.agroservices.services import REST
+from openalea.agroservices.transport import TRANSPORTS
+
+
+def start_server(payloads, delay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are written apart: do not wait for delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, body):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._reply(payloads.get(self.path.strip("/"), b"{}"))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(delay)
+            self._reply(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_address[1]
+
+
+def bench(transport, url, workload, repeat, batch):
+    service = REST(
+        "bench",
+        url=url,
+        verbose=False,
+        requests_per_sec=1e6,
+        burst=1e6,
+        transport=transport,
+        retry=0,
+    )
+    inputs = [
+        json.dumps({"model": i, "weatherData": [1.5] * 100}) for i in range(batch)
+    ]
+    if workload == "run_model":
+        # warm the connections of the pool
+        service.http_post("run", frmt="json", data=inputs)
+        start = time.perf_counter()
+        for _ in range(max(1, repeat // batch)):
+            results = service.http_post("run", frmt="json", data=inputs)
+            assert all(isinstance(r, dict) for r in results)
+        n = max(1, repeat // batch) * batch
+    else:
+        service.get_one(workload)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            assert service.get_one(workload) is not None
+        n = repeat
+    elapsed = time.perf_counter() - start
+    service.session.close()
+    return n / elapsed, elapsed / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=20, help="posts per batch")
+    parser.add_argument("--delay", type=float, default=20, help="model run, in ms")
+    args = parser.parse_args()
+
+    payloads = {
+        "catalog": json.dumps(dss_catalog(n_dss=3)).encode(),
+        "weather": json.dumps(weather_data()).encode(),
+    }
+    server, url = start_server(payloads, args.delay / 1e3)
+    print("%-10s %-10s %12s %12s" % ("transport", "workload", "requests/s", "latency"))
+    try:
+        for transport in TRANSPORTS:
+            for workload in ("catalog", "weather", "run_model"):
+                repeat = args.repeat if workload != "weather" else args.repeat // 10
+                try:
+                    rate, latency = bench(transport, url, workload, repeat, args.batch)
+                except ImportError as err:
+                    print("%-10s skipped: %s" % (transport, err))
+                    break
+                print(
+                    "%-10s %-10s %12.1f %10.2fms"
+                    % (transport, workload, rate, latency * 1e3)
+                )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""asyncio interface to REST services
+
+:class:`AsyncREST` sends its requests with `aiohttp <https://docs.aiohttp.org>`_
+(an optional dependency, ``pip install openalea.agroservices[async]``) from
+the running event loop, without threads nor gevent. It shares with
+:class:`~openalea.agroservices.services.REST` its settings, the rate limiter
+of the process, the requests cache and the interpretation of the results.
+
+.. code-block:: python
+
+    >>> import asyncio
+    >>> from openalea.agroservices.aio import AsyncREST
+    >>> async def main():
+    ...     async with AsyncREST("IPM", url="https://platform.ipmdecisions.net") as s:
+    ...         return await s.ahttp_get(["api/dss/rest/crop", "api/dss/rest/pest"])
+    >>> crops, pests = asyncio.run(main())
+"""
+
+import asyncio
+import ssl
+import time
+
+import requests
+import urllib3
+
+from openalea.agroservices.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    current_deadline,
+)
+from openalea.agroservices.ratelimit import LocalRateLimiter
+from openalea.agroservices.services import REST, CacheMissError, CircuitOpenError
+from openalea.agroservices.timings import RequestTimings
+
+__all__ = ["AsyncREST"]
+
+
+class AsyncREST(REST):
+    """REST service with awaitable requests
+
+    The coroutines :meth:`aget_one`, :meth:`apost_one`, :meth:`ahttp_get` and
+    :meth:`ahttp_post` are the counterparts of the synchronous methods of
+    :class:`~openalea.agroservices.services.REST`, which remain available.
+    At most ``general.async_concurrent`` requests are in flight at once.
+
+    The aiohttp session is created on first use; close it with
+    :meth:`aclose` or use the instance as an async context manager.
+
+    Failed requests are retried according to :attr:`retry_policy` and
+    :attr:`retry_policies`, waiting without blocking the event loop.
+
+    Responses are read from and saved to the HTTP cache of the service in a
+    worker thread. The coroutines do not use the in-memory cache of parsed
+    results, do not coalesce identical requests in flight and do not
+    revalidate the catalog URLs: these only apply to the synchronous
+    methods.
+    """
+
+    def __init__(self, name, url=None, *args, **kwargs):
+        super().__init__(name, url, *args, **kwargs)
+        self._aio_session = None
+        self._aio_loop = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the aiohttp session"""
+        if self._aio_session is not None:
+            await self._aio_session.close()
+        self._aio_session = None
+        self._aio_loop = None
+        self._semaphore = None
+
+    def _get_aio_session(self):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError(
+                "AsyncREST requires aiohttp: pip install openalea.agroservices[async]"
+            )
+
+        loop = asyncio.get_running_loop()
+        # sessions are bound to the event loop they were created in
+        if self._aio_session is None or self._aio_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.settings.CONCURRENT,
+                limit_per_host=self.settings.POOL_MAXSIZE,
+                force_close=not self.settings.KEEP_ALIVE,
+                ssl=self._ssl_context(),
+            )
+            self._aio_session = aiohttp.ClientSession(connector=connector)
+            self._aio_loop = loop
+            self._semaphore = asyncio.Semaphore(self.settings.CONCURRENT)
+        return self._aio_session
+
+    def _ssl_context(self):
+        if self.cert is None:
+            return True
+        context = ssl.create_default_context()
+        if isinstance(self.cert, (tuple, list)):
+            context.load_cert_chain(*self.cert)
+        else:
+            context.load_cert_chain(self.cert)
+        return context
+
+    async def _acalls(self, url):
+        """Asynchronous counterpart of :meth:`_calls`"""
+        delay = 0.0
+        if self.requests_per_sec and self.requests_per_sec > 0:
+            limiter = self.rate_limiter
+            args = (self._rate_key(url), self.requests_per_sec, self.burst)
+            if isinstance(limiter, LocalRateLimiter):
+                delay = limiter.reserve(*args)
+                if delay > 0:
+                    limiter.check_deadline(*args, delay)
+            else:
+                # e.g. a SQLite transaction, which may wait for a lock
+                delay = await asyncio.to_thread(limiter.reserve, *args)
+                if delay > 0:
+                    await asyncio.to_thread(limiter.check_deadline, *args, delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.request_metrics.record_wait(self.name, self._endpoint(url), delay)
+        return delay
+
+    def _retry_policy(self, url):
+        """Return the retry policy of url (see :attr:`retry_policies`)"""
+        policy, matched = self.retry_policy, ""
+        for prefix, endpoint_policy in self.retry_policies.items():
+            prefix = self._build_url(prefix)
+            if url.startswith(prefix) and len(prefix) > len(matched):
+                policy, matched = endpoint_policy, prefix
+        return policy
+
+    @staticmethod
+    def _urllib3_error(err, url):
+        """Return the urllib3 counterpart of an aiohttp error, as seen by
+        :class:`~urllib3.util.retry.Retry`, or None if it is not retried"""
+        import aiohttp
+
+        # aiohttp < 3.10 has no ConnectionTimeoutError
+        connect_timeout = getattr(aiohttp, "ConnectionTimeoutError", ())
+        if isinstance(err, (aiohttp.ClientConnectorError, connect_timeout)):
+            return urllib3.exceptions.NewConnectionError(None, str(err))
+        if isinstance(err, asyncio.TimeoutError):
+            return urllib3.exceptions.ReadTimeoutError(None, url, str(err))
+        if isinstance(
+            err,
+            (aiohttp.ClientPayloadError, aiohttp.ServerDisconnectedError, OSError),
+        ):
+            return urllib3.exceptions.ProtocolError(str(err), err)
+        return None
+
+    async def _await_retry(self, retry, timings, deadline, response=None):
+        """Wait before the next retry, as :meth:`Retry.sleep` does"""
+        wait = retry.get_wait_time(response)
+        if deadline is not None:
+            deadline.check(wait, "the next retry")
+        with timings.measure("retry_wait"):
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def _to_response(resp, content, request):
+        """Convert an aiohttp response into a :class:`requests.Response`"""
+        res = requests.Response()
+        res.status_code = resp.status
+        res.reason = resp.reason
+        res.headers = requests.structures.CaseInsensitiveDict(resp.headers)
+        res.url = str(resp.url)
+        res.encoding = requests.utils.get_encoding_from_headers(res.headers)
+        res.request = request
+        res.raw = urllib3.HTTPResponse(
+            body=b"",
+            headers=dict(resp.headers),
+            status=resp.status,
+            reason=resp.reason,
+            preload_content=False,
+            request_url=res.url,
+        )
+        res._content = content
+        return res
+
+    async def _arequest(self, method, url, frmt, params=None, **kargs):
+        """Send a request (or use the cache) and interpret the result"""
+        import aiohttp
+
+        request = requests.Request(
+            method,
+            url,
+            params=params,
+            data=kargs.get("data"),
+            files=kargs.get("files"),
+            headers=kargs.get("headers"),
+        ).prepare()
+
+        timings = RequestTimings()
+        cache = getattr(self.session, "cache", None) if self.CACHING else None
+        key = None
+        if cache is not None and method in ("GET", "HEAD"):
+            key = cache.create_key(request)
+            # the cache backends do blocking I/O: keep it off the event loop
+            with timings.measure("transfer"):
+                cached = await asyncio.to_thread(cache.get_response, key)
+            if cached is not None and (self.settings.OFFLINE or not cached.is_expired):
+                timings.from_cache = True
+                cached.timings = timings
+                self.last_response = cached
+                self._record_cache(url, "hit")
+                return self._parse(cached, frmt)
+        if self.settings.OFFLINE:
+            raise CacheMissError(request.url)
+
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check(what="%s %s" % (method, url))
+        # an open circuit fails at once, without waiting for the rate limiter;
+        # once allowed, the request must report to the breaker (a half-open
+        # circuit lets a single trial through)
+        breaker = self._get_circuit_breaker(url)
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(self._rate_key(url), breaker.retry_in())
+        try:
+            timings.add("rate_limit", await self._acalls(url))
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+
+        session = self._get_aio_session()
+        proxy = None
+        if self.proxies:
+            proxy = self.proxies.get(url.split(":", 1)[0])
+        auth = None
+        if hasattr(self, "authentication"):
+            auth = aiohttp.BasicAuth(*self.authentication)
+        connect, read = self._request_timeout(kargs.get("timeout"))
+        # retried as the adapters of the session would do
+        retry = self._retry_policy(url).to_retry(self.retry_stats)
+        if method == "GET":
+            self._record_cache(url, "miss")
+        start = time.perf_counter()
+        try:
+            while True:
+                timeout = aiohttp.ClientTimeout(
+                    total=None if deadline is None else deadline.remaining(),
+                    sock_connect=connect,
+                    sock_read=read,
+                )
+                try:
+                    acquire = time.perf_counter()
+                    async with self._semaphore:
+                        timings.add("acquire", time.perf_counter() - acquire)
+                        sent = time.perf_counter()
+                        async with session.request(
+                            method,
+                            request.url,
+                            data=request.body,
+                            headers=dict(request.headers),
+                            proxy=proxy,
+                            auth=auth,
+                            timeout=timeout,
+                        ) as resp:
+                            # aiohttp does not tell the connection apart
+                            timings.add("ttfb", time.perf_counter() - sent)
+                            with timings.measure("transfer"):
+                                content = await resp.read()
+                except Exception as err:
+                    error = self._urllib3_error(err, request.url)
+                    if error is None or (deadline is not None and deadline.expired):
+                        raise
+                    try:
+                        retry = retry.increment(method, request.url, error=error)
+                    except Exception:
+                        raise err
+                    await self._await_retry(retry, timings, deadline)
+                    continue
+                res = self._to_response(resp, content, request)
+                has_retry_after = "Retry-After" in res.headers
+                if not retry.is_retry(method, res.status_code, has_retry_after):
+                    break
+                try:
+                    retry = retry.increment(method, request.url, response=res.raw)
+                except urllib3.exceptions.MaxRetryError:
+                    # exhausted: the last response is returned
+                    break
+                await self._await_retry(retry, timings, deadline, res.raw)
+        except Exception as err:
+            self._record_request(method, url, None, start, request.body)
+            error = self._request_failed(err, breaker, deadline)
+            if error is err:
+                raise
+            raise error from err
+        except BaseException:
+            # cancelled: the host is not to blame
+            if breaker is not None:
+                breaker.release()
+            raise
+        res.timings = timings
+        self._record_request(method, url, res, start, received=len(content))
+        if breaker is not None:
+            if res.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+        if key is not None and res.ok:
+            await asyncio.to_thread(cache.save_response, res, key)
+        self.last_response = res
+        return self._parse(res, frmt)
+
+    def _parse(self, res, frmt):
+        start = time.perf_counter()
+        parsed = self._interpret_returned_request(res, frmt)
+        self._finish_timings(res, start)
+        return parsed
+
+    async def aget_one(self, query=None, frmt="json", params=None, **kargs):
+        """Awaitable counterpart of :meth:`~services.REST.get_one`"""
+        deadline = kargs.pop("deadline", None)
+        if deadline is not None:
+            with Deadline(deadline):
+                return await self.aget_one(query, frmt, params, **kargs)
+        if params is None:
+            params = {}
+        url = self._build_url(query)
+        self.logging.debug(url)
+        try:
+            with self.tracer.span(
+                "AsyncREST.get_one", service=self.name, endpoint=self._endpoint(url)
+            ):
+                res = await self._arequest("GET", url, frmt, params=params, **kargs)
+            if frmt == "raw":
+                return res
+            try:
+                res = res.decode()
+            except:
+                pass
+            return res
+        except (CacheMissError, CircuitOpenError, DeadlineExceeded):
+            raise
+        except Exception as err:
+            self.logging.critical(err)
+            self.logging.critical(
+                """Query unsuccessful. Maybe too slow response.
+    Consider increasing it with settings.TIMEOUT attribute {}""".format(
+                    self.settings.TIMEOUT
+                )
+            )
+
+    async def ahttp_get(self, query, frmt="json", params=None, **kargs):
+        """Awaitable counterpart of :meth:`~services.REST.http_get`
+
+        If query is a list, the requests are sent concurrently and the
+        results are returned in the same order. As with the synchronous
+        batches, a failed request gives an
+        :class:`~openalea.agroservices.services.AgroServicesError` (with a
+        ``query`` attribute) in place of its result.
+        """
+        deadline = kargs.pop("deadline", None)
+        if deadline is not None:
+            with Deadline(deadline):
+                return await self.ahttp_get(query, frmt, params, **kargs)
+        if params is None:
+            params = {}
+        if kargs.get("headers") is None:
+            content = kargs.get("content", self.content_types[frmt])
+            kargs["headers"] = {"User-Agent": self.getUserAgent(), "Accept": content}
+        kargs.pop("content", None)
+        if isinstance(query, list):
+            with self.tracer.span(
+                "AsyncREST.http_get", service=self.name, queries=len(query)
+            ):
+                results = await asyncio.gather(
+                    *(
+                        self.aget_one(key, frmt, params=params, **kargs)
+                        for key in query
+                    ),
+                    return_exceptions=True,
+                )
+            for res in results:
+                # cancellation is not the failure of a request
+                if isinstance(res, BaseException) and not isinstance(res, Exception):
+                    raise res
+            return [
+                self._query_error(res, key) if isinstance(res, Exception) else res
+                for key, res in zip(query, results)
+            ]
+        return await self.aget_one(query, frmt=frmt, params=params, **kargs)
+
+    async def apost_one(self, query=None, frmt="json", **kargs):
+        """Awaitable counterpart of :meth:`~services.REST.post_one`"""
+        deadline = kargs.pop("deadline", None)
+        if deadline is not None:
+            with Deadline(deadline):
+                return await self.apost_one(query, frmt, **kargs)
+        url = self._build_url(query)
+        self.logging.debug(url)
+        try:
+            with self.tracer.span(
+                "AsyncREST.post_one", service=self.name, endpoint=self._endpoint(url)
+            ):
+                res = await self._arequest("POST", url, frmt, **kargs)
+            if frmt == "raw":
+                return res
+            try:
+                return res.decode()
+            except:
+                self.logging.debug("BioServices:: Could not decode the response")
+                return res
+        except (CacheMissError, CircuitOpenError, DeadlineExceeded):
+            raise
+        except Exception as err:
+            self.logging.critical(err)
+            return None
+
+    async def ahttp_post(
+        self,
+        query,
+        params=None,
+        data=None,
+        frmt="xml",
+        headers=None,
+        files=None,
+        content=None,
+        **kargs,
+    ):
+        """Awaitable counterpart of :meth:`~services.REST.http_post`"""
+        if headers is None:
+            headers = {"User-Agent": self.getUserAgent()}
+            if content is None:
+                headers["Accept"] = self.content_types[frmt]
+            else:
+                headers["Accept"] = content
+        return await self.apost_one(
+            query,
+            frmt=frmt,
+            params=params,
+            data=data,
+            headers=headers,
+            files=files,
+            **kargs,
+        )
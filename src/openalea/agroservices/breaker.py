@@ -0,0 +1,168 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Circuit breakers of the services
+
+A :class:`CircuitBreaker` stops sending requests to a host that keeps
+failing: after ``failure_threshold`` consecutive failures, the circuit opens
+and requests are rejected at once for ``reset_timeout`` seconds. Then the
+circuit is half-open: a few trial requests are let through, and the circuit
+closes again if they succeed, or opens for another period if they fail.
+
+The breakers of a process are kept by host in a :class:`CircuitBreakers`
+registry, whose :meth:`~CircuitBreakers.snapshot` describes their state.
+"""
+
+import threading
+import time
+
+__all__ = ["CircuitBreaker", "CircuitBreakers", "get_circuit_breakers"]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """State of the circuit of one host
+
+    :param int failure_threshold: number of consecutive failures opening the
+        circuit
+    :param float reset_timeout: number of seconds the circuit stays open
+    :param int half_open_max: number of trial requests let through at once
+        when the circuit is half-open
+    """
+
+    def __init__(
+        self, failure_threshold=5, reset_timeout=30, half_open_max=1, clock=None
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._clock = clock or time.monotonic
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trials = 0
+        #: number of failures recorded
+        self.total_failures = 0
+        #: number of requests rejected while the circuit was open
+        self.rejected = 0
+
+    def _update(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trials = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._update(self._clock())
+            return self._state
+
+    def allow(self):
+        """Return True if a request may be sent now"""
+        with self._lock:
+            self._update(self._clock())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._trials < self.half_open_max:
+                self._trials += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trials = 0
+
+    def record_failure(self):
+        with self._lock:
+            now = self._clock()
+            self._update(now)
+            self.total_failures += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = now
+
+    def release(self):
+        """Give back a trial that told nothing about the host (e.g. an
+        answer from the cache)"""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def retry_in(self):
+        """Number of seconds before requests are let through again"""
+        with self._lock:
+            now = self._clock()
+            self._update(now)
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - now)
+
+    def snapshot(self):
+        """Return the state of the circuit as a dict"""
+        retry_in = self.retry_in()
+        with self._lock:
+            return dict(
+                state=self._state,
+                failures=self._failures,
+                total_failures=self.total_failures,
+                rejected=self.rejected,
+                retry_in=retry_in,
+            )
+
+    def __repr__(self):
+        return "CircuitBreaker(%s)" % self.snapshot()
+
+
+class CircuitBreakers:
+    """Circuit breakers by key (host)"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, failure_threshold=5, reset_timeout=30):
+        """Return the breaker of key, created with the given parameters if
+        needed (existing breakers take the new parameters)"""
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(
+                    failure_threshold, reset_timeout
+                )
+            else:
+                breaker.failure_threshold = failure_threshold
+                breaker.reset_timeout = reset_timeout
+            return breaker
+
+    def snapshot(self):
+        """Return the state of all the circuits, as a dict {key: state}"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {key: breaker.snapshot() for key, breaker in breakers.items()}
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+
+
+# shared by all the services of the process
+_circuit_breakers = CircuitBreakers()
+
+
+def get_circuit_breakers():
+    """Return the circuit breakers shared by the services of the process"""
+    return _circuit_breakers
@@ -0,0 +1,146 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Storage backends of the requests cache
+
+The backend is chosen by the ``cache.backend`` setting:
+
+- ``sqlite`` (default): a SQLite database file
+- ``filesystem``: one file per response in a directory
+- ``memory``: a dict, lost when the process exits
+- ``kv``: a key-value store. If the ``cache.kv_url`` setting is set, a Redis
+  server (``redis://host:port/db``, requires the redis package), otherwise a
+  local :mod:`dbm` database standing in for it.
+"""
+
+import dbm
+import os
+import threading
+
+from requests_cache.backends import BaseCache, BaseStorage, get_valid_kwargs
+from requests_cache.backends.filesystem import FileCache
+from requests_cache.backends.sqlite import SQLiteCache
+from requests_cache.serializers import pickle_serializer
+
+__all__ = ["BACKENDS", "DbmCache", "DbmStorage", "create_cache_backend"]
+
+BACKENDS = ("sqlite", "filesystem", "memory", "kv")
+
+
+class DbmStorage(BaseStorage):
+    """A dict-like interface to a :mod:`dbm` database
+
+    Keys are str. Values are serialized (pickle by default) or, without
+    serializer, stored as UTF-8 encoded str.
+    """
+
+    def __init__(self, path, serializer=pickle_serializer, **kwargs):
+        super().__init__(serializer=serializer, **kwargs)
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = dbm.open(path, "c")
+
+    def __getitem__(self, key):
+        with self._lock:
+            value = self._db[key]
+        if self.serializer is None:
+            return value.decode()
+        return self.deserialize(key, value)
+
+    def __setitem__(self, key, value):
+        if self.serializer is None:
+            value = value.encode()
+        else:
+            value = self.serialize(value)
+        with self._lock:
+            self._db[key] = value
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._db[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._db
+
+    def __iter__(self):
+        with self._lock:
+            keys = list(self._db.keys())
+        return (key.decode() for key in keys)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._db)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._db.keys()):
+                del self._db[key]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class DbmCache(BaseCache):
+    """requests_cache backend storing responses in local dbm databases
+
+    :param str cache_name: path prefix of the databases
+    """
+
+    def __init__(self, cache_name="http_cache", serializer=None, **kwargs):
+        super().__init__(cache_name=cache_name, **kwargs)
+        kwargs = get_valid_kwargs(BaseStorage.__init__, kwargs)
+        self.responses = DbmStorage(
+            cache_name + "_responses",
+            serializer=serializer or pickle_serializer,
+            **kwargs,
+        )
+        self.redirects = DbmStorage(cache_name + "_redirects", serializer=None)
+
+    @property
+    def db_path(self):
+        return self.cache_name
+
+    def close(self):
+        self.responses.close()
+        self.redirects.close()
+
+
+def create_cache_backend(backend, cache_name, kv_url=None, **kwargs):
+    """Return the requests_cache backend *backend* named *cache_name*
+
+    :param str backend: one of :data:`BACKENDS`
+    :param str cache_name: path prefix of the files of the cache (namespace
+        on a Redis server)
+    :param str kv_url: URL of the Redis server of the 'kv' backend. If None,
+        a local dbm database is used instead.
+    :param kwargs: options of the backend (e.g. fast_save for sqlite)
+    """
+    if backend == "sqlite":
+        return SQLiteCache(cache_name + ".sqlite", **kwargs)
+    if backend == "filesystem":
+        return FileCache(cache_name + "_files", **kwargs)
+    if backend == "memory":
+        return BaseCache(cache_name)
+    if backend == "kv":
+        if kv_url is None:
+            directory = os.path.dirname(cache_name)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            return DbmCache(cache_name)
+        import redis
+        from requests_cache.backends.redis import RedisCache
+
+        return RedisCache(
+            os.path.basename(cache_name), connection=redis.from_url(kv_url)
+        )
+    raise ValueError(
+        "Unknown cache backend %r, expected one of %s" % (backend, ", ".join(BACKENDS))
+    )
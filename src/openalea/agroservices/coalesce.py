@@ -0,0 +1,98 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Coalescing of identical calls running at the same time
+
+When several threads ask for the same thing at the same moment (e.g. the DSS
+catalog at the start of a batch), only the first one does the work; the
+others wait for it and share its result. A call failing because the time
+budget of its caller is spent is not shared: the waiting threads make the
+call again, with their own budget.
+"""
+
+import threading
+
+from .deadline import DeadlineExceeded
+
+__all__ = ["SingleFlight"]
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "expired", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        #: True if the call failed on the deadline of its caller
+        self.expired = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time, sharing its result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, deadline=None):
+        """Call *fn* unless a call with the same *key* is in flight
+
+        :param deadline: the :class:`~deadline.Deadline` of the caller. A
+            thread waiting for the call of another one raises
+            :class:`~deadline.DeadlineExceeded` when it is reached (the call
+            goes on).
+        :return: a (result, shared) tuple, shared being True if the result
+            is also returned to other threads. If the call fails, its
+            exception is raised in all the waiting threads, unless it failed
+            on the deadline of its caller: the waiting threads then call
+            *fn* again.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                else:
+                    call.waiters += 1
+            if leader:
+                break
+
+            timeout = None if deadline is None else deadline.remaining()
+            if not call.event.wait(timeout):
+                raise DeadlineExceeded(
+                    "deadline reached while waiting for an identical request"
+                )
+            if call.expired:
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as err:
+            if isinstance(err, DeadlineExceeded) or (
+                deadline is not None and deadline.expired
+            ):
+                # the budget of this caller is spent, not the one of the others
+                call.expired = True
+            else:
+                call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, call.waiters > 0
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,103 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""JSON codecs of the services
+
+REST services decode their JSON responses, and IPM encodes its request
+bodies, with a :class:`JSONCodec`. :class:`OrjsonCodec` is several times
+faster than the standard library on large documents (e.g. weather data) and
+is used if orjson is installed. Both codecs serialize NumPy arrays and
+scalars.
+
+    >>> codec = get_codec()
+    >>> codec.loads(codec.dumps({"data": [[1, 2.5]]}))
+    {'data': [[1, 2.5]]}
+"""
+
+import json
+
+__all__ = ["JSONCodec", "OrjsonCodec", "get_codec", "set_codec"]
+
+
+def _default(obj):
+    # NumPy arrays and scalars, without importing numpy
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+
+
+class JSONCodec:
+    """JSON codec of the standard library"""
+
+    name = "json"
+
+    def loads(self, data):
+        """Decode a JSON document (str, bytes or memoryview)"""
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+    def dumps(self, obj):
+        """Encode obj as UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, ensure_ascii=False).encode("utf-8")
+
+    def __repr__(self):
+        return "%s()" % type(self).__name__
+
+
+class OrjsonCodec(JSONCodec):
+    """JSON codec using orjson"""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self._options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+    def dumps(self, obj):
+        return self._orjson.dumps(obj, default=_default, option=self._options)
+
+
+_codecs = {"json": JSONCodec, "orjson": OrjsonCodec}
+_instances = {}
+_default_codec = None
+
+
+def get_codec(name="auto"):
+    """Return a codec
+
+    :param str name: 'json', 'orjson' or 'auto' for the default codec of the
+        process (see :func:`set_codec`), orjson if it is installed
+    """
+    global _default_codec
+    if name != "auto":
+        if name not in _instances:
+            _instances[name] = _codecs[name]()
+        return _instances[name]
+    if _default_codec is None:
+        try:
+            _default_codec = get_codec("orjson")
+        except ImportError:
+            _default_codec = get_codec("json")
+    return _default_codec
+
+
+def set_codec(codec):
+    """Set the default codec of the process (a JSONCodec or its name)"""
+    global _default_codec
+    if isinstance(codec, str):
+        codec = get_codec(codec)
+    _default_codec = codec
@@ -0,0 +1,82 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Compression of the HTTP transfers
+
+Responses are decoded by urllib3, which supports gzip and deflate, and brotli
+or zstd if the brotli or zstandard packages are installed:
+:data:`ACCEPT_ENCODING` advertises what is supported. Request bodies can be
+gzipped with :func:`gzip_body`. :class:`TransferStats` counts the bytes
+transferred and before compression, to measure the compression ratios.
+"""
+
+import gzip
+import threading
+
+from urllib3.util import make_headers
+
+__all__ = ["ACCEPT_ENCODING", "TransferStats", "gzip_body"]
+
+#: value of the Accept-Encoding header, with the encodings urllib3 can decode
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+
+def gzip_body(data, compresslevel=6):
+    """Return data (str or bytes) gzipped"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return gzip.compress(data, compresslevel=compresslevel)
+
+
+class TransferStats:
+    """Thread-safe counters of the bytes transferred by a service"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            #: bytes of the request bodies sent
+            self.sent = 0
+            #: bytes of the request bodies before compression
+            self.sent_decoded = 0
+            #: bytes of the response bodies received
+            self.received = 0
+            #: bytes of the response bodies once decoded
+            self.received_decoded = 0
+
+    def record_request(self, wire, decoded):
+        with self._lock:
+            self.sent += wire
+            self.sent_decoded += decoded
+
+    def record_response(self, wire, decoded):
+        with self._lock:
+            self.received += wire
+            self.received_decoded += decoded
+
+    @staticmethod
+    def _ratio(decoded, wire):
+        return decoded / wire if wire else 1.0
+
+    def as_dict(self):
+        """Return the counters and the compression ratios (decoded / sent)"""
+        with self._lock:
+            return dict(
+                sent=self.sent,
+                sent_decoded=self.sent_decoded,
+                received=self.received,
+                received_decoded=self.received_decoded,
+                request_ratio=self._ratio(self.sent_decoded, self.sent),
+                response_ratio=self._ratio(self.received_decoded, self.received),
+            )
+
+    def __repr__(self):
+        return "TransferStats(%s)" % self.as_dict()
@@ -0,0 +1,92 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Time budgets of the calls to the services
+
+A :class:`Deadline` is the time left to a call, whatever the number of
+requests, retries and waits of the rate limiter it needs. Used as a context
+manager, it applies to all the requests sent in the block, including those
+of batch calls run in threads or coroutines::
+
+    with Deadline(60):
+        for model in models:
+            ipm.run_model(model)  # each run gets what is left of the 60 s
+
+The timeouts of the requests are capped by the remaining time, and a
+:class:`DeadlineExceeded` is raised rather than starting a wait (a retry
+backoff, a rate limiter delay) that would end after the deadline. Nested
+deadlines cannot extend the one of an enclosing block.
+"""
+
+import contextvars
+import time
+
+__all__ = ["Deadline", "DeadlineExceeded", "current_deadline"]
+
+_current = contextvars.ContextVar("agroservices_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the time budget of a call is spent"""
+
+
+class Deadline:
+    """Time budget of a call
+
+    :param float seconds: the budget, in seconds
+    """
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self._clock = clock
+        self.expires = clock() + seconds
+        self._tokens = []
+
+    def remaining(self):
+        """Number of seconds left"""
+        return max(0.0, self.expires - self._clock())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, needed=0, what="request"):
+        """Raise :class:`DeadlineExceeded` if the deadline is over, or if
+        less than *needed* seconds are left"""
+        remaining = self.remaining()
+        if remaining <= 0 or remaining < needed:
+            raise DeadlineExceeded(
+                "%.1fs left, not enough for %s (%.1fs)" % (remaining, what, needed)
+            )
+
+    def bound(self, timeout):
+        """Return *timeout* (a number, a (connect, read) tuple or None)
+        capped by the remaining time"""
+        self.check()
+        remaining = self.remaining()
+        if isinstance(timeout, (tuple, list)):
+            return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def __enter__(self):
+        outer = _current.get()
+        if outer is not None and outer.expires < self.expires:
+            self.expires = outer.expires
+        self._tokens.append(_current.set(self))
+        return self
+
+    def __exit__(self, *exc):
+        _current.reset(self._tokens.pop())
+
+    def __repr__(self):
+        return "Deadline(remaining=%.3f)" % self.remaining()
+
+
+def current_deadline():
+    """Return the deadline of the running call, or None"""
+    return _current.get()
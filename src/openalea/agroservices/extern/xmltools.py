@@ -29,6 +29,8 @@ try:
 except:
     from urllib2 import urlopen, HTTPError
 
+from openalea.agroservices.transport import create_session
+
 __all__ = ["easyXML", "readXML"]
 
 
@@ -116,12 +118,21 @@ class readXML(easyXML):
     easyXML accepts as input a string. This class accepts a filename instead
     inherits from easyXML
 
+    HTTP(S) URLs are fetched through a transport, requests by default (see
+    :mod:`openalea.agroservices.transport`).
+
     .. seealso:: :class:`easyXML`
 
     """
 
-    def __init__(self, url, encoding="utf-8"):
-        self.data = urlopen(url).read()
+    def __init__(self, url, encoding="utf-8", transport="requests"):
+        if url.startswith(("http://", "https://")):
+            with create_session(transport) as session:
+                response = session.get(url)
+                response.raise_for_status()
+                self.data = response.content
+        else:
+            self.data = urlopen(url).read()
         super(readXML, self).__init__(self.data, encoding)
 
 
@@ -0,0 +1,63 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Command line tools of the IPM Decisions service
+
+``ipm-warm-cache`` fills the cache with the catalogs and schemas of the
+platform, e.g. while building a container image::
+
+    ipm-warm-cache --cache-dir /opt/agroservices/cache --models
+"""
+
+import argparse
+import sys
+import time
+
+from openalea.agroservices.cachebackends import BACKENDS
+from openalea.agroservices.ipm.ipm import IPM
+
+
+def warm_cache(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="ipm-warm-cache",
+        description="Fetch the catalogs and schemas of the IPM Decisions "
+        "platform into the agroservices cache",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="directory of the cache (default: cache.dir setting)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        help="storage of the cache (default: cache.backend setting)",
+    )
+    parser.add_argument("--url", help="URL of the platform")
+    parser.add_argument(
+        "--models",
+        action="store_true",
+        help="also fetch the metadata and input schema of every DSS model",
+    )
+    args = parser.parse_args(argv)
+
+    kwargs = dict(cache=True, cache_dir=args.cache_dir, cache_backend=args.backend)
+    if args.url is not None:
+        kwargs["url"] = args.url
+    ipm = IPM(verbose=False, **kwargs)
+
+    start = time.monotonic()
+    errors = ipm.warm_cache(models=args.models)
+    print("Cache %s warmed in %.1fs" % (ipm.CACHE_NAME, time.monotonic() - start))
+    for name, error in errors.items():
+        print("  failed: %s (%s)" % (name, error), file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(warm_cache())
@@ -11,6 +11,8 @@
 ################## Interface Python IPM using Bioservice ########################################################
 
 import json
+from datetime import timedelta
+from functools import partial
 from pathlib import Path
 from typing import Union
 
@@ -18,7 +20,9 @@ import yaml
 
 import openalea.agroservices.ipm.fakers as fakers
 import openalea.agroservices.ipm.fixes as fixes
+from openalea.agroservices.codec import get_codec
 from openalea.agroservices.ipm.datadir import datadir
+from openalea.agroservices.retry import RetryPolicy
 from openalea.agroservices.services import REST
 
 __all__ = ["IPM"]
@@ -27,10 +31,12 @@ __all__ = ["IPM"]
 def load_model(dssid, model):
     model = fixes.fix_prior_load_model(dssid, model)
     if "input_schema" in model["execution"]:
-        model["execution"]["input_schema"] = json.loads(
+        model["execution"]["input_schema"] = get_codec().loads(
             model["execution"]["input_schema"]
         )
     model = fixes.fix_load_model(dssid, model)
+    # the model metadata do not tell which DSS they belong to
+    model.setdefault("dss_id", dssid)
     return model
 
 
@@ -41,6 +47,20 @@ def read_dss(dss):
     return dss
 
 
+def read_dss_catalog(res):
+    return {dss["id"]: read_dss(dss) for dss in res}
+
+
+def read_weatherdatasources(res):
+    for r in res:
+        if "geoJSON" in r["spatial"]:
+            if r["spatial"]["geoJSON"] is not None:
+                r["spatial"]["geoJSON"] = get_codec().loads(r["spatial"]["geoJSON"])
+
+    sources = {item["id"]: item for item in res}
+    return fixes.fix_get_weatherdatasource(sources)
+
+
 class IPM(REST):
     """
     Interface to the IPM  https://ipmdecisions.nibio.no/
@@ -88,6 +108,41 @@ class IPM(REST):
         >>> ipm.post_schema_dss_yaml_validate()
     """
 
+    # weather adapters forward requests to third party services, that may need
+    # longer to recover
+    retry_policies = {
+        "api/wx/rest/weatheradapter": RetryPolicy(total=5, backoff_factor=1)
+    }
+
+    # with cache, forecasts and observations are soon outdated while catalogs
+    # and schemas rarely change (first matching pattern applies)
+    cache_expiration = {
+        "api/wx/rest/weatheradapter": timedelta(minutes=15),
+        "api/wx/rest/schema": timedelta(weeks=1),
+        "api/dss/rest/schema": timedelta(weeks=1),
+        "api/wx/rest": timedelta(days=1),
+        "api/dss/rest": timedelta(days=1),
+    }
+
+    # the catalogs are large and rarely change: their parsed results are kept
+    # and revalidated (see the revalidate argument of REST)
+    revalidate_urls = (
+        "api/dss/rest/dss",
+        "api/dss/rest/model",
+        "api/wx/rest/weatherdatasource",
+    )
+
+    # endpoints with parameters in their path, labelling the metrics of the
+    # requests (first matching template applies)
+    endpoint_templates = (
+        "api/dss/rest/dss/location",
+        "api/dss/rest/dss/crop/{cropCode}",
+        "api/dss/rest/dss/pest/{pestCode}",
+        "api/dss/rest/dss/{DSSId}",
+        "api/dss/rest/model/{DSSId}/{ModelId}",
+        "api/dss/rest/model/{DSSId}/{ModelId}/input_schema",
+    )
+
     def __init__(
         self,
         name="IPM",
@@ -182,13 +237,13 @@ class IPM(REST):
         dict
             if the data is valid or not
         """
-        with open(jsonfile) as json_file:
-            data = json.load(json_file)
+        with open(jsonfile, "rb") as json_file:
+            data = self.codec.loads(json_file.read())
 
         res = self.http_post(
             "api/wx/rest/schema/weatherdata/validate",
             frmt="json",
-            data=json.dumps(data),
+            data=self.codec.dumps(data),
             headers={"Content-Type": "application/json"},
         )
         return res
@@ -196,7 +251,11 @@ class IPM(REST):
         ###################### WeatherAdaptaterService #############################
 
     def get_weatheradapter(
-        self, source: dict, params: dict = None, credentials: dict = None
+        self,
+        source: dict,
+        params: dict = None,
+        credentials: dict = None,
+        stream: bool = False,
     ) -> dict:
         """Call weatheradapter service for a given weatherdata source
 
@@ -209,6 +268,12 @@ class IPM(REST):
             If None (default), use fakers.weather_adapter_params(source) to set some valid parameters
         credentials : dict, optional
             a dict of formated credential parameters
+        stream : bool, optional
+            If True, the response is parsed while it is downloaded, and an
+            iterator over the rows of locationWeatherData[*].data is returned
+            instead of a dict. The other fields (timeStart, interval,
+            weatherParameters...) are available in its extras attribute.
+            By default False
 
 
         Returns
@@ -227,11 +292,20 @@ class IPM(REST):
 
         endpoint = source["endpoint"].format(WEATHER_API_URL=self._url + "/api/wx")
 
-        if not source["authentication_type"] == "CREDENTIALS":
-            res = self.http_get(endpoint, params=params, frmt="json")
-        else:
-            params["credentials"] = json.dumps(credentials)
-            res = self.http_post(endpoint, data=params, frmt="json")
+        kwargs = {}
+        if stream:
+            kwargs = dict(stream=True, item_path="locationWeatherData.*.data")
+
+        with self.tracer.span(
+            "IPM.get_weatheradapter",
+            source_id=source.get("id"),
+            endpoint=self._endpoint(endpoint),
+        ):
+            if not source["authentication_type"] == "CREDENTIALS":
+                res = self.http_get(endpoint, params=params, frmt="json", **kwargs)
+            else:
+                params["credentials"] = json.dumps(credentials)
+                res = self.http_post(endpoint, data=params, frmt="json", **kwargs)
 
         return res
 
@@ -259,21 +333,14 @@ class IPM(REST):
            wetherdata sources available on the platform if source_id is None
            The weatherdatatsource metadata referenced by source_id otherwise
         """
-        res = self.http_get(
+        sources = self.http_get(
             "api/wx/rest/weatherdatasource",
             frmt="json",
             headers=self.get_headers(content="json"),
             params={"callback": self.callback},
+            postprocess=read_weatherdatasources,
         )
 
-        for r in res:
-            if "geoJSON" in r["spatial"]:
-                if r["spatial"]["geoJSON"] is not None:
-                    r["spatial"]["geoJSON"] = json.loads(r["spatial"]["geoJSON"])
-
-        sources = {item["id"]: item for item in res}
-        sources = fixes.fix_get_weatherdatasource(sources)
-
         if source_id is None:
             res = sources
             if access_type is not None:
@@ -314,13 +381,13 @@ class IPM(REST):
         """
         params = dict(callback=self.callback, tolerance=tolerance)
 
-        with open(geoJsonfile) as json_file:
-            data = json.load(json_file)
+        with open(geoJsonfile, "rb") as json_file:
+            data = self.codec.loads(json_file.read())
 
         res = self.http_post(
             "api/wx/rest/weatherdatasource/location",
             frmt="json",
-            data=json.dumps(data),
+            data=self.codec.dumps(data),
             params=params,
             headers={"Content-Type": "application/json"},
         )
@@ -411,15 +478,14 @@ class IPM(REST):
         dict
             dict all DSSs and models available in the platform
         """
-        res = self.http_get(
+        all_dss = self.http_get(
             "api/dss/rest/dss",
             frmt="json",
             headers=self.get_headers(content="json"),
             params={"callback": self.callback},
+            postprocess=read_dss_catalog,
         )
 
-        all_dss = {dss["id"]: read_dss(dss) for dss in res}
-
         if execution_type is not None:
             filtered = {}
             for id, dss in all_dss.items():
@@ -448,13 +514,13 @@ class IPM(REST):
         list
             A list of all the matching DSS models
         """
-        with open(geoJsonfile) as json_file:
-            data = json.load(json_file)
+        with open(geoJsonfile, "rb") as json_file:
+            data = self.codec.loads(json_file.read())
 
         res = self.http_post(
             "api/dss/rest/dss/location",
             frmt="json",
-            data=json.dumps(data),
+            data=self.codec.dumps(data),
             headers={"Content-Type": "application/json"},
         )
         return res
@@ -557,10 +623,12 @@ class IPM(REST):
         dict
             All information of DSS model
         """
-        res = self.http_get(
-            "api/dss/rest/model/{}/{}".format(DSSId, ModelId), frmt="json"
-        )
-        res = load_model(DSSId, res)
+        with self.tracer.span("IPM.get_model", dss_id=DSSId, model_id=ModelId):
+            res = self.http_get(
+                "api/dss/rest/model/{}/{}".format(DSSId, ModelId),
+                frmt="json",
+                postprocess=partial(load_model, DSSId),
+            )
 
         return res
 
@@ -658,13 +726,13 @@ class IPM(REST):
         dict
             if the data is valid or not
         """
-        with open(jsonfile) as json_file:
-            data = json.load(json_file)
+        with open(jsonfile, "rb") as json_file:
+            data = self.codec.loads(json_file.read())
 
         res = self.http_post(
             "api/dss/rest/schema/modeloutput/validate",
             frmt="json",
-            data=json.dumps(data),
+            data=self.codec.dumps(data),
             headers={"Content-Type": "application/json"},
         )
 
@@ -721,6 +789,10 @@ class IPM(REST):
             The model meta_data dict (see self.get_model)
         input_data : dict, optional
             A dict with all inputs as defined in model input schema (see agroservices.ipm.fakers.input_data for generation)
+        timeout : float or tuple, optional
+            Seconds to wait for the server, or a (connect, read) tuple (see
+            REST.get_one). Within a Deadline block, the run gets at most the
+            time left to the deadline.
 
         Returns
         -------
@@ -738,21 +810,147 @@ class IPM(REST):
                 return res + model["execution"]["endpoint"]
 
         endpoint = model["execution"]["endpoint"]
-
-        if timeout is not None:
-            res = self.http_post(
+        data = self.codec.dumps(input_data)
+
+        with self.tracer.span(
+            "IPM.run_model",
+            dss_id=model.get("dss_id"),
+            model_id=model.get("id"),
+            endpoint=self._endpoint(endpoint),
+            payload_size=len(data),
+        ):
+            return self.http_post(
                 endpoint,
                 frmt="json",
-                data=json.dumps(input_data),
+                data=data,
                 headers={"Content-Type": "application/json"},
                 timeout=timeout,
             )
-        else:
-            res = self.http_post(
-                endpoint,
+
+    def run_models(self, models: list, input_data: list = None, timeout=None):
+        """Run several Dss Models concurrently and get their outputs
+
+        The runs are posted at once (see REST.post_one), at most
+        ``settings.CONCURRENT`` at a time and within the rate limits of the
+        platform.
+
+        Parameters
+        ----------
+        models : list of dict
+            The model meta_data dicts (see self.get_model)
+        input_data : list of dict, optional
+            The inputs of each model, in the order of models (None items are
+            generated with agroservices.ipm.fakers.input_data)
+        timeout : float or tuple, optional
+            Seconds to wait for the server for each run (see run_model)
+
+        Returns
+        -------
+        list
+            outputs of the models, in the order of models (an
+            AgroServicesError for a run that failed)
+        """
+        if input_data is None:
+            input_data = [None] * len(models)
+        if len(input_data) != len(models):
+            raise ValueError(
+                "%d models but %d input data" % (len(models), len(input_data))
+            )
+
+        results = [None] * len(models)
+        runs = []
+        for i, (model, inputs) in enumerate(zip(models, input_data)):
+            if model["execution"]["type"] == "LINK":
+                results[i] = self.run_model(model, inputs)
+            else:
+                runs.append(i)
+        if not runs:
+            return results
+
+        endpoints = [models[i]["execution"]["endpoint"] for i in runs]
+        data = [
+            self.codec.dumps(
+                fakers.input_data(models[i])
+                if input_data[i] is None
+                else input_data[i]
+            )
+            for i in runs
+        ]
+        with self.tracer.span(
+            "IPM.run_models",
+            models=len(runs),
+            payload_size=sum(len(d) for d in data),
+        ):
+            outputs = self.http_post(
+                endpoints,
                 frmt="json",
-                data=json.dumps(input_data),
+                data=data,
                 headers={"Content-Type": "application/json"},
+                timeout=timeout,
             )
+        for i, output in zip(runs, outputs):
+            results[i] = output
+        return results
+
+    ###############################  Cache ##############################################
+
+    #: methods fetching the catalogs and schemas of the platform
+    catalog_methods = (
+        "get_parameter",
+        "get_qc",
+        "get_schema_weatherdata",
+        "get_weatherdatasource",
+        "get_crop",
+        "get_pest",
+        "get_dss",
+        "get_schema_dss",
+        "get_schema_fieldobservation",
+        "get_schema_modeloutput",
+    )
+
+    def warm_cache(self, models=False) -> dict:
+        """Fetch the catalogs and schemas of the platform concurrently, so that
+        the next calls are answered by the cache
+
+        The cache directory (``cache_dir`` argument or ``cache.dir`` setting)
+        may then be shipped with workers so that they start with a hot cache.
 
-        return res
+        Parameters
+        ----------
+        models : bool, optional
+            also fetch the metadata and input schema of every DSS model, by
+            default False
+
+        Returns
+        -------
+        dict
+            {resource: error} of the resources that could not be fetched
+        """
+        if not self.CACHING:
+            self.logging.warning("warm_cache has no effect without cache")
+
+        calls = {name: getattr(self, name) for name in self.catalog_methods}
+        errors = self._warm(calls)
+
+        if models and "get_dss" not in errors:
+            calls = {}
+            for dss_id, dss in self.get_dss().items():
+                for model_id in dss["models"]:
+                    for name in ("get_model", "get_input_schema"):
+                        key = "%s/%s/%s" % (name, dss_id, model_id)
+                        calls[key] = partial(getattr(self, name), dss_id, model_id)
+            errors.update(self._warm(calls))
+
+        return errors
+
+    def _warm(self, calls):
+        results = self._map_threads(lambda name: calls[name](), list(calls))
+        errors = {}
+        for name, res in zip(calls, results):
+            if res is None:
+                errors[name] = "no response"
+            elif isinstance(res, int) and not isinstance(res, bool):
+                errors[name] = "HTTP status %d" % res
+            elif isinstance(res, Exception):
+                errors[name] = str(res)
+        return errors
@@ -0,0 +1,163 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Incremental parsing of large JSON documents
+
+:class:`JSONItemStream` reads a JSON document chunk by chunk and yields the
+items of the array found at a given path, one at a time. Only the item being
+parsed is kept in memory, whatever the size of the document.
+
+    >>> chunks = [b'{"locationWeatherData": [{"data": [[1, 2], ', b'[3, 4]]}]}']
+    >>> list(JSONItemStream(chunks, "locationWeatherData.*.data"))
+    [[1, 2], [3, 4]]
+"""
+
+import codecs
+import json
+
+__all__ = ["JSONItemStream"]
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]}"
+
+
+class JSONItemStream:
+    """Iterate over the items of a JSON array while the document is read
+
+    :param chunks: an iterable of bytes (or str), such as
+        ``response.iter_content(chunk_size)``
+    :param str path: dot-separated keys leading to the array whose items are
+        yielded, ``*`` standing for every item of an array (or every value of
+        an object). If None, the document itself must be an array. If the
+        value found at path is not an array, it is yielded as a single item.
+    :param keep: top-level keys whose values are stored in :attr:`extras`
+        while the document is read (e.g. pagination metadata). If None
+        (default), all the top-level values outside of path are stored.
+    :param str encoding: encoding of the chunks if they are bytes
+    """
+
+    def __init__(self, chunks, path=None, keep=None, encoding="utf-8"):
+        self.path = [] if not path else path.split(".")
+        self.keep = None if keep is None else set(keep)
+        #: values of the top-level keys outside of path, filled while reading
+        self.extras = {}
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._iterator = None
+
+    def __iter__(self):
+        if self._iterator is None:
+            self._iterator = self._walk(self.path, top=True)
+        return self._iterator
+
+    def _more(self):
+        """Append the next chunk to the buffer, return False at the end"""
+        if self._eof:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            if isinstance(chunk, bytes):
+                text = self._decoder.decode(chunk)
+            else:
+                text = chunk
+        # drop what was already parsed
+        self._buf = self._buf[self._pos :] + text
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespaces and return the next character ('' at the end)"""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._more():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars or char == "":
+            raise ValueError(
+                "Invalid JSON: expected one of %r, got %r" % (tuple(chars), char)
+            )
+        self._pos += 1
+        return char
+
+    def _value(self):
+        """Parse the next complete JSON value"""
+        # numbers and literals are not delimited: they are complete only once
+        # followed by a delimiter
+        scalar = self._peek() not in '{["'
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+                continue
+            if scalar and not self._eof:
+                if end == len(self._buf) or self._buf[end] not in _DELIMITERS:
+                    self._more()
+                    continue
+            self._pos = end
+            return value
+
+    def _walk(self, path, top=False):
+        char = self._peek()
+        if not path:
+            if char != "[":
+                yield self._value()
+                return
+            self._pos += 1
+            if self._peek() == "]":
+                self._pos += 1
+                return
+            while True:
+                yield self._value()
+                if self._expect(",]") == "]":
+                    return
+
+        key, rest = path[0], path[1:]
+        if char == "[" and key == "*":
+            self._pos += 1
+            if self._peek() == "]":
+                self._pos += 1
+                return
+            while True:
+                yield from self._walk(rest)
+                if self._expect(",]") == "]":
+                    return
+        elif char == "{":
+            self._pos += 1
+            if self._peek() == "}":
+                self._pos += 1
+                return
+            while True:
+                name = self._value()
+                self._expect(":")
+                if key == "*" or name == key:
+                    yield from self._walk(rest)
+                else:
+                    value = self._value()
+                    if top and (self.keep is None or name in self.keep):
+                        self.extras[name] = value
+                if self._expect(",}") == "}":
+                    return
+        else:
+            # nothing to iterate over at this path
+            self._value()
@@ -0,0 +1,130 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""In-memory cache of parsed results
+
+:class:`MemoryCache` is a bounded, thread-safe LRU mapping with a time to
+live per entry. REST services use it in front of the requests_cache backend
+to return the parsed result of hot requests (catalogs, schemas...) without
+reading, unpickling and parsing the cached response again.
+
+Values are copied with :func:`copy_value`, which copies the dicts and lists
+of decoded JSON documents much faster than :func:`copy.deepcopy`.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+__all__ = ["MemoryCache", "copy_value"]
+
+_MISSING = object()
+
+_IMMUTABLE = frozenset((str, int, float, bool, type(None), bytes))
+
+
+def copy_value(value):
+    """Return a deep copy of value
+
+    Dicts, lists and immutable scalars (the output of JSON decoders) are
+    copied directly, anything else with :func:`copy.deepcopy`.
+    """
+    cls = type(value)
+    if cls in _IMMUTABLE:
+        return value
+    if cls is dict:
+        return {k: copy_value(v) for k, v in value.items()}
+    if cls is list:
+        return [copy_value(v) for v in value]
+    return copy.deepcopy(value)
+
+
+class MemoryCache:
+    """A least recently used cache with a time to live
+
+    :param int maxsize: maximum number of entries. Once reached, the least
+        recently used entries are evicted.
+    :param float ttl: number of seconds an entry is valid (None for ever)
+    :param bool copy: copy values when stored and when returned, so that
+        callers may modify what they get without altering the cache.
+        Otherwise, values are kept and returned as is and must not be
+        modified.
+    """
+
+    def __init__(self, maxsize=256, ttl=300, clock=time.monotonic, copy=True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.copy = copy
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        #: number of lookups answered by the cache
+        self.hits = 0
+        #: number of lookups not answered by the cache
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] is not None:
+                if item[0] <= self._clock():
+                    del self._data[key]
+                    item = _MISSING
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            value = item[1]
+        return copy_value(value) if self.copy else value
+
+    def set(self, key, value, ttl=_MISSING):
+        """Store value, for *ttl* seconds if given (default :attr:`ttl`)"""
+        if self.maxsize <= 0:
+            return
+        if ttl is _MISSING:
+            ttl = self.ttl
+        expires = None if ttl is None else self._clock() + ttl
+        if self.copy:
+            value = copy_value(value)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return False
+        return item[0] is None or item[0] > self._clock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "MemoryCache(%d/%d entries, ttl=%s, hits=%d, misses=%d)" % (
+            len(self._data),
+            self.maxsize,
+            self.ttl,
+            self.hits,
+            self.misses,
+        )
@@ -0,0 +1,302 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Metrics of the requests sent by the services
+
+A :class:`MetricsRegistry` keeps counters and histograms in the process, by
+label values, and exports them in the Prometheus text format, e.g. from an
+endpoint of a web application scraped by Prometheus::
+
+    from openalea.agroservices.metrics import CONTENT_TYPE, get_registry
+
+    body = get_registry().export()
+
+The REST services record, by service and endpoint template (see
+:attr:`~services.REST.endpoint_templates`), in the registry of the process
+unless they are given another one:
+
+- ``agroservices_requests_total``: requests, by method and status
+- ``agroservices_request_duration_seconds``: histogram of their duration
+- ``agroservices_request_bytes_total``: bytes of the request bodies
+- ``agroservices_response_bytes_total``: bytes of the response bodies received
+- ``agroservices_cache_requests_total``: GET requests by cache result (hit,
+  miss or revalidated)
+- ``agroservices_retries_total``: retries
+- ``agroservices_rate_limit_wait_seconds``: histogram of the waits for the
+  rate limiter
+"""
+
+import math
+import threading
+
+__all__ = [
+    "CONTENT_TYPE",
+    "Counter",
+    "Histogram",
+    "MetricsRegistry",
+    "RequestMetrics",
+    "get_registry",
+]
+
+#: Content-Type of the Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+#: upper bounds of the buckets of duration histograms, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, _escape(v)) for k, v in labels)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                "%s expects the labels %s, got %s"
+                % (self.name, self.labelnames, tuple(labels))
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """Yield (name, labels, value) tuples, labels being (name, value)
+        pairs"""
+        raise NotImplementedError
+
+    def export(self):
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation),
+            "# TYPE %s %s" % (self.name, self.type),
+        ]
+        for name, labels, value in self.samples():
+            lines.append(
+                "%s%s %s" % (name, _format_labels(labels), _format_value(value))
+            )
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A value that only increases, by label values"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in buckets, by label values
+
+    :param buckets: upper bounds of the buckets (+Inf is added)
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [counts by bucket, sum]
+                state = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return 0 if state is None else sum(state[0])
+
+    def sum(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return 0.0 if state is None else state[1]
+
+    def samples(self):
+        with self._lock:
+            values = sorted(
+                (key, (list(counts), total))
+                for key, (counts, total) in self._values.items()
+            )
+        for key, (counts, total) in values:
+            labels = tuple(zip(self.labelnames, key))
+            cumulated = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulated += count
+                le = (("le", _format_value(float(bound))),)
+                yield self.name + "_bucket", labels + le, cumulated
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulated
+
+
+class MetricsRegistry:
+    """Metrics of a process, by name"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(
+                    name, documentation, labelnames, **kwargs
+                )
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError("%s is already registered as %r" % (name, metric))
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Return the counter *name*, registering it if needed"""
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Return the histogram *name*, registering it if needed"""
+        return self._register(
+            Histogram, name, documentation, labelnames, buckets=buckets
+        )
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def __iter__(self):
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        return iter([metric for _, metric in metrics])
+
+    def clear(self):
+        """Forget the values of all the metrics"""
+        for metric in self:
+            metric.clear()
+
+    def export(self):
+        """Return the metrics in the Prometheus text format"""
+        return "".join(metric.export() + "\n" for metric in self)
+
+
+class RequestMetrics:
+    """The metrics recorded by the REST services in a registry"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        labels = ("service", "endpoint")
+        self.requests = registry.counter(
+            "agroservices_requests_total",
+            "Requests by method and status",
+            labels + ("method", "status"),
+        )
+        self.duration = registry.histogram(
+            "agroservices_request_duration_seconds",
+            "Duration of the requests",
+            labels + ("method",),
+        )
+        self.sent = registry.counter(
+            "agroservices_request_bytes_total", "Bytes of the request bodies", labels
+        )
+        self.received = registry.counter(
+            "agroservices_response_bytes_total",
+            "Bytes of the response bodies received",
+            labels,
+        )
+        self.cache = registry.counter(
+            "agroservices_cache_requests_total",
+            "GET requests by cache result (hit, miss or revalidated)",
+            labels + ("result",),
+        )
+        self.retries = registry.counter(
+            "agroservices_retries_total", "Retries of the requests", labels
+        )
+        self.rate_limit_wait = registry.histogram(
+            "agroservices_rate_limit_wait_seconds",
+            "Time spent waiting for the rate limiter",
+            labels,
+        )
+
+    def record_request(
+        self,
+        service,
+        endpoint,
+        method,
+        status,
+        duration,
+        sent=0,
+        received=0,
+        retries=0,
+    ):
+        labels = dict(service=service, endpoint=endpoint)
+        self.requests.inc(method=method, status=status, **labels)
+        self.duration.observe(duration, method=method, **labels)
+        if sent:
+            self.sent.inc(sent, **labels)
+        if received:
+            self.received.inc(received, **labels)
+        if retries:
+            self.retries.inc(retries, **labels)
+
+    def record_cache(self, service, endpoint, result):
+        self.cache.inc(service=service, endpoint=endpoint, result=result)
+
+    def record_wait(self, service, endpoint, seconds):
+        self.rate_limit_wait.observe(seconds, service=service, endpoint=endpoint)
+
+
+# shared by all the services of the process
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    """Return the metrics registry of the process"""
+    return _registry
@@ -9,9 +9,10 @@
 
 # ==============================================================================
 from urllib.parse import quote
-import requests
 import six
+from requests_cache import DO_NOT_CACHE
 
+from openalea.agroservices.jsonstream import JSONItemStream
 from openalea.agroservices.services import REST
 
 # ==============================================================================
@@ -29,10 +30,40 @@ class Phis(REST):
         *args,
         **kwargs,
     ):
-        super().__init__(name=name, url=url, *args, **kwargs)
+        # authentication tokens expire and security/authenticate has the
+        # credentials in its query string: never cache them, nor by default
+        # the data of the other endpoints
+        cache_expiration = {url + "security": DO_NOT_CACHE}
+        cache_expiration.update(kwargs.pop("cache_expiration", None) or {})
+        cache_expiration.setdefault(url, DO_NOT_CACHE)
+        super().__init__(
+            name=name, url=url, cache_expiration=cache_expiration, *args, **kwargs
+        )
 
         self.callback = callback  # use in all methods)
 
+    def _request(self, method, url, **kwargs):
+        """Send a request through the rate limiter and circuit breaker, with
+        a timeout capped by the current deadline"""
+        kwargs["timeout"] = self._request_timeout(kwargs.get("timeout"))
+        return self._send(method, url, **kwargs)
+
+    @staticmethod
+    def _page_size(web_service):
+        """Number of items per page requested by get_all_data and iter_all_data"""
+        # TODO remove 'plants' specificity as soon as web service delay fixed
+        if web_service == "plants":
+            return 10
+        return 50000
+
+    @staticmethod
+    def _check_page(response):
+        """Raise an exception if response is not a page of data"""
+        if response.status_code == 500:
+            raise Exception("Server error")
+        elif response.status_code != 200:
+            raise Exception(response.json()["result"]["message"])
+
     def post_json(
         self, web_service, json_txt, timeout=10.0, overwriting=False, **kwargs
     ):
@@ -49,18 +80,18 @@ class Phis(REST):
         """
         overwrote = False
         headers = {"Content-type": "application/json"}
-        response = requests.request(
-            method="POST",
-            url=self.url + web_service,
+        response = self._request(
+            "POST",
+            self.url + web_service,
             headers=headers,
             data=json_txt,
             params=kwargs,
             timeout=timeout,
         )
         if response.status_code == 200 and overwriting:
-            response = requests.request(
-                method="PUT",
-                url=self.url + "/" + web_service,
+            response = self._request(
+                "PUT",
+                self.url + "/" + web_service,
                 headers=headers,
                 data=json_txt,
                 params=kwargs,
@@ -78,8 +109,8 @@ class Phis(REST):
         :return:
             (dict) response of the server (standard http)
         """
-        response = requests.request(
-            method="GET", url=self.url + web_service, params=kwargs, timeout=timeout
+        response = self._request(
+            "GET", self.url + web_service, params=kwargs, timeout=timeout
         )
 
         return response
@@ -96,24 +127,24 @@ class Phis(REST):
         current_page = 0
         total_pages = 1
         values = list()
-
-        # TODO remove 'plants' specificity as soon as web service delay fixed
-        if not web_service == "plants":
-            kwargs["pageSize"] = 50000
-        else:
-            kwargs["pageSize"] = 10
+        kwargs["pageSize"] = self._page_size(web_service)
 
         while total_pages > current_page:
             kwargs["page"] = current_page
-            response = requests.request(
-                method="GET", url=self.url + web_service, params=kwargs, timeout=timeout
-            )
-            if response.status_code == 200:
-                values.extend(response.json())
-            elif response.status_code == 500:
-                raise Exception("Server error")
-            else:
-                raise Exception(response.json()["result"]["message"])
+            with self.tracer.span(
+                "Phis.get_all_data", web_service=web_service, page=current_page
+            ) as span:
+                response = self._request(
+                    "GET",
+                    self.url + web_service,
+                    params=kwargs,
+                    timeout=timeout,
+                )
+                span.set_attributes(
+                    status=response.status_code, payload_size=len(response.content)
+                )
+            self._check_page(response)
+            values.extend(response.json())
 
             if response.json()["metadata"]["pagination"] is None:
                 total_pages = 0
@@ -123,6 +154,48 @@ class Phis(REST):
 
         return values
 
+    def iter_all_data(self, web_service, timeout=10.0, **kwargs):
+        """Iterate over the data of all pages, parsing each page while it is
+        downloaded (see get_all_data)
+
+        Only one item is kept in memory at a time, whatever the page size.
+
+        :param web_service:  (str) name of web service requested
+        :param timeout:  (float) timeout for connexion in seconds
+        :param kwargs: (str) arguments relative to web service (see https://phenome.inrae.fr/m3p/api-docs/)
+        :return:
+            (iterator of dict) data relative to web service and parameters
+        """
+        current_page = 0
+        total_pages = 1
+        kwargs["pageSize"] = self._page_size(web_service)
+
+        while total_pages > current_page:
+            kwargs["page"] = current_page
+            response = self._request(
+                "GET",
+                self.url + web_service,
+                params=kwargs,
+                timeout=timeout,
+                stream=True,
+            )
+            # closed on errors and when the caller stops iterating as well
+            with response:
+                self._check_page(response)
+                items = JSONItemStream(
+                    response.iter_content(self.STREAM_CHUNK_SIZE),
+                    "result.data",
+                    keep=("metadata",),
+                )
+                yield from items
+
+            metadata = items.extras.get("metadata") or {}
+            if metadata.get("pagination") is None:
+                total_pages = 0
+            else:
+                total_pages = metadata["pagination"]["totalPages"]
+            current_page += 1
+
     def ws_token(self, username="pheonoarch@lepse.inra.fr", password="phenoarch"):
         """Get token for PHIS web service
             See https://phenome.inrae.fr/m3p/api-docs/ for exact documentation
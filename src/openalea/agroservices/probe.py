@@ -0,0 +1,159 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Cached reachability probe of service URLs"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.request import urlopen
+
+__all__ = ["URLProbe"]
+
+
+class URLProbe:
+    """Reachability status of URLs, cached with a time-to-live
+
+    Probe results are kept in memory and in a small JSON file, so that every
+    service instance (and every process) sharing the same file reuses a recent
+    result instead of opening a new connection. Probes can run in a background
+    thread so that constructing a service never waits for the network.
+
+    A status is a dict with keys ``url``, ``reachable`` (bool), ``checked``
+    (epoch of the probe) and ``error`` (str or None).
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=None, ttl=300, timeout=5):
+        """
+        :param str path: JSON file used to share results between processes. If
+            None, results are only shared within the process.
+        :param ttl: number of seconds a probe result remains valid
+        :param timeout: timeout of the probe request in seconds
+        """
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self._status = {}
+        self._pending = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path=None, ttl=300, timeout=5):
+        """Return the process-wide probe attached to *path*"""
+        probe = cls._shared.get(path)
+        if probe is None:
+            with cls._shared_lock:
+                probe = cls._shared.setdefault(path, cls(path, ttl, timeout))
+        probe.ttl = ttl
+        return probe
+
+    def _is_fresh(self, status):
+        return status is not None and time.time() - status["checked"] < self.ttl
+
+    def _load(self):
+        """Update in-memory results with the file content, if it changed"""
+        if self.path is None:
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._mtime = mtime
+        for url, status in stored.items():
+            current = self._status.get(url)
+            if current is None or current["checked"] < status["checked"]:
+                self._status[url] = status
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or None)
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._status, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def status(self, url):
+        """Return the cached status of *url* if still valid, None otherwise"""
+        status = self._status.get(url)
+        if not self._is_fresh(status):
+            with self._lock:
+                self._load()
+                status = self._status.get(url)
+        return status if self._is_fresh(status) else None
+
+    def _probe(self, url):
+        status = {"url": url, "reachable": True, "checked": time.time(), "error": None}
+        try:
+            urlopen(url, timeout=self.timeout)
+        except Exception as err:
+            status["reachable"] = False
+            status["error"] = repr(err)
+        with self._lock:
+            self._load()
+            self._status[url] = status
+            self._save()
+            self._pending.pop(url, None)
+        return status
+
+    def check(self, url, wait=True, callback=None):
+        """Return the status of *url*, probing it if no valid result is cached
+
+        :param str url: the URL to probe
+        :param bool wait: if False, the probe runs in a background thread and
+            None is returned until a result is available.
+        :param callback: optional function called with the status once known
+            (immediately if a valid result is cached)
+        """
+        status = self.status(url)
+        if status is not None:
+            if callback is not None:
+                callback(status)
+            return status
+
+        def run():
+            status = self._probe(url)
+            if callback is not None:
+                callback(status)
+            return status
+
+        if wait:
+            return run()
+
+        with self._lock:
+            if url in self._pending:
+                return None
+            thread = threading.Thread(
+                target=run, name="agroservices-probe", daemon=True
+            )
+            self._pending[url] = thread
+        thread.start()
+        return None
+
+    def wait(self, url, timeout=None):
+        """Wait for a background probe of *url* and return its status"""
+        thread = self._pending.get(url)
+        if thread is not None:
+            thread.join(timeout)
+        return self.status(url)
@@ -0,0 +1,304 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Rate limiters shared by the REST services
+
+Requests are paced with a token bucket per key (usually the host of the
+service): all the callers of a key share its bucket, which applies the
+strictest rate and burst asked by any of them, so that a host is never sent
+more than the most conservative client allows. A bucket holds at most
+*burst* tokens and is refilled at *rate* tokens per second. Each request takes a token; when none is left, the caller
+reserves the next one and sleeps until it is available. The sleep happens
+outside of any lock, so that waiting threads do not block each other, and
+does not start if it would end after the :class:`~deadline.Deadline` of the
+call: the token is then given back.
+
+Buckets live in the process (:class:`LocalRateLimiter`), or in a SQLite
+database shared by all the processes of a machine (:class:`SharedRateLimiter`)
+so that a pool of workers stays within a single budget.
+"""
+
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+from .deadline import DeadlineExceeded, current_deadline
+
+__all__ = [
+    "TokenBucket",
+    "RateLimiter",
+    "LocalRateLimiter",
+    "SharedRateLimiter",
+    "get_rate_limiter",
+    "set_rate_limiter",
+]
+
+
+class TokenBucket:
+    """A thread-safe token bucket
+
+    Tokens are numbered tickets: the ticket *n* of a schedule starting at
+    *start* with ticket *first* is due ``(n - first) / rate`` seconds after
+    *start*, and may be used up to ``burst - 1`` tickets early. Taking a
+    ticket from :func:`itertools.count` is atomic, so a reservation on a
+    busy bucket does not lock; the lock is only taken to start a new schedule
+    when the bucket has been idle, and to change or give back tokens.
+
+    :param rate: number of tokens added per second
+    :param burst: maximum number of tokens in the bucket
+    """
+
+    def __init__(self, rate, burst=1):
+        self._tickets = itertools.count()
+        # (rate, burst, start, first), replaced as a whole
+        self._schedule = (rate, burst, time.monotonic(), 0)
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._schedule[0]
+
+    @property
+    def burst(self):
+        return self._schedule[1]
+
+    @staticmethod
+    def _delay(schedule, ticket, now):
+        rate, burst, start, first = schedule
+        due = start + (ticket - first) / rate
+        if ticket < first or due < now:
+            # idle bucket, or a schedule replaced since the ticket was taken
+            return None
+        return max(0.0, due - (burst - 1) / rate - now)
+
+    def reserve(self):
+        """Take a token from the bucket and return the delay (in seconds)
+        to wait before using it"""
+        ticket = next(self._tickets)
+        delay = self._delay(self._schedule, ticket, time.monotonic())
+        if delay is not None:
+            return delay
+        with self._lock:
+            now = time.monotonic()
+            rate, burst, start, first = self._schedule
+            if ticket < first:
+                delay = self._delay(self._schedule, next(self._tickets), now)
+            if delay is None:
+                # the bucket is full: start a new schedule at a new ticket
+                self._schedule = (rate, burst, now, next(self._tickets))
+                delay = 0.0
+            return delay
+
+    def limit(self, rate, burst=1):
+        """Lower the rate and burst of the bucket to *rate* and *burst* if
+        they are stricter, keeping the tokens already reserved"""
+        with self._lock:
+            old_rate, old_burst, start, first = self._schedule
+            if rate >= old_rate and burst >= old_burst:
+                return
+            ticket = next(self._tickets)
+            start = max(time.monotonic(), start + (ticket - first) / old_rate)
+            self._schedule = (
+                min(rate, old_rate),
+                min(burst, old_burst),
+                start,
+                ticket + 1,
+            )
+
+    def release(self):
+        """Give back a token reserved but not used"""
+        with self._lock:
+            rate, burst, start, first = self._schedule
+            self._schedule = (rate, burst, start - 1 / rate, first)
+
+
+class RateLimiter:
+    """Base class of rate limiters
+
+    Subclasses implement :meth:`reserve`. A limiter is selected for a
+    service with the *rate_limiter* argument of :class:`~services.REST`, or
+    for the whole process with :func:`set_rate_limiter`.
+    """
+
+    def reserve(self, key, rate, burst=1):
+        """Take a token for *key* and return the delay to wait before use
+
+        :param str key: what is rate limited, usually a host name
+        :param rate: maximum number of requests per second
+        :param int burst: number of requests that can be sent at once
+        """
+        raise NotImplementedError
+
+    def release(self, key, rate, burst=1):
+        """Give back a token of *key* reserved but not used
+
+        The default implementation does nothing: the token is lost.
+        """
+
+    def check_deadline(self, key, rate, burst, delay):
+        """Give back the token of *key* and raise
+        :class:`~deadline.DeadlineExceeded` if waiting *delay* would end
+        after the deadline of the call"""
+        deadline = current_deadline()
+        if deadline is None:
+            return
+        try:
+            deadline.check(delay, "the rate limit of %s" % key)
+        except DeadlineExceeded:
+            # the request is not sent: its turn goes to the next caller
+            self.release(key, rate, burst)
+            raise
+
+    def acquire(self, key, rate, burst=1):
+        """Wait for a token for *key* and return the time spent waiting"""
+        if not rate or rate <= 0:
+            return 0.0
+        delay = self.reserve(key, rate, burst)
+        if delay > 0:
+            self.check_deadline(key, rate, burst, delay)
+            time.sleep(delay)
+        return delay
+
+
+class LocalRateLimiter(RateLimiter):
+    """Token buckets shared by the threads of the current process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key, rate, burst=1):
+        """Return the bucket of *key*, limited to *rate* and *burst* at most"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(key, TokenBucket(rate, burst))
+        if rate < bucket.rate or burst < bucket.burst:
+            bucket.limit(rate, burst)
+        return bucket
+
+    def reset(self):
+        """Forget all the buckets"""
+        with self._lock:
+            self._buckets.clear()
+
+    def reserve(self, key, rate, burst=1):
+        if not rate or rate <= 0:
+            return 0.0
+        return self.bucket(key, rate, burst).reserve()
+
+    def release(self, key, rate, burst=1):
+        if not rate or rate <= 0:
+            return
+        self.bucket(key, rate, burst).release()
+
+
+class SharedRateLimiter(RateLimiter):
+    """Token buckets shared by all the processes using the same SQLite file
+
+    Each reservation is a short write transaction on the bucket row, so the
+    aggregated rate of all the processes stays at the configured limit
+    whatever the number of workers. The row keeps the strictest rate and
+    burst asked for its key.
+
+    :param str path: the SQLite database file
+    :param timeout: how long to wait for the database lock, in seconds
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def shared(cls, path):
+        """Return the process-wide limiter using *path*"""
+        limiter = cls._shared.get(path)
+        if limiter is None:
+            with cls._shared_lock:
+                limiter = cls._shared.setdefault(path, cls(path))
+        return limiter
+
+    def _connect(self):
+        # sqlite connections can neither be shared between threads nor
+        # survive a fork: keep one per thread and per process
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, "
+                "tokens REAL, updated REAL, rate REAL, burst INTEGER)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def reserve(self, key, rate, burst=1):
+        if not rate or rate <= 0:
+            return 0.0
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, rate, burst FROM rate_buckets "
+                "WHERE key = ?",
+                (key,),
+            ).fetchone()
+            # wall clock time is the only clock shared between processes
+            now = time.time()
+            if row is None:
+                tokens = burst
+            else:
+                rate, burst = min(rate, row[2]), min(burst, row[3])
+                tokens = min(burst, row[0] + max(now - row[1], 0) * rate)
+            tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets VALUES (?, ?, ?, ?, ?)",
+                (key, tokens, now, rate, burst),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if tokens >= 0:
+            return 0.0
+        return -tokens / rate
+
+    def release(self, key, rate, burst=1):
+        if not rate or rate <= 0:
+            return
+        self._connect().execute(
+            "UPDATE rate_buckets SET tokens = MIN(burst, tokens + 1) WHERE key = ?",
+            (key,),
+        )
+
+
+_rate_limiter = LocalRateLimiter()
+
+
+def get_rate_limiter():
+    """Return the rate limiter used by default by the REST services"""
+    return _rate_limiter
+
+
+def set_rate_limiter(limiter):
+    """Set the rate limiter used by default by the REST services"""
+    global _rate_limiter
+    if not isinstance(limiter, RateLimiter):
+        raise TypeError("limiter must be an instance of RateLimiter")
+    _rate_limiter = limiter
@@ -0,0 +1,192 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Retry policies of the REST services
+
+A :class:`RetryPolicy` describes how failed requests are retried: number of
+attempts, exponential backoff with jitter, HTTP statuses that trigger a retry
+(for idempotent methods only) and whether the ``Retry-After`` header sent
+with 429/503 answers is honoured. It is turned into a urllib3
+:class:`~urllib3.util.retry.Retry` that reports every retry to a
+:class:`RetryStats`, and does not wait for a retry beyond the
+:class:`~deadline.Deadline` of the call.
+"""
+
+import threading
+
+from urllib3.util.retry import Retry
+
+from .deadline import current_deadline
+from .timings import current_timings
+
+__all__ = ["RetryPolicy", "RetryStats"]
+
+
+class RetryStats:
+    """Thread-safe counters of the retries spent by a service"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            #: number of retries
+            self.retries = 0
+            #: number of requests that failed after all their retries
+            self.exhausted = 0
+            #: number of retries per cause (HTTP status or exception name)
+            self.causes = {}
+
+    def record(self, error=None, status=None, exhausted=False):
+        if error is not None:
+            cause = type(error).__name__
+        else:
+            cause = str(status)
+        with self._lock:
+            if exhausted:
+                self.exhausted += 1
+            else:
+                self.retries += 1
+                self.causes[cause] = self.causes.get(cause, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            return dict(
+                retries=self.retries,
+                exhausted=self.exhausted,
+                causes=dict(self.causes),
+            )
+
+    def __repr__(self):
+        return "RetryStats(%s)" % self.as_dict()
+
+
+class _CountingRetry(Retry):
+    """urllib3 Retry reporting each retry to a RetryStats"""
+
+    def __init__(self, *args, stats=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = stats
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.stats = self.stats
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kw):
+        status = None if response is None else response.status
+        try:
+            retry = super().increment(method, url, response, error, *args, **kw)
+        except Exception:
+            if self.stats is not None:
+                self.stats.record(error, status, exhausted=True)
+            raise
+        if self.stats is not None:
+            self.stats.record(error, status)
+        return retry
+
+    def get_wait_time(self, response=None):
+        """Return the time to wait before the next retry"""
+        wait = None
+        if self.respect_retry_after_header and response is not None:
+            wait = self.get_retry_after(response)
+        if wait is None:
+            wait = self.get_backoff_time()
+        return wait
+
+    def sleep(self, response=None):
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check(self.get_wait_time(response), "the next retry")
+        timings = current_timings()
+        if timings is None:
+            super().sleep(response)
+        else:
+            with timings.measure("retry_wait"):
+                super().sleep(response)
+
+
+class RetryPolicy:
+    """How failed requests are retried
+
+    :param int total: maximum number of retries
+    :param float backoff_factor: the n-th consecutive retry waits
+        ``backoff_factor * 2 ** (n - 1)`` seconds (no wait before the first one)
+    :param float backoff_max: maximum wait between two retries
+    :param float jitter: a random delay in [0, jitter] seconds added to each
+        wait, so that clients failing together do not retry together
+    :param status_forcelist: HTTP statuses triggering a retry
+    :param methods: methods retried on read errors and statuses of
+        *status_forcelist*. Defaults to the idempotent methods. Connection
+        errors are retried for all methods, the request not being sent yet.
+    :param bool respect_retry_after: wait for the delay given by the
+        ``Retry-After`` header of 413, 429 and 503 answers
+    """
+
+    def __init__(
+        self,
+        total=3,
+        backoff_factor=0.5,
+        backoff_max=60,
+        jitter=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after=True,
+    ):
+        self.total = total
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.status_forcelist = tuple(status_forcelist)
+        self.methods = frozenset(methods)
+        self.respect_retry_after = respect_retry_after
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build the policy described by the ``retry.*`` settings"""
+        statuses = settings.RETRY_STATUS_FORCELIST
+        if isinstance(statuses, str):
+            statuses = [int(x) for x in statuses.split(",") if x.strip()]
+        elif isinstance(statuses, int):
+            statuses = [statuses]
+        return cls(
+            total=settings.MAX_RETRIES,
+            backoff_factor=settings.RETRY_BACKOFF_FACTOR,
+            backoff_max=settings.RETRY_BACKOFF_MAX,
+            jitter=settings.RETRY_JITTER,
+            status_forcelist=statuses,
+            respect_retry_after=settings.RETRY_RESPECT_RETRY_AFTER,
+        )
+
+    def to_retry(self, stats=None):
+        """Return the urllib3 Retry implementing this policy"""
+        kwargs = dict(
+            total=self.total,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.status_forcelist,
+            allowed_methods=self.methods,
+            respect_retry_after_header=self.respect_retry_after,
+            # return the last response rather than raising once exhausted
+            raise_on_status=False,
+            stats=stats,
+        )
+        try:
+            return _CountingRetry(
+                backoff_max=self.backoff_max, backoff_jitter=self.jitter, **kwargs
+            )
+        except TypeError:
+            # urllib3 < 2 has neither backoff_max nor backoff_jitter
+            return _CountingRetry(**kwargs)
+
+    def __repr__(self):
+        return (
+            "RetryPolicy(total=%s, backoff_factor=%s, jitter=%s, status_forcelist=%s)"
+            % (self.total, self.backoff_factor, self.jitter, self.status_forcelist)
+        )
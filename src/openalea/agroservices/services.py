@@ -21,13 +21,33 @@
 from __future__ import print_function
 from __future__ import division
 
+import io
 import os
+import re
 import sys
 import time
 import platform
 import traceback
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
 
 from .settings import AgroServicesConfig
+from .probe import URLProbe
+from .ratelimit import SharedRateLimiter, get_rate_limiter
+from .jsonstream import JSONItemStream
+from .retry import RetryPolicy, RetryStats
+from .coalesce import SingleFlight
+from .memcache import MemoryCache, copy_value
+from .cachebackends import create_cache_backend
+from .compression import ACCEPT_ENCODING, TransferStats, gzip_body
+from .codec import get_codec
+from .breaker import get_circuit_breakers
+from .deadline import Deadline, DeadlineExceeded, current_deadline
+from .metrics import RequestMetrics, get_registry
+from .tracing import current_span, get_tracer
+from .timings import RequestTimings
+from .transport import create_session, create_transport
 from openalea.agroservices.extern.xmltools import easyXML
 
 # fixing compatibility python 2 and 3 related to merging or urllib and urllib2 in python 3
@@ -37,9 +57,11 @@ try:
     from urllib.parse import urlencode
     from urllib.error import HTTPError
     from urllib.request import Request
+    from urllib.parse import urlparse
 except:
     from urllib import urlencode
     from urllib2 import urlopen, Request, HTTPError
+    from urlparse import urlparse
 
 from openalea.agroservices.extern.easydev.logging_tools import Logging
 from openalea.agroservices.extern.easydev.tools import DevTools
@@ -47,6 +69,12 @@ from openalea.agroservices.extern.easydev.tools import DevTools
 import requests  # replacement for urllib2 (2-3 times faster)
 from requests.models import Response
 import requests_cache  # use caching with requests
+from requests_cache.policy.expiration import (
+    DO_NOT_CACHE,
+    NEVER_EXPIRE,
+    get_expiration_seconds,
+    get_url_expiration,
+)
 # import grequests        # use asynchronous requests with gevent
 # Note that grequests should be imported after requests_cache. Otherwise,
 # one should use a session instance when calling grequests.get, which we do
@@ -61,7 +89,53 @@ if "raw_input" in __builtins__:
 sys.path = [x for x in sys.path if "suds-" not in x]
 
 
-__all__ = ["Service", "WSDLService", "AgroServicesError", "REST"]
+__all__ = [
+    "Service",
+    "WSDLService",
+    "AgroServicesError",
+    "CacheMissError",
+    "CircuitOpenError",
+    "Deadline",
+    "DeadlineExceeded",
+    "REST",
+]
+
+
+# shared by all the REST instances of the process
+_single_flight = SingleFlight()
+_MISSING = object()
+
+# path segments labelled {id} in the metrics: numbers, hexadecimal ids, UUIDs
+_ID_SEGMENT = re.compile(r"\d+|[0-9a-fA-F-]{16,}")
+
+
+@lru_cache(maxsize=None)
+def _endpoint_pattern(template):
+    # "api/model/{id}" matches "api/model/" followed by a single segment
+    segments = template.strip("/").split("/")
+    return re.compile(
+        "/".join(
+            "[^/]+" if re.fullmatch(r"\{\w*\}", s) else re.escape(s) for s in segments
+        )
+    )
+
+
+def _traced(name):
+    """Decorator opening a span around a method whose first argument is a
+    query"""
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, query=None, *args, **kargs):
+            if not self.tracer.enabled:
+                return method(self, query, *args, **kargs)
+            endpoint = self._endpoint(self._build_url(query))
+            with self.tracer.span(name, service=self.name, endpoint=endpoint):
+                return method(self, query, *args, **kargs)
+
+        return wrapper
+
+    return decorator
 
 
 class AgroServicesError(Exception):
@@ -72,6 +146,35 @@ class AgroServicesError(Exception):
         return repr(self.value)
 
 
+class CacheMissError(AgroServicesError):
+    """Raised in offline mode by requests that are not in the cache"""
+
+    def __init__(self, url):
+        super().__init__("%s is not in the cache (offline mode)" % url)
+        self.url = url
+
+
+class CircuitOpenError(AgroServicesError):
+    """Raised by requests to a host whose circuit breaker is open"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(
+            "%s keeps failing, requests rejected for %.1fs" % (host, retry_in)
+        )
+        self.host = host
+        self.retry_in = retry_in
+
+
+class _OfflineAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter of offline sessions, that never opens a connection"""
+
+    def send(self, request, **kwargs):
+        raise CacheMissError(request.url)
+
+    def close(self):
+        pass
+
+
 class Service:
     """Base class for WSDL and REST classes
 
@@ -93,7 +196,15 @@ class Service:
     }
 
     def __init__(
-        self, name, url=None, verbose=True, requests_per_sec=10, url_defined_later=False
+        self,
+        name,
+        url=None,
+        verbose=True,
+        requests_per_sec=10,
+        url_defined_later=False,
+        burst=None,
+        rate_limiter=None,
+        offline=None,
     ):
         """.. rubric:: Constructor
 
@@ -109,6 +220,19 @@ class Service:
             restrictions), change the value. You can also have several instance
             but again, if you send too many requests at the same, your future
             requests may be restricted. Currently implemented for REST only
+        :param int burst: number of requests that can be sent at once before
+            the requests_per_sec limit applies (default is the
+            ``general.burst`` setting)
+        :param rate_limiter: a :class:`~ratelimit.RateLimiter` instance. By
+            default, the limiter of the process is used so that all the
+            instances targeting the same host share the same budget, at the
+            strictest requests_per_sec and burst among them. Set
+            the ``ratelimit.backend`` setting to 'shared' to share it with the
+            other processes of the machine as well.
+        :param bool offline: answer from the cache only, without ever
+            accessing the network (default is the ``general.offline``
+            setting). Requests that are not cached raise a
+            :class:`CacheMissError` and the URL is not probed.
 
 
         All instances have an attribute called :attr:`~Service.logging` that
@@ -131,17 +255,27 @@ class Service:
         self.requests_per_sec = requests_per_sec
         self.name = name
         self.logging = Logging("agroservices:%s" % self.name, verbose)
+        self.devtools = DevTools()
+        self.settings = AgroServicesConfig()
+        if offline is not None:
+            self.settings.OFFLINE = offline
+        self.burst = self.settings.BURST if burst is None else burst
+        self._rate_limiter = rate_limiter
 
         self._url = url
-        try:
-            if self.url is not None:
-                urlopen(self.url, timeout=5)
-        except Exception as err:
-            traceback.print_exception(err)
-            if url_defined_later is False:
-                self.logging.warning(
-                    "The URL (%s) provided cannot be reached." % self.url
-                )
+        self._url_defined_later = url_defined_later
+        # the reachability of the URL is probed in the background (or on
+        # demand) and shared between instances and processes, see url_status
+        self._probe = URLProbe.shared(
+            self.settings.user_cache_dir + os.sep + "url_probes.json",
+            ttl=self.settings.URL_PROBE_TTL,
+        )
+        if (
+            self.url is not None
+            and self.settings.URL_PROBE == "background"
+            and not self.settings.OFFLINE
+        ):
+            self._probe.check(self.url, wait=False, callback=self._report_probe)
         self._easyXMLConversion = True
 
         # used by HGNC where some XML contains non-utf-8 characters !!
@@ -149,25 +283,93 @@ class Service:
         # self._fixing_unicode = False
         # self._fixing_encoding = "utf-8"
 
-        self.devtools = DevTools()
-        self.settings = AgroServicesConfig()
+    def _report_probe(self, status):
+        if not status["reachable"] and self._url_defined_later is False:
+            self.logging.debug(status["error"])
+            self.logging.warning(
+                "The URL (%s) provided cannot be reached." % status["url"]
+            )
 
-        self._last_call = 0
+    def url_status(self, wait=True):
+        """Return the reachability status of the service URL
 
-    def _calls(self):
-        time_lapse = 1.0 / self.requests_per_sec
-        current_time = time.time()
-        dt = current_time - self._last_call
+        The probe result is cached for ``general.url_probe_ttl`` seconds and
+        shared by all instances (and processes) using the same configuration.
 
-        if self._last_call == 0:
-            self._last_call = current_time
-            return
-        else:
-            self._last_call = current_time
-            if dt > time_lapse:
-                return
-            else:
-                time.sleep(time_lapse - dt)
+        :param bool wait: if True (default), probe the URL now if no valid
+            result is available. Otherwise, return None while a background
+            probe is pending.
+        :return: a dict with keys url, reachable, checked and error, or None
+            if the URL is not defined, ``general.url_probe`` is 'off' or the
+            service is offline.
+        """
+        if (
+            self.url is None
+            or self.settings.URL_PROBE == "off"
+            or self.settings.OFFLINE
+        ):
+            return None
+        status = self._probe.status(self.url)
+        if status is None and wait:
+            status = self._probe.wait(self.url, timeout=self._probe.timeout)
+            if status is None:
+                status = self._probe.check(self.url, callback=self._report_probe)
+        return status
+
+    def _get_reachable(self):
+        status = self.url_status()
+        return None if status is None else status["reachable"]
+
+    reachable = property(
+        _get_reachable, doc="True if the URL of the service can be reached"
+    )
+
+    def _get_rate_limiter(self):
+        if self._rate_limiter is not None:
+            return self._rate_limiter
+        if self.settings.RATELIMIT_BACKEND == "shared":
+            return SharedRateLimiter.shared(self.settings.RATELIMIT_PATH)
+        return get_rate_limiter()
+
+    def _set_rate_limiter(self, limiter):
+        self._rate_limiter = limiter
+
+    rate_limiter = property(
+        _get_rate_limiter,
+        _set_rate_limiter,
+        doc="rate limiter (shared by default by all instances of the process)",
+    )
+
+    def _rate_key(self, url=None):
+        # requests are limited per host
+        return urlparse(url or self.url or "").netloc or self.name
+
+    def _calls(self, url=None):
+        """Wait until a request to *url* is allowed by the rate limiter
+
+        Returns the time spent waiting.
+        """
+        return self.rate_limiter.acquire(
+            self._rate_key(url), self.requests_per_sec, self.burst
+        )
+
+    def _get_circuit_breaker(self, url=None):
+        """Return the circuit breaker of the host of url (None if disabled)"""
+        if not self.settings.BREAKER_ENABLED or self.settings.OFFLINE:
+            return None
+        return self.circuit_breakers.get(
+            self._rate_key(url),
+            self.settings.BREAKER_FAILURE_THRESHOLD,
+            self.settings.BREAKER_RESET_TIMEOUT,
+        )
+
+    def _get_circuit_breakers(self):
+        return get_circuit_breakers()
+
+    circuit_breakers = property(
+        _get_circuit_breakers,
+        doc="circuit breakers by host, shared by all the instances of the process",
+    )
 
     def _get_caching(self):
         return self.settings.params["cache.on"][0]
@@ -269,6 +471,37 @@ class Service:
             f.write(newres)
 
 
+def _suds_transport(session):
+    """Return a suds transport sending its requests with a requests session"""
+    from suds.transport import Reply, Transport, TransportError
+
+    class SessionTransport(Transport):
+        def _check(self, response):
+            if response.status_code >= 400:
+                raise TransportError(
+                    response.reason, response.status_code, io.BytesIO(response.content)
+                )
+
+        def open(self, request):
+            response = session.get(request.url, timeout=self.options.timeout)
+            self._check(response)
+            return io.BytesIO(response.content)
+
+        def send(self, request):
+            response = session.post(
+                request.url,
+                data=request.message,
+                headers=request.headers,
+                timeout=self.options.timeout,
+            )
+            if response.status_code in (202, 204):
+                return None
+            self._check(response)
+            return Reply(response.status_code, response.headers, response.content)
+
+    return SessionTransport()
+
+
 class WSDLService(Service):
     """Class dedicated to the web services based on WSDL/SOAP protocol.
 
@@ -278,12 +511,15 @@ class WSDLService(Service):
 
     _service = "WSDL"
 
-    def __init__(self, name, url, verbose=True, cache=False):
+    def __init__(self, name, url, verbose=True, cache=False, transport=None):
         """.. rubric:: Constructor
 
         :param str name: a name e.g. Kegg, Reactome, ...
         :param str url: the URL of the WSDL service
         :param bool verbose: prints informative messages
+        :param str transport: the HTTP client fetching the WSDL and sending
+            the SOAP requests, one of :data:`~transport.TRANSPORTS` (default
+            is the ``http.transport`` setting)
 
         The :attr:`serv` give  access to all WSDL functionalities of the service.
 
@@ -295,6 +531,10 @@ class WSDLService(Service):
 
         self.logging.info("Initialising %s service (WSDL)" % self.name)
         self.CACHING = cache
+        if transport is not None:
+            self.settings.TRANSPORT = transport
+        #: session of the requests sent by suds
+        self.session = create_session(self.settings.TRANSPORT)
 
         try:
             #: attribute to access to the methods provided by this WSDL service
@@ -302,10 +542,13 @@ class WSDLService(Service):
             from suds.cache import ObjectCache
 
             oc = ObjectCache(self.settings.user_config_dir, days=0)
+            transport = _suds_transport(self.session)
             if self.CACHING is True:
-                self.suds = Client(self.url, cache=oc, cachingpolicy=1)
+                self.suds = Client(
+                    self.url, cache=oc, cachingpolicy=1, transport=transport
+                )
             else:
-                self.suds = Client(self.url)
+                self.suds = Client(self.url, transport=transport)
             # reference to the service
             self.serv = self.suds.service
             self._update_settings()
@@ -378,7 +621,15 @@ class RESTbase(Service):
     _service = "REST"
 
     def __init__(
-        self, name, url=None, verbose=True, requests_per_sec=3, url_defined_later=False
+        self,
+        name,
+        url=None,
+        verbose=True,
+        requests_per_sec=3,
+        url_defined_later=False,
+        burst=None,
+        rate_limiter=None,
+        offline=None,
     ):
         super(RESTbase, self).__init__(
             name,
@@ -386,6 +637,9 @@ class RESTbase(Service):
             verbose=verbose,
             requests_per_sec=requests_per_sec,
             url_defined_later=url_defined_later,
+            burst=burst,
+            rate_limiter=rate_limiter,
+            offline=offline,
         )
         self.logging.info("Initialising %s service (REST)" % self.name)
         self.last_response = None
@@ -485,9 +739,30 @@ class REST(RESTbase):
         "text": "text/plain",
         "xml": "application/xml",
         "yaml": "text/x-yaml",
+        "raw": "*/*",
     }
     # special_characters = ['/', '#', '+']
 
+    #: size of the chunks read from streamed responses
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    #: retry policies of endpoint classes, as a dict {URL prefix: RetryPolicy}
+    retry_policies = {}
+
+    #: expiration of the cached responses of endpoint classes, as a dict
+    #: {URL pattern: expiration}. See the cache_expiration argument.
+    cache_expiration = {}
+
+    #: URL prefixes of the (large, rarely changing) resources whose parsed
+    #: results are kept and revalidated. See the revalidate argument.
+    revalidate_urls = ()
+
+    #: templates of the endpoints with parameters in their path (e.g.
+    #: "api/model/{ModelId}"), relative to the URL of the service, labelling
+    #: the metrics of the requests. The first matching template applies.
+    #: Otherwise, numeric and hexadecimal path segments are replaced by {id}.
+    endpoint_templates = ()
+
     def __init__(
         self,
         name,
@@ -498,40 +773,222 @@ class REST(RESTbase):
         proxies=None,
         cert=None,
         url_defined_later=False,
+        burst=None,
+        rate_limiter=None,
+        pool_connections=None,
+        pool_maxsize=None,
+        pool_block=None,
+        keep_alive=None,
+        transport=None,
+        retry=None,
+        retry_policies=None,
+        memory_cache=None,
+        expire_after=None,
+        cache_expiration=None,
+        cache_backend=None,
+        cache_dir=None,
+        offline=None,
+        revalidate=None,
+        compress_requests=None,
+        metrics=None,
+        tracer=None,
+        timings_hook=None,
     ):
+        """.. rubric:: Constructor
+
+        Parameters not described here are those of :class:`Service`.
+
+        :param bool cache: use a local cache of the requests (always used
+            offline)
+        :param str cache_backend: storage of the cache, one of
+            :data:`~cachebackends.BACKENDS` (default is the ``cache.backend``
+            setting)
+        :param str cache_dir: directory of the cache (default is the
+            ``cache.dir`` setting, that is the user config directory unless
+            set)
+        :param int pool_connections: number of hosts whose connections are
+            pooled (default is the ``http.pool_connections`` setting, that is
+            ``general.async_concurrent`` unless set)
+        :param int pool_maxsize: maximum number of connections kept open per
+            host (default is the ``http.pool_maxsize`` setting, that is
+            ``general.async_concurrent`` unless set)
+        :param bool pool_block: if True, wait for a free connection rather
+            than opening (and discarding) extra ones when a pool is full
+        :param bool keep_alive: if False, close connections after each request
+        :param str transport: the HTTP client sending the requests, one of
+            :data:`~transport.TRANSPORTS` (default is the ``http.transport``
+            setting, that is requests)
+        :param bool compress_requests: gzip the body of POST requests larger
+            than the ``http.compress_min_size`` setting. The server must
+            accept gzipped requests (default is the
+            ``http.compress_requests`` setting). Responses are always
+            decompressed.
+        :param retry: a :class:`~retry.RetryPolicy`, or a maximum number of
+            retries. By default, the policy is built from the ``retry.*``
+            settings and ``general.max_retries``.
+        :param dict retry_policies: policies of some endpoint classes, as a
+            dict {URL prefix: RetryPolicy}. Prefixes may be relative to the
+            URL of the service. They complete (and override) the
+            :attr:`retry_policies` of the class.
+        :param memory_cache: with cache, also keep the parsed results of GET
+            requests in a :class:`~memcache.MemoryCache`, so that repeated
+            requests are answered without reading the cache database. True
+            creates one from the ``cache.memory_*`` settings (default is the
+            ``cache.memory`` setting). Set ``cache.memory_copy`` to False
+            for faster hits on large results, which are then shared by all
+            the callers and must not be modified.
+        :param revalidate: keep the parsed result of GET responses
+            carrying an ETag or Last-Modified validator, and send
+            If-None-Match/If-Modified-Since headers when requesting them
+            again. If the resource did not change, the kept result is
+            returned without downloading nor parsing the response. True
+            applies to the :attr:`revalidate_urls` of the class, a list of
+            URL prefixes (relative to the URL of the service) to those
+            resources. Responses larger than the
+            ``cache.validators_max_size`` setting are not kept (default is
+            the ``cache.revalidate`` setting).
+        :param expire_after: with cache, number of seconds (or timedelta)
+            cached responses are valid, -1 meaning for ever. Default is the
+            ``cache.expire_after`` setting.
+        :param dict cache_expiration: expiration of the cached responses of
+            some endpoints, as a dict {URL pattern: expiration}. Patterns are
+            globs, relative to the URL of the service unless absolute, and
+            match the URLs starting with them (e.g. ``"api/dss/rest"``).
+            Expirations are those of expire_after, 0 meaning that responses
+            are revalidated each time and ``requests_cache.DO_NOT_CACHE``
+            that they are not cached. The first matching pattern applies,
+            those given here being tried before the :attr:`cache_expiration`
+            of the class.
+        :param metrics: the :class:`~metrics.MetricsRegistry` recording the
+            requests, by endpoint (default: the registry of the process).
+        :param tracer: the :class:`~tracing.Tracer` of the spans opened
+            around the operations (default: the tracer of the process).
+        :param timings_hook: a function called with the URL and the
+            :class:`~timings.RequestTimings` of each response once it is
+            parsed. The timings are also in the ``timings`` attribute of the
+            responses (e.g. :attr:`last_response`).
+
+        The retries spent are counted in :attr:`retry_stats`, the bytes
+        transferred in :attr:`transfer_stats`.
+        """
         super(REST, self).__init__(
             name,
             url,
             verbose=verbose,
             requests_per_sec=requests_per_sec,
             url_defined_later=url_defined_later,
+            burst=burst,
+            rate_limiter=rate_limiter,
+            offline=offline,
         )
         if proxies is None:
             proxies = []
         self.proxies = proxies
         self.cert = cert
 
-        bspath = self.settings.user_config_dir
+        if retry is None or isinstance(retry, int):
+            policy = RetryPolicy.from_settings(self.settings)
+            if retry is not None:
+                policy.total = retry
+            retry = policy
+        self.retry_policy = retry
+        self.retry_policies = dict(type(self).retry_policies)
+        self.retry_policies.update(retry_policies or {})
+        self.retry_stats = RetryStats()
+        self.transfer_stats = TransferStats()
+        self._codec = None
+        #: metrics of the requests (see :mod:`~openalea.agroservices.metrics`)
+        self.request_metrics = RequestMetrics(
+            get_registry() if metrics is None else metrics
+        )
+        #: tracer of the operations (see :mod:`~openalea.agroservices.tracing`)
+        self.tracer = get_tracer() if tracer is None else tracer
+        self.timings_hook = timings_hook
+
+        if expire_after is None:
+            expire_after = self.settings.EXPIRE_AFTER
+        self.expire_after = expire_after
+        self.cache_expiration = dict(cache_expiration or {})
+        for pattern, expiration in type(self).cache_expiration.items():
+            self.cache_expiration.setdefault(pattern, expiration)
+
+        for key, value in (
+            ("http.pool_connections", pool_connections),
+            ("http.pool_maxsize", pool_maxsize),
+            ("http.pool_block", pool_block),
+            ("http.keep_alive", keep_alive),
+            ("http.transport", transport),
+            ("http.compress_requests", compress_requests),
+        ):
+            if value is not None:
+                self.settings.params[key][0] = value
+
+        if cache_dir is not None:
+            self.settings.CACHE_DIR = cache_dir
+        bspath = self.settings.CACHE_DIR
         self.CACHE_NAME = bspath + os.sep + self.name + "_agroservices_db"
 
         self._session = None
-
-        self.settings.params["cache.on"][0] = cache
+        # the storage of the cache, shared by the session and install_cache
+        self._cache_backend = None
+
+        self.settings.params["cache.on"][0] = cache or self.settings.OFFLINE
+        if cache_backend is not None:
+            self.settings.CACHE_BACKEND = cache_backend
+
+        if memory_cache is None:
+            memory_cache = self.settings.MEMORY_CACHE
+        if memory_cache is True:
+            memory_cache = MemoryCache(
+                self.settings.MEMORY_CACHE_SIZE,
+                self.settings.MEMORY_CACHE_TTL,
+                copy=self.settings.MEMORY_CACHE_COPY,
+            )
+        elif memory_cache is False:
+            memory_cache = None
+        #: in-memory cache of the parsed results, used along with cache
+        self.memory_cache = memory_cache
+
+        if revalidate is None:
+            revalidate = self.settings.REVALIDATE
+        if revalidate is True:
+            revalidate = type(self).revalidate_urls
+        elif not revalidate:
+            revalidate = ()
+        #: URL prefixes of the resources revalidated, see revalidate
+        self.revalidate_urls = tuple(self._build_url(prefix) for prefix in revalidate)
+        #: validators and parsed results of the last responses, see revalidate
+        self.validators = None
+        if self.revalidate_urls:
+            # results are copied only when stored and when returned on a 304
+            self.validators = MemoryCache(
+                self.settings.VALIDATORS_SIZE, ttl=None, copy=False
+            )
 
         if self.CACHING:
             # import requests_cache
             self.logging.info("Using local cache %s" % self.CACHE_NAME)
-            requests_cache.install_cache(self.CACHE_NAME)
+            requests_cache.install_cache(
+                backend=self._get_cache_backend(),
+                **self._cache_options(),
+            )
 
     def delete_cache(self):
-        cache_file = self.CACHE_NAME + ".sqlite"
-        if os.path.exists(cache_file):
+        sqlite = self.settings.CACHE_BACKEND == "sqlite"
+        cache_file = self.CACHE_NAME + ".sqlite" if sqlite else self.CACHE_NAME
+        if not sqlite or os.path.exists(cache_file):
             msg = (
                 "You are about to delete this agroservices cache: %s. Proceed? (y/[n]) "
             )
             res = input(msg % cache_file)
             if res == "y":
-                os.remove(cache_file)
+                # the backend of the session: removing the sqlite file would
+                # not empty its open connection
+                self._get_cache_backend().clear()
+                if self.memory_cache is not None:
+                    self.memory_cache.clear()
+                if self.validators is not None:
+                    self.validators.clear()
                 self.logging.info("Removed cache")
             else:
                 self.logging.info("Reply 'y' to delete the file")
@@ -542,6 +999,75 @@ class REST(RESTbase):
 
         clear()
 
+    def _endpoint(self, url):
+        """Return the endpoint template of url, labelling its metrics"""
+        parsed = urlparse(url)
+        base = urlparse(self.url or "")
+        path = parsed.path.strip("/")
+        if parsed.netloc != base.netloc:
+            path = (parsed.netloc + "/" + path).strip("/")
+        else:
+            prefix = base.path.strip("/")
+            if prefix and (path == prefix or path.startswith(prefix + "/")):
+                path = path[len(prefix) :].strip("/")
+        for template in self.endpoint_templates:
+            if _endpoint_pattern(template).fullmatch(path):
+                return template.strip("/")
+        return "/".join(
+            "{id}" if _ID_SEGMENT.fullmatch(s) else s for s in path.split("/")
+        )
+
+    def _calls(self, url=None):
+        wait = super()._calls(url)
+        self.request_metrics.record_wait(self.name, self._endpoint(url), wait)
+        return wait
+
+    def _record_request(self, method, url, response, start, data=None, received=None):
+        """Record the metrics of a request (response is None if it failed)
+
+        The bytes received are read from the response unless given.
+        """
+        status, retries = "error", 0
+        if response is not None:
+            status = response.status_code
+            if getattr(response, "from_cache", False):
+                data, received = None, 0
+            else:
+                data = response.request.body
+                if received is None:
+                    try:
+                        received = response.raw.tell()
+                    except Exception:
+                        pass
+                retry = getattr(response.raw, "retries", None)
+                retries = len(getattr(retry, "history", ()))
+        sent = len(data) if isinstance(data, (str, bytes)) else 0
+        received = received or 0
+        self.request_metrics.record_request(
+            self.name,
+            self._endpoint(url),
+            method,
+            status,
+            time.perf_counter() - start,
+            sent=sent,
+            received=received,
+            retries=retries,
+        )
+        span = current_span()
+        if span is not None:
+            span.set_attributes(
+                status=status,
+                request_size=sent,
+                response_size=received,
+                retries=retries,
+            )
+
+    def _record_cache(self, url, result):
+        self.request_metrics.record_cache(self.name, self._endpoint(url), result)
+        span = current_span()
+        if span is not None:
+            span.set_attribute("cache", result)
+
     def _build_url(self, query):
         if query is None:
             url = self.url
@@ -571,12 +1097,40 @@ class REST(RESTbase):
         """
         self.logging.debug("Creating session (uncached version)")
         self._session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(max_retries=self.settings.MAX_RETRIES)
-        # , pool_block=True does not work with asynchronous requests
-        self._session.mount("http://", adapter)
-        self._session.mount("https://", adapter)
+        self._mount_adapters(self._session)
         return self._session
 
+    def _create_adapter(self, policy):
+        return create_transport(
+            self.settings.TRANSPORT,
+            pool_connections=self.settings.POOL_CONNECTIONS,
+            pool_maxsize=self.settings.POOL_MAXSIZE,
+            max_retries=policy.to_retry(self.retry_stats),
+            pool_block=self.settings.POOL_BLOCK,
+        )
+
+    def _mount_adapters(self, session):
+        """Mount HTTP adapters configured with the pooling settings and the
+        retry policies
+
+        The pools keep up to :attr:`settings.POOL_MAXSIZE` connections per
+        host, so that concurrent requests reuse their connections instead of
+        opening and discarding new ones. Endpoint classes with their own retry
+        policy get their own adapter, mounted on their URL prefix.
+        """
+        if self.settings.OFFLINE:
+            session.mount("http://", _OfflineAdapter())
+            session.mount("https://", _OfflineAdapter())
+            return
+        adapter = self._create_adapter(self.retry_policy)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        for prefix, policy in self.retry_policies.items():
+            session.mount(self._build_url(prefix), self._create_adapter(policy))
+        if not self.settings.KEEP_ALIVE:
+            session.headers["Connection"] = "close"
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
     def _create_cache_session(self):
         """Creates a cached session using requests_cache package"""
         self.logging.debug("Creating session (cache version)")
@@ -584,10 +1138,55 @@ class REST(RESTbase):
             # import requests_cache
             self.logging.debug("No cached session created yet. Creating one")
             self._session = requests_cache.CachedSession(
-                self.CACHE_NAME, backend="sqlite", fast_save=self.settings.FAST_SAVE
+                backend=self._get_cache_backend(),
+                **self._cache_options(),
             )
+            self._mount_adapters(self._session)
         return self._session
 
+    def _get_cache_backend(self):
+        """Return the backend of the cache, created once: a second backend
+        opened on the same storage would not see the changes of the first"""
+        if self._cache_backend is None:
+            self._cache_backend = self._create_cache_backend()
+        return self._cache_backend
+
+    def _create_cache_backend(self):
+        """Return the requests_cache backend set by the cache.* settings"""
+        backend = self.settings.CACHE_BACKEND
+        kwargs = {}
+        if backend == "sqlite":
+            kwargs["fast_save"] = self.settings.FAST_SAVE
+        return create_cache_backend(
+            backend, self.CACHE_NAME, kv_url=self.settings.CACHE_KV_URL, **kwargs
+        )
+
+    def _cache_options(self):
+        """Return the expiration arguments of requests_cache"""
+        urls_expire_after = {}
+        for pattern, expiration in self.cache_expiration.items():
+            if isinstance(pattern, str):
+                pattern = self._build_url(pattern)
+            urls_expire_after[pattern] = expiration
+        options = dict(
+            expire_after=self.expire_after, urls_expire_after=urls_expire_after
+        )
+        if self.settings.OFFLINE:
+            # expired responses are better than nothing
+            options.update(only_if_cached=True, stale_if_error=True)
+        return options
+
+    def _cache_seconds(self, url):
+        """Return the number of seconds the response of url stays cached
+        (-1 for ever, 0 if not cached)"""
+        expiration = get_url_expiration(url, self._cache_options()["urls_expire_after"])
+        if expiration is None:
+            expiration = self.expire_after
+        if expiration == DO_NOT_CACHE:
+            return 0
+        seconds = get_expiration_seconds(expiration)
+        return seconds if seconds == NEVER_EXPIRE else max(0, seconds)
+
     def _get_timeout(self):
         return self.settings.TIMEOUT
 
@@ -596,6 +1195,20 @@ class REST(RESTbase):
 
     TIMEOUT = property(_get_timeout, _set_timeout)
 
+    def _get_codec(self):
+        if self._codec is not None:
+            return self._codec
+        return get_codec(self.settings.JSON_CODEC)
+
+    def _set_codec(self, codec):
+        self._codec = codec
+
+    codec = property(
+        _get_codec,
+        _set_codec,
+        doc="JSON codec of the responses (default set by general.json_codec)",
+    )
+
     def _process_get_request(self, url, session, frmt, data=None, **kwargs):
         try:
             res = session.get(url, **kwargs)
@@ -615,6 +1228,11 @@ class REST(RESTbase):
             self.logging.warning("status is not ok with {0}".format(reason))
             return res.status_code
         if frmt == "json":
+            try:
+                return self.codec.loads(res.content)
+            except ValueError:
+                pass
+            # not UTF-8, let requests guess the encoding
             try:
                 return res.json()
             except requests.exceptions.JSONDecodeError:
@@ -622,10 +1240,80 @@ class REST(RESTbase):
         # finally
         return res.content
 
+    def _stream_returned_request(self, res, frmt, item_path=None):
+        """Read a response incrementally (see stream argument of get_one)
+
+        JSON responses are returned as a :class:`~jsonstream.JSONItemStream`
+        over the items found at *item_path*, other formats as an iterator over
+        chunks of the content. The connection is released once the iteration
+        is complete.
+        """
+        if not res.ok:
+            self.logging.warning("status is not ok with {0}".format(res.reason))
+            res.close()
+            return res.status_code
+
+        def chunks():
+            try:
+                yield from res.iter_content(self.STREAM_CHUNK_SIZE)
+            finally:
+                res.close()
+
+        if frmt == "json":
+            return JSONItemStream(chunks(), item_path, encoding=res.encoding or "utf-8")
+        return chunks()
+
     @staticmethod
     def _apply(iterable, fn, *args, **kwargs):
         return [fn(x, *args, **kwargs) for x in iterable if x is not None]
 
+    def _map_threads(self, fn, items):
+        """Call *fn* on each item in a pool of threads
+
+        At most :attr:`settings.CONCURRENT` calls run at once. Results are
+        returned in the order of *items*. If a call fails, its result is an
+        :class:`AgroServicesError` (with a ``query`` attribute set to the
+        item) rather than an exception. The calls run with the
+        :class:`~deadline.Deadline` of the caller.
+        """
+
+        def call(item):
+            try:
+                return fn(item)
+            except Exception as err:
+                return self._query_error(err, item)
+
+        # create the shared session before the threads do
+        _ = self.session
+        workers = max(1, min(self.settings.CONCURRENT, len(items)))
+        # each call runs in a copy of the context of the caller (deadline)
+        contexts = [contextvars.copy_context() for _ in items]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(
+                executor.map(lambda ctx, item: ctx.run(call, item), contexts, items)
+            )
+
+    @staticmethod
+    def _query_error(err, query):
+        """Return *err* as an :class:`AgroServicesError` of *query*"""
+        if isinstance(err, AgroServicesError):
+            error = err
+        else:
+            error = AgroServicesError(err)
+        error.query = query
+        return error
+
+    def _get_async_backend(self):
+        backend = self.settings.ASYNC_BACKEND
+        if backend == "auto":
+            try:
+                import grequests
+            except ImportError:
+                backend = "threads"
+            else:
+                backend = "grequests"
+        return backend
+
     def _get_async(self, keys, frmt="json", params=None):
         # does not work under pyhon3 so local import
         if params is None:
@@ -655,8 +1343,20 @@ class REST(RESTbase):
         return ("%s/%s" % (self.url, query) for query in keys)
 
     def get_async(self, keys, frmt="json", params=None, **kargs):
+        """Get several queries concurrently
+
+        With the 'threads' backend (``general.async_backend`` setting, used by
+        default if grequests is not installed), the results are aligned with
+        *keys*, failed queries being replaced by an :class:`AgroServicesError`.
+        With grequests, failed queries are dropped.
+        """
         if params is None:
             params = {}
+        if self._get_async_backend() == "threads":
+            self.logging.debug("Running thread pool call for a list")
+            return self._map_threads(
+                lambda key: self._get_one(key, frmt, params=params, **kargs), keys
+            )
         ret = self._get_async(keys, frmt, params=params, **kargs)
         return self._apply(ret, self._interpret_returned_request, frmt)
 
@@ -669,18 +1369,26 @@ class REST(RESTbase):
         * query is the suffix that will be appended to the main url attribute.
         * query is either a string or a list of strings.
         * if list is larger than ASYNC_THRESHOLD, use asynchronous call.
+        * postprocess is an optional function applied to the parsed result of
+          successful requests. Results are kept (see the memory_cache and
+          revalidate arguments of :class:`REST`) once post-processed, so that
+          it is not run again for resources that did not change.
+        * deadline is an optional number of seconds given to the whole call,
+          retries and lists of queries included (see
+          :class:`~deadline.Deadline`).
 
         """
+        deadline = kargs.pop("deadline", None)
+        if deadline is not None:
+            with Deadline(deadline):
+                return self.http_get(query, frmt, params, **kargs)
         if params is None:
             params = {}
-        if isinstance(query, list) and len(query) > self.settings.ASYNC_THRESHOLD:
-            self.logging.debug("Running async call for a list")
-            return self.get_async(query, frmt, params=params, **kargs)
-
-        if isinstance(query, list) and len(query) <= self.settings.ASYNC_THRESHOLD:
-            self.logging.debug("Running sync call for a list")
-            return [self.get_one(key, frmt, params=params, **kargs) for key in query]
-            # return self.get_sync(query, frmt)
+        if isinstance(query, list):
+            with self.tracer.span(
+                "REST.http_get", service=self.name, queries=len(query)
+            ):
+                return self._http_get_list(query, frmt, params, **kargs)
 
         # OTHERWISE
         self.logging.debug("Running http_get (single call mode)")
@@ -703,14 +1411,67 @@ class REST(RESTbase):
 
         return self.get_one(query, frmt=frmt, params=params, **kargs)
 
+    def _http_get_list(self, query, frmt, params, **kargs):
+        if len(query) > self.settings.ASYNC_THRESHOLD:
+            self.logging.debug("Running async call for a list")
+            return self.get_async(query, frmt, params=params, **kargs)
+
+        self.logging.debug("Running sync call for a list")
+        return [self.get_one(key, frmt, params=params, **kargs) for key in query]
+        # return self.get_sync(query, frmt)
+
     def get_one(self, query=None, frmt="json", params=None, **kargs):
         """
 
         if query starts with http:// do not use self.url
+
+        With ``frmt="raw"``, the content of the response is returned as is,
+        as bytes, without being decoded (nor copied).
+
+        With ``stream=True``, the response is read incrementally: for JSON,
+        an iterable :class:`~jsonstream.JSONItemStream` yields the items of
+        the array found at ``item_path`` (e.g.
+        ``"locationWeatherData.*.data"``) while they are downloaded, so that
+        memory does not grow with the size of the response. Note that a cached
+        session stores the whole response anyway.
+
+        Identical requests sent at the same time by several threads (same URL,
+        parameters and :attr:`signature_headers`) share a single call, unless
+        the ``general.coalesce`` setting is False. Each caller gets its own
+        copy of the result.
+
+        Offline, a request that is not in the cache raises a
+        :class:`CacheMissError` rather than returning None.
+
+        The request waits at most ``timeout`` seconds, a number or a
+        (connect, read) tuple defaulting to the ``general.connect_timeout``
+        and ``general.timeout`` settings. With ``deadline`` (in seconds), or
+        within a :class:`~deadline.Deadline` block, the time spent in retries
+        and rate limiting counts too, and :class:`DeadlineExceeded` is raised
+        once it is spent.
         """
+        deadline = kargs.pop("deadline", None)
+        if deadline is not None:
+            with Deadline(deadline):
+                return self.get_one(query, frmt, params, **kargs)
+        try:
+            return self._get_one(query, frmt, params, **kargs)
+        except (CacheMissError, CircuitOpenError, DeadlineExceeded):
+            raise
+        except Exception as err:
+            self.logging.critical(err)
+            self.logging.critical(
+                """Query unsuccessful. Maybe too slow response.
+    Consider increasing it with settings.TIMEOUT attribute {}""".format(
+                    self.settings.TIMEOUT
+                )
+            )
+
+    @_traced("REST.get_one")
+    def _get_one(self, query=None, frmt="json", params=None, **kargs):
+        # same as get_one, but errors are raised
         if params is None:
             params = {}
-        self._calls()
         url = self._build_url(query)
 
         if url.count("//") > 1:
@@ -719,35 +1480,208 @@ class REST(RESTbase):
                 + "Check your URL and remove trailing /"
             )
         self.logging.debug(url)
-        try:
-            kargs["params"] = params
-            kargs["timeout"] = self.TIMEOUT
-            kargs["proxies"] = self.proxies
-            kargs["cert"] = self.cert
-            # Used only in biomart with cosmic database
-            # See doc/source/biomart.rst for an example
-            if hasattr(self, "authentication"):
-                kargs["auth"] = self.authentication
-
-            # res = self.session.get(url, **{'timeout':self.TIMEOUT, 'params':params})
-            res = self.session.get(url, **kargs)
+        kargs["params"] = params
+        kargs["timeout"] = self._request_timeout(kargs.get("timeout"))
+        kargs["proxies"] = self.proxies
+        kargs["cert"] = self.cert
+        # Used only in biomart with cosmic database
+        # See doc/source/biomart.rst for an example
+        if hasattr(self, "authentication"):
+            kargs["auth"] = self.authentication
+
+        stream = kargs.pop("stream", False)
+        item_path = kargs.pop("item_path", None)
+        postprocess = kargs.pop("postprocess", None)
+        if stream:
+            res, _ = self._send_get(url, frmt, kargs, stream=True, item_path=item_path)
+            return res
 
-            self.last_response = res
-            res = self._interpret_returned_request(res, frmt)
+        key = self._request_signature("GET", url, frmt, kargs) + (repr(postprocess),)
+        memory = self.memory_cache if self.CACHING else None
+        if memory is not None:
+            res = memory.get(key, _MISSING)
+            if res is not _MISSING:
+                self._record_cache(url, "hit")
+                return res
+
+        if not self.settings.COALESCE:
+            res, response = self._send_get(
+                url, frmt, kargs, postprocess=postprocess, key=key
+            )
+        else:
+            # identical requests in flight share a single call
+            (res, response), shared = _single_flight.do(
+                key,
+                lambda: self._send_get(
+                    url, frmt, kargs, postprocess=postprocess, key=key
+                ),
+                current_deadline(),
+            )
+            if shared:
+                self.last_response = response
+                # callers may modify their result
+                res = copy_value(res)
+
+        if memory is not None and self._is_cacheable(res, response):
+            # not longer than the cache database keeps the response
+            seconds = self._cache_seconds(url)
+            if seconds == NEVER_EXPIRE:
+                memory.set(key, res)
+            elif seconds > 0:
+                if memory.ttl is not None:
+                    seconds = min(seconds, memory.ttl)
+                memory.set(key, res, ttl=seconds)
+        return res
+
+    def _request_timeout(self, timeout=None):
+        """Return the (connect, read) timeout of a request, capped by the
+        time left to the current deadline
+
+        :param timeout: a number, a (connect, read) tuple, or None for the
+            ``general.connect_timeout`` and ``general.timeout`` settings
+        """
+        if timeout is None:
+            connect = self.settings.CONNECT_TIMEOUT
+            timeout = (self.TIMEOUT if connect is None else connect, self.TIMEOUT)
+        elif not isinstance(timeout, (tuple, list)):
+            timeout = (timeout, timeout)
+        deadline = current_deadline()
+        if deadline is not None:
+            timeout = deadline.bound(timeout)
+        return tuple(timeout)
+
+    @staticmethod
+    def _is_cacheable(res, response):
+        """True if res is the result of a successful request"""
+        return (
+            res is not None
+            and isinstance(response, Response)
+            and response.ok
+            and res is not response
+        )
+
+    def _send_get(
+        self,
+        url,
+        frmt,
+        kargs,
+        stream=False,
+        item_path=None,
+        postprocess=None,
+        key=None,
+    ):
+        """Send a GET request and return a (result, response) tuple
+
+        The response is returned along with the result since
+        :attr:`last_response` may be replaced by other threads meanwhile.
+        """
+        validators = None
+        if key is not None and url.startswith(self.revalidate_urls):
+            validators = self.validators
+        validated = None
+        if validators is not None:
+            validated = validators.get(key)
+            if validated is not None:
+                kargs = dict(kargs, headers=self._conditional_headers(kargs, validated))
+        # res = self.session.get(url, **{'timeout':self.TIMEOUT, 'params':params})
+        response = self._send("GET", url, stream=stream, **kargs)
+        self._check_offline(response)
+
+        self.last_response = response
+        from_cache = getattr(response, "from_cache", False)
+        if stream:
+            self._record_cache(url, "hit" if from_cache else "miss")
+            self._finish_timings(response)
+            return self._stream_returned_request(response, frmt, item_path), response
+        self._record_transfer(response)
+        if validated is not None and self._not_modified(response, validated):
+            self._record_cache(url, "hit" if from_cache else "revalidated")
+            self._finish_timings(response)
+            return copy_value(validated[2]), response
+        self._record_cache(url, "hit" if from_cache else "miss")
+        start = time.perf_counter()
+        res = self._interpret_returned_request(response, frmt)
+        if frmt != "raw":
             try:
                 # for python 3 compatibility
                 res = res.decode()
             except:
                 pass
-            return res
-        except Exception as err:
-            self.logging.critical(err)
-            self.logging.critical(
-                """Query unsuccessful. Maybe too slow response.
-    Consider increasing it with settings.TIMEOUT attribute {}""".format(
-                    self.settings.TIMEOUT
-                )
-            )
+        if response.ok and res is not response:
+            if postprocess is not None:
+                res = postprocess(res)
+            if (
+                validators is not None
+                and len(response.content) <= self.settings.VALIDATORS_MAX_SIZE
+            ):
+                etag = response.headers.get("ETag")
+                modified = response.headers.get("Last-Modified")
+                if etag or modified:
+                    validators.set(key, (etag, modified, copy_value(res)))
+        self._finish_timings(response, start)
+        return res, response
+
+    def _finish_timings(self, response, decode_start=None):
+        """Complete the timings of a response with its parsing time (since
+        decode_start), and report them"""
+        timings = getattr(response, "timings", None)
+        if timings is None:
+            return
+        if decode_start is not None:
+            timings.add("decode", time.perf_counter() - decode_start)
+        span = current_span()
+        if span is not None:
+            span.set_attribute("timings", timings.as_dict())
+        if self.timings_hook is not None:
+            self.timings_hook(response.url, timings)
+
+    @staticmethod
+    def _conditional_headers(kargs, validated):
+        """Return the headers of kargs, with the validators of a kept result"""
+        etag, modified, _ = validated
+        headers = dict(kargs.get("headers") or {})
+        if etag:
+            headers["If-None-Match"] = etag
+        if modified:
+            headers["If-Modified-Since"] = modified
+        return headers
+
+    @staticmethod
+    def _not_modified(response, validated):
+        """True if response tells that a kept result is still valid"""
+        if response.status_code == 304:
+            return True
+        # e.g. a response of requests_cache, fresh or revalidated
+        etag, modified, _ = validated
+        if not response.ok:
+            return False
+        if etag:
+            return response.headers.get("ETag") == etag
+        return response.headers.get("Last-Modified") == modified
+
+    def _check_offline(self, res):
+        # offline, requests_cache answers a miss with a 504 response
+        if self.settings.OFFLINE and res.status_code == 504:
+            raise CacheMissError(res.url)
+
+    #: request headers that change the answer of a server
+    signature_headers = ("Accept", "Accept-Language", "Authorization", "Cookie")
+
+    def _request_signature(self, method, url, frmt, kargs):
+        """Return a hashable key identifying a request and its result"""
+        params = kargs.get("params") or {}
+        if isinstance(params, dict):
+            params = sorted(params.items(), key=str)
+        headers = requests.structures.CaseInsensitiveDict(kargs.get("headers") or {})
+        return (
+            method,
+            url,
+            frmt,
+            repr(params),
+            tuple(headers.get(name) for name in self.signature_headers),
+            repr(kargs.get("auth")),
+            repr(kargs.get("cert")),
+        )
 
     def http_post(
         self,
@@ -761,10 +1695,11 @@ class REST(RESTbase):
         **kargs,
     ):
         # query and frmt are agroservices parameters. Others are post parameters
+        # (deadline and timeout are those of get_one)
         # NOTE in requests.get you can use params parameter
         # BUT in post, you use data
-        # only single post implemented for now unlike get that can be asynchronous
-        # or list of queries
+        # query may be a list of queries and data a list of payloads, posted
+        # concurrently (see post_one)
 
         # if user provide a header, we use it otherwise, we use the header from
         # agroservices and the content defined here above
@@ -775,7 +1710,7 @@ class REST(RESTbase):
             else:
                 headers["Accept"] = content
 
-        self.logging.debug("Running http_post (single call mode)")
+        self.logging.debug("Running http_post")
         kargs.update({"query": query})
         kargs.update({"headers": headers})
         kargs.update({"files": files})
@@ -787,23 +1722,191 @@ class REST(RESTbase):
         return self.post_one(**kargs)
 
     def post_one(self, query=None, frmt="json", **kargs):
-        self._calls()
+        """
+
+        query may be a list of queries, and data a list of payloads (str,
+        bytes or dict): the posts are then sent concurrently, each query with
+        the payload at the same position, or with the same data if data is
+        not a list of payloads (e.g. a list of form tuples), or to the same
+        query if query is not a list. At most :attr:`settings.CONCURRENT`
+        posts run at once, within the rate limits of the service. Results are
+        returned in the order of the inputs, a failed post giving an
+        :class:`AgroServicesError` whose ``query`` attribute is its
+        (query, data) pair (see :meth:`_map_threads`).
+        """
+        deadline = kargs.pop("deadline", None)
+        if deadline is not None:
+            with Deadline(deadline):
+                return self.post_one(query, frmt, **kargs)
+        items = self._post_items(query, kargs.get("data"))
+        if items is None:
+            return self._post_one(query, frmt, **kargs)
+        with self.tracer.span("REST.http_post", service=self.name, queries=len(items)):
+            return self._map_threads(
+                lambda item: self._post_one(item[0], frmt, **dict(kargs, data=item[1])),
+                items,
+            )
+
+    @staticmethod
+    def _post_items(query, data):
+        """Return the (query, data) pairs of a batch of posts, or None for a
+        single post"""
+        payloads = (
+            isinstance(data, list)
+            and len(data) > 0
+            and all(isinstance(d, (str, bytes, dict)) for d in data)
+        )
+        if not isinstance(query, list) and not payloads:
+            return None
+        if not isinstance(query, list):
+            query = [query] * len(data)
+        if not payloads:
+            data = [data] * len(query)
+        if len(query) != len(data):
+            raise ValueError(
+                "%d queries but %d payloads to post" % (len(query), len(data))
+            )
+        return list(zip(query, data))
+
+    @_traced("REST.post_one")
+    def _post_one(self, query=None, frmt="json", **kargs):
         url = self._build_url(query)
         self.logging.debug("BioServices:: Entering post_one function")
         self.logging.debug(url)
+        stream = kargs.pop("stream", False)
+        item_path = kargs.pop("item_path", None)
+        compress = kargs.pop("compress", None)
+        self._compress_body(kargs, compress)
+        kargs["timeout"] = self._request_timeout(kargs.get("timeout"))
         try:
-            res = self.session.post(url, **kargs)
+            res = self._send("POST", url, stream=stream, **kargs)
+            self._check_offline(res)
             self.last_response = res
-            res = self._interpret_returned_request(res, frmt)
-            try:
-                return res.decode()
-            except:
-                self.logging.debug("BioServices:: Could not decode the response")
-                return res
+            if stream:
+                self._finish_timings(res)
+                return self._stream_returned_request(res, frmt, item_path)
+            self._record_transfer(res)
+            response, start = res, time.perf_counter()
+            res = self._interpret_returned_request(response, frmt)
+            if frmt != "raw":
+                try:
+                    res = res.decode()
+                except:
+                    self.logging.debug("BioServices:: Could not decode the response")
+            self._finish_timings(response, start)
+            return res
+        except (CacheMissError, CircuitOpenError, DeadlineExceeded):
+            raise
         except Exception as err:
             traceback.print_exception(err)
             return None
 
+    def _send(self, method, url, **kwargs):
+        """Send a request with the session, through the circuit breaker and
+        the rate limiter of the host
+
+        Connection errors, timeouts and 5xx answers (once retried) are
+        failures of the host, unless the deadline of the call is reached.
+        While the circuit is open, requests fail at once without waiting for
+        the rate limiter, except GET requests the cache can answer. The
+        response gets the timings of the request (see
+        :mod:`~openalea.agroservices.timings`).
+        """
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check(what="%s %s" % (method, url))
+        breaker = self._get_circuit_breaker(url)
+        rejected_by = None
+        if breaker is not None and not breaker.allow():
+            if method != "GET" or not isinstance(
+                self.session, requests_cache.CachedSession
+            ):
+                raise CircuitOpenError(self._rate_key(url), breaker.retry_in())
+            # while the circuit is open, the cache may still answer
+            rejected_by, breaker = breaker, None
+            kwargs["only_if_cached"] = True
+        wait = 0.0
+        if rejected_by is None and not self.settings.OFFLINE:
+            try:
+                wait = self._calls(url)
+            except BaseException:
+                # e.g. the deadline is reached: the host is not to blame
+                if breaker is not None:
+                    breaker.release()
+                raise
+        timings = RequestTimings()
+        timings.add("rate_limit", wait)
+        start = time.perf_counter()
+        try:
+            with timings.recording(), timings.measure("transfer"):
+                response = self.session.request(method, url, **kwargs)
+        except Exception as err:
+            self._record_request(method, url, None, start, kwargs.get("data"))
+            error = self._request_failed(err, breaker, deadline)
+            if error is err:
+                raise
+            raise error from err
+        if rejected_by is not None and response.status_code == 504:
+            # not in the cache (the 504 answer of requests_cache)
+            raise CircuitOpenError(self._rate_key(url), rejected_by.retry_in())
+        self._record_request(method, url, response, start)
+        timings.from_cache = getattr(response, "from_cache", False)
+        response.timings = timings
+        if breaker is None:
+            return response
+        if getattr(response, "from_cache", False):
+            breaker.release()
+        elif response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def _request_failed(self, err, breaker=None, deadline=None):
+        """Record the failure of a request and return the error to raise"""
+        if isinstance(err, DeadlineExceeded):
+            error = err
+        elif deadline is not None and deadline.expired:
+            error = DeadlineExceeded("deadline reached during the request: %s" % err)
+        else:
+            if breaker is not None:
+                breaker.record_failure()
+            return err
+        # the time budget of the call is spent, the host is not to blame
+        if breaker is not None:
+            breaker.release()
+        return error
+
+    def _compress_body(self, kargs, compress=None):
+        """Gzip the data of kargs if needed (see compress_requests)"""
+        data = kargs.get("data")
+        if not isinstance(data, (str, bytes)):
+            return
+        size = sent = len(data.encode("utf-8") if isinstance(data, str) else data)
+        if compress is None:
+            compress = self.settings.COMPRESS_REQUESTS
+        headers = requests.structures.CaseInsensitiveDict(kargs.get("headers") or {})
+        if (
+            compress
+            and size >= self.settings.COMPRESS_MIN_SIZE
+            and "Content-Encoding" not in headers
+        ):
+            kargs["data"] = gzip_body(data)
+            headers["Content-Encoding"] = "gzip"
+            kargs["headers"] = headers
+            sent = len(kargs["data"])
+        self.transfer_stats.record_request(sent, size)
+
+    def _record_transfer(self, response):
+        """Count the bytes of a response, as received and decoded"""
+        if getattr(response, "from_cache", False):
+            return
+        try:
+            wire = response.raw.tell()
+        except Exception:
+            return
+        self.transfer_stats.record_response(wire, len(response.content))
+
     @staticmethod
     def getUserAgent():
         # self.logging.info('getUserAgent: Begin')
@@ -832,6 +1935,7 @@ class REST(RESTbase):
         headers = {
             "User-Agent": self.getUserAgent(),
             "Accept": self.content_types[content],
+            "Accept-Encoding": ACCEPT_ENCODING,
             "Content-Type": self.content_types[content],
         }
         # "application/json;odata=verbose" required in reactome
@@ -851,17 +1955,19 @@ class REST(RESTbase):
         return self.delete_one(**kargs)
 
     def delete_one(self, query, frmt="json", **kargs):
-        self._calls()
         self.logging.debug("BioServices:: Entering delete_one function")
         if query is None:
             url = self.url
         else:
             url = "%s/%s" % (self.url, query)
+        self._calls(url)
         self.logging.debug(url)
         try:
             res = self.session.delete(url, **kargs)
             self.last_response = res
             res = self._interpret_returned_request(res, frmt)
+            if frmt == "raw":
+                return res
             try:
                 return res.decode()
             except:
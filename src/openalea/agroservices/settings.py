@@ -47,16 +47,189 @@ defaultParams = {
         "email address that may be used in some utilities (e.g. EUtils)",
     ],
     "general.timeout": [30, (int, float), ""],
+    "general.connect_timeout": [
+        10,
+        (int, float, type(None)),
+        "seconds to wait for the connection to a server (general.timeout is "
+        "the time to wait for its answer; None to use general.timeout)",
+    ],
     "general.max_retries": [3, int, ""],
     "general.async_concurrent": [50, int, ""],
     "general.async_threshold": [10, int, "when to switch to asynchronous requests"],
+    "general.async_backend": [
+        "auto",
+        str,
+        "backend of asynchronous requests: 'grequests', 'threads' or 'auto' (grequests if installed)",
+    ],
+    "general.json_codec": [
+        "auto",
+        str,
+        "JSON codec: 'orjson', 'json' (standard library) or 'auto' (orjson if installed)",
+    ],
+    "general.offline": [
+        False,
+        bool,
+        "answer from the cache only, without any network access",
+    ],
+    "general.coalesce": [
+        True,
+        bool,
+        "identical GET requests sent at the same time share a single call",
+    ],
+    "general.burst": [
+        1,
+        int,
+        "number of requests sent at once before requests_per_sec applies",
+    ],
+    "general.url_probe": [
+        "background",
+        str,
+        "reachability probe of service URLs: 'background', 'lazy' or 'off'",
+    ],
+    "general.url_probe_ttl": [
+        300,
+        (int, float),
+        "number of seconds a reachability probe result is reused",
+    ],
+    "ratelimit.backend": [
+        "local",
+        str,
+        "rate limits shared by the threads of a process ('local') or by all the processes of the machine ('shared')",
+    ],
+    "ratelimit.path": [
+        None,
+        (str, type(None)),
+        "SQLite file of the shared rate limiter (default in the user cache directory)",
+    ],
+    "http.pool_connections": [
+        None,
+        (int, type(None)),
+        "number of hosts whose connections are kept in a pool (default: general.async_concurrent)",
+    ],
+    "http.pool_maxsize": [
+        None,
+        (int, type(None)),
+        "maximum number of connections kept per host (default: general.async_concurrent)",
+    ],
+    "http.pool_block": [
+        False,
+        bool,
+        "wait for a free connection instead of opening a new one when a host pool is full",
+    ],
+    "http.keep_alive": [True, bool, "reuse connections between requests"],
+    "http.transport": [
+        "requests",
+        str,
+        "HTTP client sending the requests: 'requests', 'urllib3' or 'httpx' (HTTP/2, requires httpx)",
+    ],
+    "http.compress_requests": [
+        False,
+        bool,
+        "gzip the body of POST requests larger than http.compress_min_size (if the server supports it)",
+    ],
+    "http.compress_min_size": [
+        2048,
+        int,
+        "minimum size in bytes of the request bodies that are gzipped",
+    ],
+    "breaker.enabled": [
+        True,
+        bool,
+        "stop sending requests for a while to hosts that keep failing",
+    ],
+    "breaker.failure_threshold": [
+        5,
+        int,
+        "number of consecutive failures opening the circuit of a host",
+    ],
+    "breaker.reset_timeout": [
+        30,
+        (int, float),
+        "number of seconds requests to a failing host are rejected before trying again",
+    ],
+    "retry.backoff_factor": [
+        0.5,
+        (int, float),
+        "the n-th consecutive retry waits backoff_factor * 2 ** (n - 1) seconds",
+    ],
+    "retry.backoff_max": [60, (int, float), "maximum wait between two retries"],
+    "retry.jitter": [
+        0.5,
+        (int, float),
+        "random delay (in seconds, at most) added to each wait between retries",
+    ],
+    "retry.status_forcelist": [
+        "429,500,502,503,504",
+        str,
+        "comma separated HTTP statuses retried for idempotent methods",
+    ],
+    "retry.respect_retry_after": [
+        True,
+        bool,
+        "wait for the delay of the Retry-After header of 429/503 answers",
+    ],
     "cache.tag_suffix": [
         "_agroservices_database",
         str,
         "suffix to append for cache databases",
     ],
     "cache.on": [False, bool, "CACHING on/off"],
+    "cache.dir": [
+        None,
+        (str, type(None)),
+        "directory of the cache databases (default: the user config directory)",
+    ],
+    "cache.backend": [
+        "sqlite",
+        str,
+        "storage of the cache: 'sqlite', 'filesystem', 'memory' or 'kv' (key-value store)",
+    ],
+    "cache.kv_url": [
+        None,
+        (str, type(None)),
+        "URL of the Redis server of the 'kv' backend (default: a local dbm database)",
+    ],
+    "cache.expire_after": [
+        -1,
+        (int, float),
+        "number of seconds cached responses are valid, unless set per endpoint (-1: for ever)",
+    ],
     "cache.fast": [True, bool, "FAST_SAVE option"],
+    "cache.memory": [
+        False,
+        bool,
+        "keep the parsed results of cached requests in memory as well",
+    ],
+    "cache.memory_size": [
+        256,
+        int,
+        "maximum number of results kept in memory",
+    ],
+    "cache.memory_ttl": [
+        300,
+        (int, float),
+        "number of seconds a result is kept in memory",
+    ],
+    "cache.memory_copy": [
+        True,
+        bool,
+        "copy the results kept in memory when storing and returning them. Without copies, hits are faster but the results are shared by the callers and must not be modified",
+    ],
+    "cache.revalidate": [
+        True,
+        bool,
+        "keep the ETag/Last-Modified validators of the responses of the catalog endpoints of the services with their parsed result and revalidate them",
+    ],
+    "cache.validators_size": [
+        128,
+        int,
+        "maximum number of validated results kept in memory",
+    ],
+    "cache.validators_max_size": [
+        10 * 1024 * 1024,
+        int,
+        "maximum size (in bytes) of the responses whose parsed result is kept for revalidation",
+    ],
     "chemspider.token": [
         None,
         (str, type(None)),
@@ -329,6 +502,82 @@ class AgroServicesConfig(ConfigReadOnly):
 
     FAST_SAVE = property(_get_fast_save)
 
+    def _get_cache_dir(self):
+        path = self.params["cache.dir"][0]
+        if path is None:
+            path = self.user_config_dir
+        return path
+
+    def _set_cache_dir(self, value):
+        self.params["cache.dir"][0] = value
+
+    CACHE_DIR = property(_get_cache_dir, _set_cache_dir)
+
+    def _get_cache_backend(self):
+        return self.params["cache.backend"][0]
+
+    def _set_cache_backend(self, value):
+        self.params["cache.backend"][0] = value
+
+    CACHE_BACKEND = property(_get_cache_backend, _set_cache_backend)
+
+    def _get_cache_kv_url(self):
+        return self.params["cache.kv_url"][0]
+
+    def _set_cache_kv_url(self, value):
+        self.params["cache.kv_url"][0] = value
+
+    CACHE_KV_URL = property(_get_cache_kv_url, _set_cache_kv_url)
+
+    def _get_revalidate(self):
+        return self.params["cache.revalidate"][0]
+
+    def _set_revalidate(self, value):
+        self.params["cache.revalidate"][0] = value
+
+    REVALIDATE = property(_get_revalidate, _set_revalidate)
+
+    def _get_validators_size(self):
+        return self.params["cache.validators_size"][0]
+
+    VALIDATORS_SIZE = property(_get_validators_size)
+
+    def _get_validators_max_size(self):
+        return self.params["cache.validators_max_size"][0]
+
+    VALIDATORS_MAX_SIZE = property(_get_validators_max_size)
+
+    def _get_expire_after(self):
+        return self.params["cache.expire_after"][0]
+
+    def _set_expire_after(self, value):
+        self.params["cache.expire_after"][0] = value
+
+    EXPIRE_AFTER = property(_get_expire_after, _set_expire_after)
+
+    def _get_memory_cache(self):
+        return self.params["cache.memory"][0]
+
+    def _set_memory_cache(self, value):
+        self.params["cache.memory"][0] = value
+
+    MEMORY_CACHE = property(_get_memory_cache, _set_memory_cache)
+
+    def _get_memory_cache_size(self):
+        return self.params["cache.memory_size"][0]
+
+    MEMORY_CACHE_SIZE = property(_get_memory_cache_size)
+
+    def _get_memory_cache_ttl(self):
+        return self.params["cache.memory_ttl"][0]
+
+    MEMORY_CACHE_TTL = property(_get_memory_cache_ttl)
+
+    def _get_memory_cache_copy(self):
+        return self.params["cache.memory_copy"][0]
+
+    MEMORY_CACHE_COPY = property(_get_memory_cache_copy)
+
     def _get_async_concurrent(self):
         return self.params["general.async_concurrent"][0]
 
@@ -339,6 +588,38 @@ class AgroServicesConfig(ConfigReadOnly):
 
     ASYNC_THRESHOLD = property(_get_async_threshold)
 
+    def _get_async_backend(self):
+        return self.params["general.async_backend"][0]
+
+    def _set_async_backend(self, value):
+        self.params["general.async_backend"][0] = value
+
+    ASYNC_BACKEND = property(_get_async_backend, _set_async_backend)
+
+    def _get_json_codec(self):
+        return self.params["general.json_codec"][0]
+
+    def _set_json_codec(self, value):
+        self.params["general.json_codec"][0] = value
+
+    JSON_CODEC = property(_get_json_codec, _set_json_codec)
+
+    def _get_offline(self):
+        return self.params["general.offline"][0]
+
+    def _set_offline(self, value):
+        self.params["general.offline"][0] = value
+
+    OFFLINE = property(_get_offline, _set_offline)
+
+    def _get_coalesce(self):
+        return self.params["general.coalesce"][0]
+
+    def _set_coalesce(self, value):
+        self.params["general.coalesce"][0] = value
+
+    COALESCE = property(_get_coalesce, _set_coalesce)
+
     def _get_timeout(self):
         return self.params["general.timeout"][0]
 
@@ -347,6 +628,14 @@ class AgroServicesConfig(ConfigReadOnly):
 
     TIMEOUT = property(_get_timeout, _set_timeout)
 
+    def _get_connect_timeout(self):
+        return self.params["general.connect_timeout"][0]
+
+    def _set_connect_timeout(self, timeout):
+        self.params["general.connect_timeout"][0] = timeout
+
+    CONNECT_TIMEOUT = property(_get_connect_timeout, _set_connect_timeout)
+
     def _get_max_retries(self):
         return self.params["general.max_retries"][0]
 
@@ -354,3 +643,154 @@ class AgroServicesConfig(ConfigReadOnly):
         self.params["general.max_retries"][0] = max_retries
 
     MAX_RETRIES = property(_get_max_retries, _set_max_retries)
+
+    def _get_burst(self):
+        return self.params["general.burst"][0]
+
+    def _set_burst(self, value):
+        self.params["general.burst"][0] = value
+
+    BURST = property(_get_burst, _set_burst)
+
+    def _get_ratelimit_backend(self):
+        return self.params["ratelimit.backend"][0]
+
+    def _set_ratelimit_backend(self, value):
+        self.params["ratelimit.backend"][0] = value
+
+    RATELIMIT_BACKEND = property(_get_ratelimit_backend, _set_ratelimit_backend)
+
+    def _get_ratelimit_path(self):
+        path = self.params["ratelimit.path"][0]
+        if path is None:
+            path = self.user_cache_dir + os.sep + "ratelimit.sqlite"
+        return path
+
+    def _set_ratelimit_path(self, value):
+        self.params["ratelimit.path"][0] = value
+
+    RATELIMIT_PATH = property(_get_ratelimit_path, _set_ratelimit_path)
+
+    def _get_pool_connections(self):
+        value = self.params["http.pool_connections"][0]
+        return self.CONCURRENT if value is None else value
+
+    def _set_pool_connections(self, value):
+        self.params["http.pool_connections"][0] = value
+
+    POOL_CONNECTIONS = property(_get_pool_connections, _set_pool_connections)
+
+    def _get_pool_maxsize(self):
+        value = self.params["http.pool_maxsize"][0]
+        return self.CONCURRENT if value is None else value
+
+    def _set_pool_maxsize(self, value):
+        self.params["http.pool_maxsize"][0] = value
+
+    POOL_MAXSIZE = property(_get_pool_maxsize, _set_pool_maxsize)
+
+    def _get_pool_block(self):
+        return self.params["http.pool_block"][0]
+
+    def _set_pool_block(self, value):
+        self.params["http.pool_block"][0] = value
+
+    POOL_BLOCK = property(_get_pool_block, _set_pool_block)
+
+    def _get_keep_alive(self):
+        return self.params["http.keep_alive"][0]
+
+    def _set_keep_alive(self, value):
+        self.params["http.keep_alive"][0] = value
+
+    KEEP_ALIVE = property(_get_keep_alive, _set_keep_alive)
+
+    def _get_transport(self):
+        return self.params["http.transport"][0]
+
+    def _set_transport(self, value):
+        self.params["http.transport"][0] = value
+
+    TRANSPORT = property(_get_transport, _set_transport)
+
+    def _get_compress_requests(self):
+        return self.params["http.compress_requests"][0]
+
+    def _set_compress_requests(self, value):
+        self.params["http.compress_requests"][0] = value
+
+    COMPRESS_REQUESTS = property(_get_compress_requests, _set_compress_requests)
+
+    def _get_compress_min_size(self):
+        return self.params["http.compress_min_size"][0]
+
+    def _set_compress_min_size(self, value):
+        self.params["http.compress_min_size"][0] = value
+
+    COMPRESS_MIN_SIZE = property(_get_compress_min_size, _set_compress_min_size)
+
+    def _get_breaker_enabled(self):
+        return self.params["breaker.enabled"][0]
+
+    def _set_breaker_enabled(self, value):
+        self.params["breaker.enabled"][0] = value
+
+    BREAKER_ENABLED = property(_get_breaker_enabled, _set_breaker_enabled)
+
+    def _get_breaker_failure_threshold(self):
+        return self.params["breaker.failure_threshold"][0]
+
+    def _set_breaker_failure_threshold(self, value):
+        self.params["breaker.failure_threshold"][0] = value
+
+    BREAKER_FAILURE_THRESHOLD = property(
+        _get_breaker_failure_threshold, _set_breaker_failure_threshold
+    )
+
+    def _get_breaker_reset_timeout(self):
+        return self.params["breaker.reset_timeout"][0]
+
+    def _set_breaker_reset_timeout(self, value):
+        self.params["breaker.reset_timeout"][0] = value
+
+    BREAKER_RESET_TIMEOUT = property(
+        _get_breaker_reset_timeout, _set_breaker_reset_timeout
+    )
+
+    def _get_retry_backoff_factor(self):
+        return self.params["retry.backoff_factor"][0]
+
+    RETRY_BACKOFF_FACTOR = property(_get_retry_backoff_factor)
+
+    def _get_retry_backoff_max(self):
+        return self.params["retry.backoff_max"][0]
+
+    RETRY_BACKOFF_MAX = property(_get_retry_backoff_max)
+
+    def _get_retry_jitter(self):
+        return self.params["retry.jitter"][0]
+
+    RETRY_JITTER = property(_get_retry_jitter)
+
+    def _get_retry_status_forcelist(self):
+        return self.params["retry.status_forcelist"][0]
+
+    RETRY_STATUS_FORCELIST = property(_get_retry_status_forcelist)
+
+    def _get_retry_respect_retry_after(self):
+        return self.params["retry.respect_retry_after"][0]
+
+    RETRY_RESPECT_RETRY_AFTER = property(_get_retry_respect_retry_after)
+
+    def _get_url_probe(self):
+        return self.params["general.url_probe"][0]
+
+    def _set_url_probe(self, value):
+        self.params["general.url_probe"][0] = value
+
+    URL_PROBE = property(_get_url_probe, _set_url_probe)
+
+    def _get_url_probe_ttl(self):
+        return self.params["general.url_probe_ttl"][0]
+
+    URL_PROBE_TTL = property(_get_url_probe_ttl)
@@ -0,0 +1,179 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Phase timings of the requests
+
+The responses of the REST services carry a :class:`RequestTimings` in their
+``timings`` attribute (e.g. ``service.last_response.timings``), splitting the
+time spent by the request into phases, in seconds:
+
+- ``rate_limit``: waiting for the rate limiter
+- ``acquire``: getting a connection from the pool (waiting for a free one if
+  the pool blocks)
+- ``connect``: DNS resolution and TCP connection, when a new connection is
+  opened
+- ``tls``: TLS handshake of new HTTPS connections
+- ``send``: sending the request
+- ``ttfb``: waiting for the headers of the response (time to first byte)
+- ``retry_wait``: waiting between retries
+- ``transfer``: downloading the body of the response (or reading it from the
+  cache, see ``from_cache``)
+- ``decode``: parsing the body (JSON, XML...) and post-processing it
+
+Phases are exclusive (a phase does not count the phases measured during it),
+and summed over the retries of the request. The body of streamed responses
+is downloaded and parsed after the timings are set.
+
+The phases of the network are measured by the connection classes of
+:class:`TimedHTTPAdapter`, the adapter of the default transport of the
+services (see :mod:`~openalea.agroservices.transport`). With
+:class:`~aio.AsyncREST` and the httpx transport, ``ttfb`` includes the
+connection; with the former, ``acquire`` is the wait for a concurrency
+slot.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager, nullcontext
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+__all__ = ["PHASES", "RequestTimings", "TimedHTTPAdapter", "current_timings"]
+
+#: phases of a request, in order
+PHASES = (
+    "rate_limit",
+    "acquire",
+    "connect",
+    "tls",
+    "send",
+    "ttfb",
+    "retry_wait",
+    "transfer",
+    "decode",
+)
+
+_current = contextvars.ContextVar("agroservices_timings", default=None)
+
+
+class RequestTimings:
+    """Time spent by a request in each phase"""
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        #: True if the response came from the cache
+        self.from_cache = False
+        self._accounted = 0.0
+
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+        self._accounted += seconds
+
+    @contextmanager
+    def measure(self, phase):
+        """Add the time spent in the block to *phase*, except the time of
+        the phases measured in the block"""
+        accounted = self._accounted
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add(phase, elapsed - (self._accounted - accounted))
+
+    @contextmanager
+    def recording(self):
+        """Record the phases measured by the connections in the block"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    @property
+    def total(self):
+        return self._accounted
+
+    def __getitem__(self, phase):
+        return self.phases[phase]
+
+    def as_dict(self):
+        return dict(self.phases, total=self.total, from_cache=self.from_cache)
+
+    def __repr__(self):
+        phases = ", ".join(
+            "%s=%.1fms" % (phase, seconds * 1e3)
+            for phase, seconds in self.phases.items()
+            if seconds
+        )
+        return "RequestTimings(%s)" % phases
+
+
+def current_timings():
+    """Return the timings of the request being sent, or None"""
+    return _current.get()
+
+
+def _measure(phase):
+    timings = _current.get()
+    return nullcontext() if timings is None else timings.measure(phase)
+
+
+class _TimedConnection:
+    def _new_conn(self):
+        with _measure("connect"):
+            return super()._new_conn()
+
+    def request(self, *args, **kwargs):
+        with _measure("send"):
+            return super().request(*args, **kwargs)
+
+    def getresponse(self):
+        with _measure("ttfb"):
+            return super().getresponse()
+
+
+class TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    def connect(self):
+        # the TCP connection (_new_conn) is measured apart
+        with _measure("tls"):
+            return super().connect()
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+    def _get_conn(self, timeout=None):
+        with _measure("acquire"):
+            return super()._get_conn(timeout)
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+    def _get_conn(self, timeout=None):
+        with _measure("acquire"):
+            return super()._get_conn(timeout)
+
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTP adapter whose connections measure the phases of the requests"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
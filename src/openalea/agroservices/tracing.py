@@ -0,0 +1,179 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Tracing of the calls to the services
+
+The services open a :class:`Span` around their operations (``REST.get_one``,
+``REST.post_one``, ``REST.http_get`` and ``REST.http_post`` on a list of
+queries, ``IPM.run_model``, ``IPM.get_weatheradapter``, the pages of
+``Phis.get_all_data``...). A span records its duration and attributes
+(endpoint, status, sizes, model id...), and its parent: the span that was
+open when it started, in the same thread or in the caller of a batch. Once
+finished, spans are given to the exporters of the :class:`Tracer`, objects
+with an ``export(span)`` method. Without exporters, no span is created.
+
+    >>> exporter = InMemoryExporter()
+    >>> get_tracer().add_exporter(exporter)
+    >>> ipm.run_model(model, input_data)
+    >>> [(span.name, span.duration) for span in exporter.spans]
+"""
+
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+__all__ = ["Span", "Tracer", "InMemoryExporter", "current_span", "get_tracer"]
+
+_current = contextvars.ContextVar("agroservices_span", default=None)
+_ids = itertools.count(1)
+
+
+class Span:
+    """A timed operation
+
+    :param str name: name of the operation
+    :param dict attributes: its attributes
+    :param Span parent: the span of the enclosing operation
+    """
+
+    def __init__(self, name, attributes=None, parent=None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.span_id = next(_ids)
+        self.trace_id = self.span_id if parent is None else parent.trace_id
+        #: the exception type name if the operation failed
+        self.error = None
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self._end = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        if self._end is None:
+            self._end = time.perf_counter()
+
+    @property
+    def duration(self):
+        """Duration of the operation in seconds (so far if not finished)"""
+        end = time.perf_counter() if self._end is None else self._end
+        return end - self._start
+
+    def as_dict(self):
+        return dict(
+            name=self.name,
+            span_id=self.span_id,
+            trace_id=self.trace_id,
+            parent_id=None if self.parent is None else self.parent.span_id,
+            start_time=self.start_time,
+            duration=self.duration,
+            error=self.error,
+            attributes=dict(self.attributes),
+        )
+
+    def __repr__(self):
+        return "Span(%r, duration=%.3f, %s)" % (
+            self.name,
+            self.duration,
+            self.attributes,
+        )
+
+
+class _NoopSpan:
+    # returned while there are no exporters
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+
+_noop_span = _NoopSpan()
+
+
+class Tracer:
+    """Opens the spans and gives them to its exporters once finished"""
+
+    def __init__(self):
+        self._exporters = ()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self._exporters)
+
+    def add_exporter(self, exporter):
+        with self._lock:
+            self._exporters = self._exporters + (exporter,)
+
+    def remove_exporter(self, exporter):
+        with self._lock:
+            self._exporters = tuple(e for e in self._exporters if e is not exporter)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Context manager timing an operation and yielding its span"""
+        exporters = self._exporters
+        if not exporters:
+            yield _noop_span
+            return
+        span = Span(name, attributes, _current.get())
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            span.error = type(err).__name__
+            raise
+        finally:
+            span.finish()
+            _current.reset(token)
+            for exporter in exporters:
+                exporter.export(span)
+
+
+class InMemoryExporter:
+    """Keeps the finished spans in a list, e.g. for tests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def get_finished_spans(self, name=None):
+        """Return the finished spans, or those named *name*"""
+        with self._lock:
+            return [s for s in self.spans if name is None or s.name == name]
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+
+def current_span():
+    """Return the span of the running operation, or None"""
+    return _current.get()
+
+
+# shared by all the services of the process
+_tracer = Tracer()
+
+
+def get_tracer():
+    """Return the tracer of the process"""
+    return _tracer
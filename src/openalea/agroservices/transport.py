@@ -0,0 +1,497 @@
+# -*- python -*-
+# -*- coding:utf-8 -*-
+#
+#       Copyright 2020 INRAE-CIRAD
+#       Distributed under the Cecill-C License.
+#       See https://cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+# ==============================================================================
+
+"""Transports sending the requests of the services
+
+The sessions of the services send their requests through a transport, the
+requests adapter mounted on them, chosen by the ``http.transport`` setting
+(or the transport argument of :class:`~services.REST`):
+
+- ``requests`` (default): the HTTP adapter of requests, over urllib3
+- ``urllib3``: urllib3 connection pools used directly, skipping the work done
+  by the requests adapter for each request (pool lookup by TLS settings,
+  proxy headers...)
+- ``httpx``: an `httpx <https://www.python-httpx.org>`_ client, that
+  multiplexes the concurrent requests to a host over a single HTTP/2
+  connection when the server supports it (requires the httpx package, and h2
+  for HTTP/2: ``pip install openalea.agroservices[http2]``)
+
+All of them return responses whose ``raw`` attribute is a urllib3 response,
+so that the cache, the retry policies, the metrics and the timings of the
+requests work the same whatever the transport. The httpx transport measures
+the connection, sending and waiting for the headers as ``ttfb``.
+
+Other transports are registered in :data:`TRANSPORTS`.
+:func:`create_session` returns a session sending its requests through a
+transport, for the helpers that are not REST services (e.g.
+:class:`~extern.xmltools.readXML`). ``benchmarks/bench_transports.py``
+compares the transports on the same workload.
+"""
+
+import io
+import os
+import socket
+import ssl
+import threading
+from contextlib import nullcontext
+
+import requests
+import urllib3
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.utils import DEFAULT_CA_BUNDLE_PATH, select_proxy
+from urllib3.exceptions import (
+    ClosedPoolError,
+    ConnectTimeoutError,
+    MaxRetryError,
+    NewConnectionError,
+    ProtocolError,
+    ProxyError,
+    ReadTimeoutError,
+    ResponseError,
+    SSLError,
+)
+from urllib3.util.retry import Retry
+
+from .deadline import current_deadline
+from .timings import (
+    TimedHTTPAdapter,
+    TimedHTTPConnectionPool,
+    TimedHTTPSConnectionPool,
+    current_timings,
+)
+
+__all__ = [
+    "HTTPXTransport",
+    "RequestsTransport",
+    "TRANSPORTS",
+    "Urllib3Transport",
+    "create_session",
+    "create_transport",
+]
+
+
+def _retry(max_retries):
+    if isinstance(max_retries, Retry):
+        return max_retries
+    return Retry(max_retries, read=False)
+
+
+def _timeout(timeout):
+    """Return the (connect, read) timeouts of a requests timeout"""
+    if isinstance(timeout, (tuple, list)):
+        return tuple(timeout)
+    return timeout, timeout
+
+
+class _DeadlineTimeout(urllib3.Timeout):
+    """Timeout of the attempts of a request, each capped by the time left to
+    the deadline of the call
+
+    urllib3 clones the timeout of a request for each attempt, so that
+    retries do not outlive the deadline.
+    """
+
+    def __init__(self, connect, read, deadline):
+        super().__init__(connect=connect, read=read)
+        self.deadline = deadline
+
+    def clone(self):
+        connect, read = self.deadline.bound((self._connect, self._read))
+        return urllib3.Timeout(connect=connect, read=read)
+
+
+def _urllib3_timeout(timeout):
+    """Return the urllib3 Timeout of a requests timeout, capped by the
+    deadline of the call (if any) at each attempt"""
+    connect, read = _timeout(timeout)
+    deadline = current_deadline()
+    if deadline is None:
+        return urllib3.Timeout(connect=connect, read=read)
+    return _DeadlineTimeout(connect, read, deadline)
+
+
+def _requests_error(err, request):
+    """Return the requests exception matching a urllib3 exception, as raised
+    by the requests adapter"""
+    exceptions = requests.exceptions
+    if isinstance(err, MaxRetryError):
+        reason = err.reason
+        if isinstance(reason, ConnectTimeoutError) and not isinstance(
+            reason, NewConnectionError
+        ):
+            cls = exceptions.ConnectTimeout
+        elif isinstance(reason, ResponseError):
+            cls = exceptions.RetryError
+        elif isinstance(reason, ProxyError):
+            cls = exceptions.ProxyError
+        elif isinstance(reason, SSLError):
+            cls = exceptions.SSLError
+        else:
+            cls = exceptions.ConnectionError
+    elif isinstance(err, SSLError):
+        cls = exceptions.SSLError
+    elif isinstance(err, ReadTimeoutError):
+        cls = exceptions.ReadTimeout
+    elif isinstance(err, ConnectTimeoutError) and not isinstance(
+        err, NewConnectionError
+    ):
+        cls = exceptions.ConnectTimeout
+    else:
+        cls = exceptions.ConnectionError
+    return cls(err, request=request)
+
+
+class RequestsTransport(TimedHTTPAdapter):
+    """The HTTP adapter of requests (see :class:`~timings.TimedHTTPAdapter`)"""
+
+    def send(self, request, stream=False, timeout=None, *args, **kwargs):
+        timeout = _urllib3_timeout(timeout)
+        return super().send(request, stream, timeout, *args, **kwargs)
+
+
+class Urllib3Transport(BaseAdapter):
+    """Sends the requests with urllib3 connection pools
+
+    :param int pool_connections: number of hosts whose connections are pooled
+    :param int pool_maxsize: maximum number of connections kept per host
+    :param max_retries: a urllib3 Retry, or a number of retries
+    :param bool pool_block: wait for a free connection when a pool is full
+    """
+
+    def __init__(
+        self, pool_connections=10, pool_maxsize=10, max_retries=0, pool_block=False
+    ):
+        super().__init__()
+        self.max_retries = _retry(max_retries)
+        self._pool_options = dict(
+            num_pools=pool_connections, maxsize=pool_maxsize, block=pool_block
+        )
+        self.poolmanager = urllib3.PoolManager(**self._pool_options)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+        self._proxy_managers = {}
+        self._lock = threading.Lock()
+
+    def _manager(self, proxy):
+        if proxy is None:
+            return self.poolmanager
+        with self._lock:
+            manager = self._proxy_managers.get(proxy)
+            if manager is None:
+                manager = self._proxy_managers[proxy] = urllib3.proxy_from_url(
+                    proxy, **self._pool_options
+                )
+            return manager
+
+    @staticmethod
+    def _pool_kwargs(url, verify, cert):
+        if not url.lower().startswith("https"):
+            return {}
+        kwargs = {"cert_reqs": "CERT_REQUIRED" if verify else "CERT_NONE"}
+        if verify is True:
+            kwargs["ca_certs"] = DEFAULT_CA_BUNDLE_PATH
+        elif isinstance(verify, str):
+            key = "ca_cert_dir" if os.path.isdir(verify) else "ca_certs"
+            kwargs[key] = verify
+        if cert:
+            if isinstance(cert, str):
+                kwargs["cert_file"] = cert
+            else:
+                kwargs["cert_file"], kwargs["key_file"] = cert
+        return kwargs
+
+    def send(
+        self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
+    ):
+        proxy = select_proxy(request.url, proxies)
+        try:
+            pool = self._manager(proxy).connection_from_url(
+                request.url, pool_kwargs=self._pool_kwargs(request.url, verify, cert)
+            )
+        except urllib3.exceptions.LocationValueError as err:
+            raise requests.exceptions.InvalidURL(err, request=request)
+        url = request.url if proxy and not request.url.startswith("https") else None
+        try:
+            response = pool.urlopen(
+                method=request.method,
+                url=url or request.path_url,
+                body=request.body,
+                headers=request.headers,
+                redirect=False,
+                assert_same_host=False,
+                preload_content=False,
+                decode_content=False,
+                retries=self.max_retries,
+                timeout=_urllib3_timeout(timeout),
+                chunked=not (
+                    request.body is None or "Content-Length" in request.headers
+                ),
+            )
+        except (ProtocolError, OSError) as err:
+            raise requests.exceptions.ConnectionError(err, request=request)
+        except (MaxRetryError, ClosedPoolError, SSLError, ReadTimeoutError) as err:
+            raise _requests_error(err, request)
+        return HTTPAdapter.build_response(self, request, response)
+
+    def close(self):
+        self.poolmanager.clear()
+        for manager in self._proxy_managers.values():
+            manager.clear()
+
+
+class _HTTPXBody(io.RawIOBase):
+    # raw (undecoded) body of an httpx response, read by a urllib3 response
+    def __init__(self, response):
+        self._response = response
+        self._chunks = response.iter_raw()
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        import httpx
+
+        try:
+            while not self._buffer:
+                self._buffer = next(self._chunks, None)
+                if self._buffer is None:
+                    self._buffer = b""
+                    self.close()
+                    return 0
+        except httpx.TimeoutException as err:
+            raise socket.timeout(str(err)) from err
+        except httpx.TransportError as err:
+            raise OSError(str(err)) from err
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._response.close()
+        super().close()
+
+
+def _urllib3_error(err, url):
+    """Return the urllib3 exception matching an httpx exception, so that
+    the urllib3 Retry classifies it"""
+    import httpx
+
+    if isinstance(err, httpx.ConnectTimeout):
+        return ConnectTimeoutError(str(err))
+    if isinstance(err, httpx.ConnectError):
+        return NewConnectionError(url, str(err))
+    if isinstance(err, httpx.ProxyError):
+        return ProxyError(str(err), err)
+    if isinstance(err, httpx.TimeoutException):
+        return ReadTimeoutError(None, url, str(err))
+    return ProtocolError(str(err), err)
+
+
+class HTTPXTransport(BaseAdapter):
+    """Sends the requests with an httpx client, over HTTP/2 if available
+
+    The parameters are those of :class:`Urllib3Transport`, except that
+    httpx pools the connections of all hosts together: pool_maxsize is the
+    number of connections kept alive, and the maximum number of connections
+    if pool_block is True.
+
+    :param bool http2: negotiate HTTP/2 with the servers (default: True if
+        the h2 package is installed)
+    """
+
+    def __init__(
+        self,
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=0,
+        pool_block=False,
+        http2=None,
+    ):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError(
+                "HTTPXTransport requires httpx: "
+                "pip install openalea.agroservices[http2]"
+            )
+        super().__init__()
+        if http2 is None:
+            try:
+                import h2
+            except ImportError:
+                http2 = False
+            else:
+                http2 = True
+        self.http2 = http2
+        self.max_retries = _retry(max_retries)
+        self._limits = httpx.Limits(
+            max_connections=pool_maxsize if pool_block else None,
+            max_keepalive_connections=pool_maxsize,
+        )
+        # clients by TLS settings and proxy, fixed when a client is created
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ssl_context(verify, cert):
+        if verify is False:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        elif isinstance(verify, str) and os.path.isdir(verify):
+            context = ssl.create_default_context(capath=verify)
+        else:
+            cafile = DEFAULT_CA_BUNDLE_PATH if verify is True else verify
+            context = ssl.create_default_context(cafile=cafile)
+        if cert:
+            context.load_cert_chain(*((cert,) if isinstance(cert, str) else cert))
+        return context
+
+    def _client(self, verify, cert, proxy):
+        import httpx
+
+        key = (verify, cert if isinstance(cert, str) else tuple(cert or ()), proxy)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = httpx.Client(
+                    http2=self.http2,
+                    limits=self._limits,
+                    verify=self._ssl_context(verify, cert),
+                    proxy=proxy,
+                    trust_env=False,
+                )
+            return client
+
+    def _urlopen(self, client, request, timeout):
+        import httpx
+
+        body = request.body
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        built = client.build_request(
+            request.method,
+            request.url,
+            headers=list(request.headers.items()),
+            content=body,
+            timeout=timeout,
+        )
+        timings = current_timings()
+        try:
+            with nullcontext() if timings is None else timings.measure("ttfb"):
+                response = client.send(built, stream=True)
+        except httpx.TransportError as err:
+            raise _urllib3_error(err, request.url) from err
+        headers = urllib3.HTTPHeaderDict()
+        for name, value in response.headers.multi_items():
+            headers.add(name, value)
+        return urllib3.HTTPResponse(
+            body=_HTTPXBody(response),
+            headers=headers,
+            status=response.status_code,
+            version=20 if response.http_version == "HTTP/2" else 11,
+            reason=response.reason_phrase,
+            preload_content=False,
+            decode_content=False,
+            request_method=request.method,
+            request_url=request.url,
+        )
+
+    def send(
+        self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
+    ):
+        import httpx
+
+        client = self._client(verify, cert, select_proxy(request.url, proxies))
+        timeout = _urllib3_timeout(timeout)
+        method, retries = request.method, self.max_retries
+        # the retry loop of urllib3 connection pools
+        while True:
+            # capped by the deadline at each attempt, as urllib3 does
+            attempt = timeout.clone()
+            connect, read = attempt.connect_timeout, attempt.read_timeout
+            try:
+                response = self._urlopen(
+                    client,
+                    request,
+                    httpx.Timeout(connect=connect, read=read, write=read, pool=connect),
+                )
+            except (
+                ConnectTimeoutError,
+                ProtocolError,
+                ProxyError,
+                ReadTimeoutError,
+            ) as err:
+                try:
+                    retries = retries.increment(
+                        method, request.url, error=err, _pool="httpx"
+                    )
+                except (MaxRetryError, type(err)) as error:
+                    raise _requests_error(error, request) from err
+                retries.sleep()
+                continue
+            has_retry_after = "Retry-After" in response.headers
+            if retries.is_retry(method, response.status, has_retry_after):
+                try:
+                    retries = retries.increment(
+                        method, request.url, response=response, _pool="httpx"
+                    )
+                except MaxRetryError as err:
+                    if retries.raise_on_status:
+                        response.drain_conn()
+                        raise _requests_error(err, request)
+                else:
+                    response.drain_conn()
+                    retries.sleep(response)
+                    continue
+            response.retries = retries
+            return HTTPAdapter.build_response(self, request, response)
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            client.close()
+
+
+#: transports by name
+TRANSPORTS = {
+    "requests": RequestsTransport,
+    "urllib3": Urllib3Transport,
+    "httpx": HTTPXTransport,
+}
+
+
+def create_transport(name="requests", **kwargs):
+    """Return a transport of :data:`TRANSPORTS`, created with kwargs (see
+    :class:`Urllib3Transport`)"""
+    try:
+        cls = TRANSPORTS[name]
+    except KeyError:
+        raise ValueError(
+            "Unknown transport %r. Use one of %s" % (name, ", ".join(TRANSPORTS))
+        )
+    return cls(**kwargs)
+
+
+def create_session(transport="requests", **kwargs):
+    """Return a requests session sending its requests through a transport
+
+    :param str transport: name of the transport, see :data:`TRANSPORTS`
+    """
+    session = requests.Session()
+    adapter = create_transport(transport, **kwargs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -0,0 +1,117 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+import requests_cache
+
+from openalea.agroservices.breaker import get_circuit_breakers
+from openalea.agroservices.ratelimit import get_rate_limiter
+
+
+class LocalServer:
+    """A local HTTP server whose routes are set by the tests
+
+    A route is a function called with the request handler and returning a
+    (status, headers, body) tuple. Unknown paths answer a JSON echo of the
+    request.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                path = urlparse(self.path).path
+                length = int(self.headers.get("Content-Length") or 0)
+                self.body = self.rfile.read(length) if length else b""
+                with server.lock:
+                    server.hits[path] = server.hits.get(path, 0) + 1
+                route = server.routes.get(path, server.echo)
+                status, headers, body = route(self)
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                elif isinstance(body, str):
+                    body = body.encode()
+                self.send_response(status)
+                headers = dict(headers)
+                headers.setdefault("Content-Type", "application/json")
+                headers["Content-Length"] = str(len(body))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = "http://127.0.0.1:%d" % self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def echo(handler):
+        return (
+            200,
+            {},
+            {
+                "method": handler.command,
+                "path": handler.path,
+                "headers": dict(handler.headers),
+                "body": handler.body.decode("latin-1"),
+            },
+        )
+
+    def reset(self):
+        self.routes.clear()
+        self.hits.clear()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(scope="session")
+def _local_server():
+    server = LocalServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def server(_local_server):
+    _local_server.reset()
+    yield _local_server
+    _local_server.reset()
+
+
+@pytest.fixture(autouse=True)
+def _uninstall_cache():
+    # REST(cache=True) patches requests globally
+    yield
+    requests_cache.uninstall_cache()
+
+
+@pytest.fixture(autouse=True)
+def _reset_circuit_breakers():
+    # the breakers are shared by the process: failures must not leak
+    # between the tests using the local server
+    get_circuit_breakers().reset()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def _reset_rate_limiter():
+    # the buckets keep the strictest rate asked for the local server
+    get_rate_limiter().reset()
+    yield
@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from openalea.agroservices.deadline import DeadlineExceeded
+from openalea.agroservices.ratelimit import LocalRateLimiter, RateLimiter
+from openalea.agroservices.retry import RetryPolicy
+from openalea.agroservices.services import AgroServicesError, CircuitOpenError
+
+pytest.importorskip("aiohttp")
+from openalea.agroservices.aio import AsyncREST
+
+
+def test_concurrent_get(server):
+    server.routes["/slow"] = lambda handler: (time.sleep(0.3), (200, {}, [1]))[1]
+
+    async def main():
+        async with AsyncREST(
+            "test", url=server.url, verbose=False, requests_per_sec=100, burst=20
+        ) as s:
+            start = time.monotonic()
+            res = await s.ahttp_get(["slow"] * 10 + ["echo"])
+            return res, time.monotonic() - start
+
+    res, elapsed = asyncio.run(main())
+    assert res[:10] == [[1]] * 10
+    assert res[10]["path"] == "/echo"
+    assert elapsed < 2  # 3 s if sequential
+
+
+def test_deadline(server):
+    server.routes["/slow"] = lambda handler: (time.sleep(1), (200, {}, [1]))[1]
+
+    async def main():
+        async with AsyncREST(
+            "test", url=server.url, verbose=False, requests_per_sec=100
+        ) as s:
+            start = time.monotonic()
+            res = await s.ahttp_get(["slow", "echo"], deadline=0.3)
+            return res, time.monotonic() - start
+
+    (slow, echo), elapsed = asyncio.run(main())
+    assert elapsed < 0.9
+    assert isinstance(slow, AgroServicesError)
+    assert isinstance(slow.value, DeadlineExceeded)
+    assert slow.query == "slow"
+    assert echo["path"] == "/echo"
+
+
+def test_breaker_trial_not_lost(server):
+    async def main():
+        s = AsyncREST(
+            "test",
+            url=server.url,
+            verbose=False,
+            requests_per_sec=0.5,
+            burst=1,
+            rate_limiter=LocalRateLimiter(),
+        )
+        breaker = s._get_circuit_breaker(server.url)
+        breaker.half_open_max = 1
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        breaker._opened_at -= breaker.reset_timeout  # half-open now
+        await s._acalls(server.url)  # spend the token of the bucket
+        with pytest.raises(DeadlineExceeded):
+            await s.aget_one("echo", deadline=0.3)
+        return breaker
+
+    breaker = asyncio.run(main())
+    assert breaker.state == "half-open"
+    assert breaker.allow()  # the trial is still available
+
+
+def test_post_and_rate_limit(server):
+    async def main():
+        s = AsyncREST(
+            "test",
+            url=server.url,
+            verbose=False,
+            requests_per_sec=20,
+            rate_limiter=LocalRateLimiter(),
+        )
+        start = time.monotonic()
+        res = await asyncio.gather(
+            *(s.ahttp_post("post", data="x=%d" % i, frmt="json") for i in range(5))
+        )
+        await s.aclose()
+        return res, time.monotonic() - start
+
+    res, elapsed = asyncio.run(main())
+    assert sorted(r["body"] for r in res) == ["x=%d" % i for i in range(5)]
+    assert elapsed >= 4 / 20 - 0.02
+
+
+def test_shares_cache_with_rest(server, tmp_path):
+    async def main():
+        async with AsyncREST("test", url=server.url, verbose=False, cache=True) as s:
+            s.CACHE_NAME = str(tmp_path / "cache")
+            s._session = None
+            first = await s.aget_one("cached")
+            second = s.get_one("cached")
+            return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert server.hits["/cached"] == 1
+
+
+def test_cache_off_the_loop(server, tmp_path):
+    threads = []
+
+    async def main():
+        async with AsyncREST("test", url=server.url, verbose=False, cache=True) as s:
+            s.CACHE_NAME = str(tmp_path / "cache")
+            s._session = s._cache_backend = None
+            cache = s.session.cache
+            for name in ("get_response", "save_response"):
+                method = getattr(cache, name)
+
+                def spy(*args, _method=method, **kwargs):
+                    threads.append(threading.current_thread())
+                    return _method(*args, **kwargs)
+
+                setattr(cache, name, spy)
+            await s.aget_one("cached")
+            await s.aget_one("cached")
+
+    asyncio.run(main())
+    assert len(threads) == 3  # miss, save, hit
+    assert threading.main_thread() not in threads
+
+
+def test_retry(server):
+    def flaky(handler):
+        if server.hits["/flaky"] < 3:
+            return 503, {"Retry-After": "0"}, {}
+        return 200, {}, {"ok": True}
+
+    server.routes["/flaky"] = flaky
+    server.routes["/down/post"] = lambda handler: (503, {}, {})
+
+    async def main():
+        async with AsyncREST(
+            "test",
+            url=server.url,
+            verbose=False,
+            requests_per_sec=100,
+            retry=RetryPolicy(total=3, backoff_factor=0, jitter=0),
+            retry_policies={"down": RetryPolicy(total=0)},
+        ) as s:
+            res = await s.aget_one("flaky")
+            server.hits.clear()
+            # POST is not idempotent: no retry on status
+            post = await s.ahttp_post("flaky", frmt="json")
+            down = await s.aget_one("down/post")
+            return s, res, post, down
+
+    s, res, post, down = asyncio.run(main())
+    assert res == {"ok": True}
+    assert s.retry_stats.retries == 2
+    assert s.retry_stats.causes == {"503": 2}
+    assert post == 503
+    assert server.hits["/flaky"] == 1
+    assert down == 503
+    assert server.hits["/down/post"] == 1
+
+
+def test_retry_connection_error():
+    async def main():
+        async with AsyncREST(
+            "test",
+            url="http://127.0.0.1:1",
+            verbose=False,
+            requests_per_sec=100,
+            retry=RetryPolicy(total=2, backoff_factor=0, jitter=0),
+        ) as s:
+            return s, await s.aget_one("refused")
+
+    s, res = asyncio.run(main())
+    assert res is None
+    assert s.retry_stats.retries == 2
+    assert s.retry_stats.exhausted == 1
+
+
+def test_rate_limiter_off_the_loop(server):
+    class Limiter(RateLimiter):
+        def reserve(self, key, rate, burst=1):
+            self.thread = threading.current_thread()
+            return 0.0
+
+    async def main():
+        s = AsyncREST(
+            "test",
+            url=server.url,
+            verbose=False,
+            requests_per_sec=10,
+            rate_limiter=Limiter(),
+        )
+        await s._acalls(server.url)
+        return s.rate_limiter.thread
+
+    assert asyncio.run(main()) is not threading.current_thread()
+
+
+def test_circuit_open_skips_rate_limit(server):
+    async def main():
+        async with AsyncREST(
+            "test",
+            url=server.url,
+            verbose=False,
+            requests_per_sec=2,
+            rate_limiter=LocalRateLimiter(),
+        ) as s:
+            breaker = s._get_circuit_breaker(server.url)
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+            start = time.monotonic()
+            for _ in range(4):
+                with pytest.raises(CircuitOpenError):
+                    await s.aget_one("echo")
+            return s, time.monotonic() - start
+
+    s, elapsed = asyncio.run(main())
+    assert elapsed < 0.5
+    assert s.rate_limiter.reserve(s._rate_key(server.url), 2) == 0.0
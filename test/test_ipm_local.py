@@ -0,0 +1,71 @@
+from openalea.agroservices.ipm.ipm import IPM, load_model
+from openalea.agroservices.tracing import InMemoryExporter, Tracer
+
+
+def test_warm_cache(server, tmp_path):
+    server.routes["/api/wx/rest/weatherdatasource"] = lambda handler: (
+        200,
+        {},
+        [{"id": "ie.gov.data", "spatial": {}, "endpoint": ""}],
+    )
+    server.routes["/api/dss/rest/dss"] = lambda handler: (
+        200,
+        {},
+        [{"id": "dss", "models": [{"id": "MODEL", "execution": {"type": "LINK"}}]}],
+    )
+    server.routes["/api/dss/rest/model/dss/MODEL"] = lambda handler: (
+        200,
+        {},
+        {"id": "MODEL", "execution": {"type": "LINK"}},
+    )
+    server.routes["/api/wx/rest/qc"] = lambda handler: (500, {}, {})
+    ipm = IPM(
+        url=server.url,
+        verbose=False,
+        cache=True,
+        cache_dir=str(tmp_path),
+        requests_per_sec=1000,
+        burst=50,
+        retry=0,
+    )
+    errors = ipm.warm_cache(models=True)
+    assert errors == {"get_qc": "HTTP status 500"}
+    assert server.hits["/api/dss/rest/model/dss/MODEL/input_schema"] == 1
+    assert ipm.CACHE_NAME.startswith(str(tmp_path))
+
+    ipm.get_dss()
+    ipm.get_schema_dss()
+    assert server.hits["/api/dss/rest/dss"] == 1
+    assert server.hits["/api/dss/rest/schema/dss"] == 1
+
+
+def test_run_model_span(server):
+    tracer = Tracer()
+    exporter = InMemoryExporter()
+    tracer.add_exporter(exporter)
+    ipm = IPM(url=server.url, verbose=False, tracer=tracer)
+    model = {
+        "id": "MODEL",
+        "execution": {"type": "ONLINE", "endpoint": server.url + "/run/MODEL"},
+    }
+    model = load_model("DSS", model)
+    ipm.run_model(model, {"x": 1})
+    run, post = exporter.get_finished_spans("IPM.run_model")[0], exporter.spans[0]
+    assert run.attributes["dss_id"] == "DSS"
+    assert run.attributes["model_id"] == "MODEL"
+    assert run.attributes["payload_size"] == len(ipm.codec.dumps({"x": 1}))
+    assert post.name == "REST.post_one"
+    assert post.parent is run
+
+
+def test_run_models(server):
+    ipm = IPM(url=server.url, verbose=False)
+    models = [
+        {"id": m, "execution": {"type": "ONLINE", "endpoint": server.url + "/run/" + m}}
+        for m in ("A", "B")
+    ]
+    models.insert(1, {"execution": {"type": "LINK", "endpoint": "http://dss"}})
+    res = ipm.run_models(models, [{"x": 1}, None, {"x": 2}])
+    assert [r["path"] for r in res[::2]] == ["/run/A", "/run/B"]
+    assert [ipm.codec.loads(r["body"]) for r in res[::2]] == [{"x": 1}, {"x": 2}]
+    assert res[1].endswith("http://dss")
@@ -1,3 +1,4 @@
+import pytest
 import requests
 from openalea.agroservices.phis import Phis
 
@@ -38,3 +39,97 @@ def test_ws_experiments():
         experiment_uri="m3p:id/experiment/g2was2022", session_id=token
     )
     print(data)
+
+
+def test_transport(server):
+    from openalea.agroservices.metrics import MetricsRegistry
+    from openalea.agroservices.transport import Urllib3Transport
+
+    registry = MetricsRegistry()
+    phis = Phis(
+        url=server.url + "/", verbose=False, transport="urllib3", metrics=registry
+    )
+    assert isinstance(phis.session.get_adapter(server.url), Urllib3Transport)
+    response = phis.get("echo", pageSize=10)
+    assert response.json()["path"] == "/echo?pageSize=10"
+    labels = dict(service="Phis", endpoint="echo", method="GET", status=200)
+    assert phis.request_metrics.requests.value(**labels) == 1
+
+
+def test_iter_all_data(server):
+    from openalea.agroservices.ratelimit import RateLimiter
+
+    class Limiter(RateLimiter):
+        calls = 0
+
+        def reserve(self, key, rate, burst=1):
+            self.calls += 1
+            return 0.0
+
+    def items(handler):
+        page = int(handler.path.split("page=")[1].split("&")[0])
+        pagination = {"totalPages": 2, "currentPage": page}
+        data = [{"id": "%d.%d" % (page, i)} for i in range(3)]
+        return (
+            200,
+            {},
+            {"metadata": {"pagination": pagination}, "result": {"data": data}},
+        )
+
+    server.routes["/items"] = items
+    server.routes["/error"] = lambda handler: (500, {}, {"result": {"data": []}})
+    phis = Phis(url=server.url + "/", verbose=False, rate_limiter=Limiter(), retry=0)
+    responses = []
+    send = phis._send
+
+    def record(*args, **kwargs):
+        responses.append(send(*args, **kwargs))
+        return responses[-1]
+
+    phis._send = record
+
+    res = list(phis.iter_all_data("items"))
+    assert [item["id"] for item in res] == ["0.0", "0.1", "0.2", "1.0", "1.1", "1.2"]
+    assert phis.rate_limiter.calls == 2
+    assert server.hits["/items"] == 2
+
+    # the streamed response is closed when the caller stops iterating
+    pages = phis.iter_all_data("items")
+    next(pages)
+    pages.close()
+    assert responses[-1].raw.closed
+
+    with pytest.raises(Exception, match="Server error"):
+        next(phis.iter_all_data("error"))
+    assert responses[-1].raw.closed
+
+
+def test_not_cached(server, tmp_path):
+    phis = Phis(
+        url=server.url + "/", verbose=False, cache=True, cache_dir=str(tmp_path)
+    )
+    for _ in range(2):
+        response = phis.get("security/authenticate", username="user", password="secret")
+        assert not response.from_cache
+        phis.get("projects")
+    assert server.hits["/security/authenticate"] == 2
+    assert server.hits["/projects"] == 2
+    assert len(phis.session.cache.responses) == 0
+
+
+def test_timeout_within_deadline(server):
+    from openalea.agroservices.deadline import Deadline
+
+    phis = Phis(url=server.url + "/", verbose=False)
+    timeouts = []
+    send = phis._send
+
+    def record(*args, **kwargs):
+        timeouts.append(kwargs["timeout"])
+        return send(*args, **kwargs)
+
+    phis._send = record
+    with Deadline(2):
+        phis.get("echo", timeout=10.0)
+    connect, read = timeouts[0]
+    assert connect <= 2 and read <= 2
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from openalea.agroservices.deadline import Deadline, DeadlineExceeded
+from openalea.agroservices.ratelimit import (
+    LocalRateLimiter,
+    SharedRateLimiter,
+    TokenBucket,
+)
+from openalea.agroservices.services import REST
+
+
+def test_token_bucket_burst():
+    bucket = TokenBucket(rate=10, burst=3)
+    delays = [bucket.reserve() for _ in range(5)]
+    assert delays[:3] == [0.0, 0.0, 0.0]
+    assert 0.05 < delays[3] <= 0.1
+    assert 0.15 < delays[4] <= 0.2
+
+
+def test_limiter_is_thread_safe():
+    limiter = LocalRateLimiter()
+    start = time.monotonic()
+
+    def call():
+        for _ in range(3):
+            limiter.acquire("host", rate=50, burst=1)
+
+    threads = [threading.Thread(target=call) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 30 requests at 50 per second, the first one being free
+    assert time.monotonic() - start >= 29 / 50 - 0.02
+
+
+def test_limiter_respects_deadline():
+    limiter = LocalRateLimiter()
+    limiter.acquire("host", rate=1, burst=1)
+    start = time.monotonic()
+    with Deadline(0.5):
+        with pytest.raises(DeadlineExceeded):
+            limiter.acquire("host", rate=1, burst=1)
+    # no sleep beyond the deadline
+    assert time.monotonic() - start < 0.1
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_token_given_back_on_deadline(shared, tmp_path):
+    if shared:
+        limiter = SharedRateLimiter(str(tmp_path / "ratelimit.sqlite"))
+    else:
+        limiter = LocalRateLimiter()
+    limiter.acquire("host", rate=2, burst=1)
+    for _ in range(3):
+        with Deadline(0.1):
+            with pytest.raises(DeadlineExceeded):
+                limiter.acquire("host", rate=2, burst=1)
+    # the next turn is still the one after the first request
+    assert limiter.reserve("host", rate=2, burst=1) <= 0.5
+
+
+@pytest.mark.parametrize("shared", [False, True])
+def test_strictest_limit_wins(shared, tmp_path):
+    if shared:
+        limiter = SharedRateLimiter(str(tmp_path / "ratelimit.sqlite"))
+    else:
+        limiter = LocalRateLimiter()
+    limiter.acquire("host", rate=1, burst=1)
+    # a laxer limit for the same host shares the budget of the strict one
+    assert limiter.reserve("host", rate=100, burst=5) > 0.9
+    limiter.acquire("other", rate=100, burst=5)
+    # a stricter one applies to the callers of the laxer one as well
+    limiter.acquire("other", rate=1, burst=1)
+    assert limiter.reserve("other", rate=100, burst=5) > 0.9
+
+
+def test_limiter_shared_by_instances(server):
+    limiter = LocalRateLimiter()
+    a = REST(
+        "a", url=server.url, verbose=False, requests_per_sec=20, rate_limiter=limiter
+    )
+    b = REST(
+        "b", url=server.url, verbose=False, requests_per_sec=20, rate_limiter=limiter
+    )
+    start = time.monotonic()
+    for _ in range(5):
+        a.get_one("a")
+        b.get_one("b")
+    assert time.monotonic() - start >= 9 / 20 - 0.02
+
+
+def _shared_worker(path, n):
+    from openalea.agroservices.ratelimit import SharedRateLimiter
+
+    limiter = SharedRateLimiter(path)
+    for _ in range(n):
+        limiter.acquire("host", rate=40, burst=1)
+
+
+def test_shared_limiter_across_processes(tmp_path):
+    import multiprocessing
+
+    path = str(tmp_path / "ratelimit.sqlite")
+    start = time.monotonic()
+    workers = [
+        multiprocessing.Process(target=_shared_worker, args=(path, 5)) for _ in range(4)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert all(w.exitcode == 0 for w in workers)
+    # 20 requests at 40 per second for all the processes together
+    assert time.monotonic() - start >= 19 / 40 - 0.02
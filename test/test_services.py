@@ -0,0 +1,872 @@
+import gzip
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from openalea.agroservices.breaker import CircuitBreaker
+from openalea.agroservices.cachebackends import BACKENDS
+from openalea.agroservices.codec import get_codec
+from openalea.agroservices.deadline import Deadline
+from openalea.agroservices.memcache import MemoryCache, copy_value
+from openalea.agroservices.metrics import MetricsRegistry
+from openalea.agroservices.probe import URLProbe
+from openalea.agroservices.ratelimit import LocalRateLimiter
+from openalea.agroservices.retry import RetryPolicy
+from openalea.agroservices.settings import AgroServicesConfig
+from openalea.agroservices.tracing import InMemoryExporter, Tracer
+from openalea.agroservices.transport import TRANSPORTS
+from openalea.agroservices.services import (
+    REST,
+    AgroServicesError,
+    CacheMissError,
+    CircuitOpenError,
+    DeadlineExceeded,
+)
+
+
+def test_probe_shared_between_instances(tmp_path, server):
+    probe = URLProbe(str(tmp_path / "probes.json"), ttl=60)
+    status = probe.check(server.url)
+    assert status["reachable"] is True
+    # another probe reading the same file reuses the result
+    other = URLProbe(str(tmp_path / "probes.json"), ttl=60)
+    assert other.status(server.url)["checked"] == status["checked"]
+    assert server.hits["/"] == 1
+
+
+def test_probe_unreachable(tmp_path):
+    probe = URLProbe(str(tmp_path / "probes.json"), ttl=60, timeout=1)
+    assert probe.check("http://127.0.0.1:1", wait=False) is None
+    status = probe.wait("http://127.0.0.1:1")
+    assert status["reachable"] is False
+    assert status["error"] is not None
+
+
+def test_construction_does_not_wait_for_probe(server):
+    server.routes["/slow"] = lambda handler: (time.sleep(1), (200, {}, {}))[1]
+    start = time.time()
+    s = REST("test", url=server.url + "/slow", verbose=False)
+    assert time.time() - start < 0.5
+    assert s.url_status()["reachable"] is True
+    assert s.reachable is True
+
+
+def test_connection_pool_settings(server):
+    s = REST("test", url=server.url, verbose=False)
+    adapter = s.session.get_adapter(server.url)
+    assert adapter._pool_maxsize == s.settings.CONCURRENT
+    assert adapter._pool_connections == s.settings.CONCURRENT
+
+    s = REST("test", url=server.url, verbose=False, pool_maxsize=4, keep_alive=False)
+    adapter = s.session.get_adapter(server.url)
+    assert adapter._pool_maxsize == 4
+    res = s.get_one("echo")
+    assert res["headers"]["Connection"] == "close"
+
+
+def test_http_get_list_with_threads(server):
+    server.routes["/slow"] = lambda handler: (time.sleep(0.2), (200, {}, [1]))[1]
+    s = REST(
+        "test", url=server.url, verbose=False, requests_per_sec=1000, burst=50, retry=0
+    )
+    s.settings.ASYNC_BACKEND = "threads"
+    queries = ["slow"] * 15 + ["echo", "http://127.0.0.1:1/down"]
+    start = time.monotonic()
+    res = s.http_get(queries)
+    assert time.monotonic() - start < 1
+    assert res[:15] == [[1]] * 15
+    assert res[15]["path"] == "/echo"
+    assert isinstance(res[16], AgroServicesError)
+    assert res[16].query == "http://127.0.0.1:1/down"
+
+
+def test_http_post_list(server):
+    def slow(handler):
+        time.sleep(0.2)
+        return 200, {}, {"path": handler.path, "body": handler.body.decode()}
+
+    server.routes["/slow"] = server.routes["/other"] = slow
+    s = REST("test", url=server.url, verbose=False, requests_per_sec=1000, burst=50)
+    start = time.monotonic()
+    res = s.http_post("slow", frmt="json", data=["p%d" % i for i in range(10)])
+    assert time.monotonic() - start < 1
+    assert [r["body"] for r in res] == ["p%d" % i for i in range(10)]
+
+    res = s.http_post(["slow", "other"], frmt="json", data=["a", "b"])
+    assert [(r["path"], r["body"]) for r in res] == [("/slow", "a"), ("/other", "b")]
+    res = s.post_one(["slow", "other"], data="same")
+    assert [r["body"] for r in res] == ["same", "same"]
+    # a list of form tuples is a single payload
+    assert s.post_one("slow", data=[("k", "v")])["body"] == "k=v"
+    with pytest.raises(ValueError):
+        s.http_post(["slow", "other"], data=["a", "b", "c"])
+
+
+def test_stream_json_items(server):
+    doc = {
+        "interval": 3600,
+        "locationWeatherData": [{"data": [[i, i + 0.5] for i in range(1000)]}],
+    }
+    server.routes["/weather"] = lambda handler: (200, {}, doc)
+    s = REST("test", url=server.url, verbose=False)
+    s.STREAM_CHUNK_SIZE = 100
+    items = s.http_get("weather", stream=True, item_path="locationWeatherData.*.data")
+    assert next(iter(items)) == [0, 0.5]
+    assert list(items)[-1] == [999, 999.5]
+    assert items.extras == {"interval": 3600}
+
+    server.routes["/missing"] = lambda handler: (404, {}, {})
+    assert s.http_get("missing", stream=True) == 404
+
+
+def test_retry_on_status_with_retry_after(server):
+    def flaky(handler):
+        if server.hits["/flaky"] < 3:
+            return 503, {"Retry-After": "0"}, {}
+        return 200, {}, {"ok": True}
+
+    server.routes["/flaky"] = flaky
+    s = REST("test", url=server.url, verbose=False, requests_per_sec=100)
+    s.retry_policy = RetryPolicy(total=3, backoff_factor=0, jitter=0)
+    assert s.get_one("flaky") == {"ok": True}
+    assert server.hits["/flaky"] == 3
+    assert s.retry_stats.retries == 2
+    assert s.retry_stats.causes == {"503": 2}
+
+    # POST is not idempotent: no retry on status
+    server.hits.clear()
+    assert s.http_post("flaky", frmt="json") == 503
+    assert server.hits["/flaky"] == 1
+
+
+def test_retry_policy_per_endpoint(server):
+    server.routes["/a/down"] = lambda handler: (502, {}, {})
+    server.routes["/b/down"] = lambda handler: (502, {}, {})
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        requests_per_sec=100,
+        retry=0,
+        retry_policies={"a": RetryPolicy(total=2, backoff_factor=0, jitter=0)},
+    )
+    assert s.get_one("a/down") == 502
+    assert s.get_one("b/down") == 502
+    assert server.hits == {"/a/down": 3, "/b/down": 1}
+    assert s.retry_stats.as_dict() == dict(retries=2, exhausted=2, causes={"502": 2})
+
+
+def test_coalesce_identical_gets(server):
+    server.routes["/catalog"] = lambda handler: (time.sleep(0.3), (200, {}, {"a": []}))[
+        1
+    ]
+    s = REST("test", url=server.url, verbose=False, requests_per_sec=1000, burst=50)
+    results = []
+
+    def call():
+        res = s.get_one("catalog", params={"x": 1})
+        res["a"].append(1)
+        results.append(res)
+
+    threads = [threading.Thread(target=call) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert server.hits["/catalog"] == 1
+    assert results == [{"a": [1]}] * 10
+
+    s.get_one("catalog", params={"x": 2})
+    assert server.hits["/catalog"] == 2
+
+
+def test_coalesce_within_deadline(server):
+    server.routes["/slow"] = lambda handler: (time.sleep(1), (200, {}, [1]))[1]
+    s = REST("test", url=server.url, verbose=False, requests_per_sec=1000, burst=50)
+    leader = threading.Thread(target=s.get_one, args=("slow",))
+    leader.start()
+    time.sleep(0.1)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        s.get_one("slow", deadline=0.2)
+    assert time.monotonic() - start < 0.5
+    leader.join()
+    assert server.hits["/slow"] == 1
+
+    # the deadline of the leader is not the one of the others
+    server.hits.clear()
+    results = []
+
+    def lead():
+        with pytest.raises(DeadlineExceeded):
+            s.get_one("slow", deadline=0.3)
+
+    leader = threading.Thread(target=lead)
+    follower = threading.Thread(target=lambda: results.append(s.get_one("slow")))
+    leader.start()
+    time.sleep(0.1)
+    follower.start()
+    leader.join()
+    follower.join()
+    assert results == [[1]]
+    assert server.hits["/slow"] == 2
+
+
+def test_memory_cache(server, tmp_path, monkeypatch):
+    server.routes["/catalog"] = lambda handler: (200, {}, {"a": []})
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        cache=True,
+        memory_cache=True,
+        cache_dir=str(tmp_path),
+    )
+    res = s.get_one("catalog")
+    res["a"].append(1)
+    assert s.get_one("catalog") == {"a": []}
+    assert s.memory_cache.hits == 1
+    assert server.hits["/catalog"] == 1
+
+    server.routes["/missing"] = lambda handler: (404, {}, {})
+    assert s.get_one("missing") == 404
+    assert len(s.memory_cache) == 1
+
+    # without copies, the callers share the result kept in memory
+    monkeypatch.setattr(AgroServicesConfig, "MEMORY_CACHE_COPY", False)
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        cache=True,
+        memory_cache=True,
+        cache_dir=str(tmp_path),
+    )
+    assert not s.memory_cache.copy
+    assert s.get_one("catalog") is s.get_one("catalog")
+
+
+def test_memory_cache_of_batches(server, tmp_path):
+    # the results of concurrent requests are checked against their own response
+    server.routes["/missing"] = lambda handler: (404, {}, {})
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        cache=True,
+        memory_cache=True,
+        cache_dir=str(tmp_path),
+        requests_per_sec=1000,
+        burst=100,
+    )
+    s.settings.ASYNC_BACKEND = "threads"
+    queries = ["%s?i=%d" % (path, i) for i in range(20) for path in ("missing", "echo")]
+    res = s.http_get(queries)
+    assert res[::2] == [404] * 20
+    assert len(s.memory_cache) == 20
+    assert s.get_one("missing?i=0") == 404
+    assert server.hits["/missing"] == 21
+
+
+def test_memory_cache_eviction():
+    now = [0]
+    cache = MemoryCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    now[0] = 11
+    assert cache.get("a") is None
+    cache.set("d", 4, ttl=None)
+    now[0] = 1000
+    assert cache.get("d") == 4
+
+
+def test_memory_cache_copies():
+    value = {"a": [{"b": 1.5}, None, "c"], "d": (1, [2])}
+    copied = copy_value(value)
+    assert copied == value
+    assert copied["a"] is not value["a"] and copied["a"][0] is not value["a"][0]
+    assert copied["d"][1] is not value["d"][1]
+
+    cache = MemoryCache()
+    cache.set("a", value)
+    assert cache.get("a") == value and cache.get("a") is not cache.get("a")
+    cache = MemoryCache(copy=False)
+    cache.set("a", value)
+    assert cache.get("a") is value
+
+
+def test_cache_expiration_per_endpoint(server, tmp_path):
+    class Service(REST):
+        cache_expiration = {"live": 0, "catalog": -1}
+
+    s = Service(
+        "test",
+        url=server.url,
+        verbose=False,
+        cache=True,
+        memory_cache=True,
+        cache_expiration={"catalog/today": 0},
+    )
+    s.CACHE_NAME = str(tmp_path / "test_db")
+    assert list(s.session.settings.urls_expire_after) == [
+        server.url + "/catalog/today",
+        server.url + "/live",
+        server.url + "/catalog",
+    ]
+    for _ in range(2):
+        s.get_one("catalog/all")
+        s.get_one("catalog/today")
+        s.get_one("live")
+    assert server.hits == {"/catalog/all": 1, "/catalog/today": 2, "/live": 2}
+    assert len(s.memory_cache) == 1
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_cache_backends(server, tmp_path, backend):
+    server.routes["/catalog"] = lambda handler: (200, {}, {"a": [1]})
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        cache=True,
+        cache_backend=backend,
+        cache_dir=str(tmp_path),
+    )
+    assert s.get_one("catalog") == {"a": [1]}
+    assert s.get_one("catalog") == {"a": [1]}
+    assert s.last_response.from_cache is True
+    assert server.hits["/catalog"] == 1
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "kv"])
+def test_delete_cache(server, tmp_path, monkeypatch, backend):
+    server.routes["/catalog"] = lambda handler: (200, {}, {"a": [1]})
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        cache=True,
+        cache_backend=backend,
+        cache_dir=str(tmp_path),
+    )
+    assert s.get_one("catalog") == {"a": [1]}
+    assert s.session.cache is s._get_cache_backend()
+    monkeypatch.setattr("builtins.input", lambda msg: "y")
+    s.delete_cache()
+    assert s.get_one("catalog") == {"a": [1]}
+    assert s.last_response.from_cache is False
+    assert server.hits["/catalog"] == 2
+
+
+def test_offline(server, tmp_path):
+    server.routes["/catalog"] = lambda handler: (200, {}, {"a": [1]})
+    s = REST("test", url=server.url, verbose=False, cache=True, cache_dir=str(tmp_path))
+    assert s.get_one("catalog") == {"a": [1]}
+
+    s = REST(
+        "test", url=server.url, verbose=False, offline=True, cache_dir=str(tmp_path)
+    )
+    assert s.CACHING is True
+    assert s.url_status() is None
+    assert s.get_one("catalog") == {"a": [1]}
+    with pytest.raises(CacheMissError):
+        s.get_one("catalog", params={"page": 2})
+    with pytest.raises(CacheMissError):
+        s.post_one("catalog", data="{}")
+    res = s.http_get(["catalog", "other"] * 6)
+    assert res[0] == {"a": [1]}
+    assert isinstance(res[1], CacheMissError)
+    assert server.hits == {"/catalog": 1}
+
+
+def test_revalidation(server):
+    def catalog(handler):
+        if handler.headers.get("If-None-Match") == '"v1"':
+            return 304, {"ETag": '"v1"'}, b""
+        return 200, {"ETag": '"v1"'}, [{"id": 1}]
+
+    server.routes["/catalog"] = catalog
+    calls = []
+
+    def postprocess(res):
+        calls.append(res)
+        return {item["id"]: item for item in res}
+
+    s = REST("test", url=server.url, verbose=False, revalidate=["catalog"])
+    res = s.get_one("catalog", postprocess=postprocess)
+    assert res == {1: {"id": 1}}
+    # the kept result is not altered by its callers
+    res[1]["id"] = 2
+    res = s.get_one("catalog", postprocess=postprocess)
+    assert res == {1: {"id": 1}}
+    assert s.last_response.status_code == 304
+    assert len(calls) == 1
+    assert server.hits["/catalog"] == 2
+    res[1]["id"] = 3
+    assert s.get_one("catalog", postprocess=postprocess) == {1: {"id": 1}}
+
+    # only the resources of the revalidate_urls of the class by default
+    s = REST("test", url=server.url, verbose=False)
+    assert s.validators is None
+    s.get_one("catalog", postprocess=postprocess)
+    assert len(calls) == 2
+
+    class Service(REST):
+        revalidate_urls = ("catalog",)
+
+    s = Service("test", url=server.url, verbose=False)
+    s.get_one("catalog", postprocess=postprocess)
+    s.get_one("catalog", postprocess=postprocess)
+    assert len(calls) == 3
+    s.get_one("other", postprocess=postprocess)
+    assert len(s.validators) == 1
+
+    # large responses are not kept
+    s = Service("test", url=server.url, verbose=False)
+    s.settings.params["cache.validators_max_size"][0] = 10
+    try:
+        s.get_one("catalog", postprocess=postprocess)
+        assert len(s.validators) == 0
+    finally:
+        s.settings.params["cache.validators_max_size"][0] = 10 * 1024 * 1024
+
+
+def test_compressed_transfers(server):
+    doc = {"data": [[i, 0.5] for i in range(2000)]}
+    body = gzip.compress(json.dumps(doc).encode())
+    server.routes["/weather"] = lambda handler: (
+        200,
+        {"Content-Encoding": "gzip"},
+        body,
+    )
+    s = REST("test", url=server.url, verbose=False, compress_requests=True)
+    assert s.get_one("weather") == doc
+    stats = s.transfer_stats.as_dict()
+    assert stats["received"] == len(body)
+    assert stats["response_ratio"] > 3
+
+    data = json.dumps(doc)
+    res = s.post_one("echo", data=data, headers={"Content-Type": "application/json"})
+    assert res["headers"]["Content-Encoding"] == "gzip"
+    assert gzip.decompress(res["body"].encode("latin-1")).decode() == data
+    assert s.transfer_stats.as_dict()["request_ratio"] > 3
+
+    res = s.post_one("echo", data="{}")
+    assert "Content-Encoding" not in res["headers"]
+
+    # bodies sent as is count their bytes, not their characters
+    before = s.transfer_stats.as_dict()
+    s.post_one("echo", data='"é"', compress=False)
+    stats = s.transfer_stats.as_dict()
+    assert stats["sent"] - before["sent"] == 4
+    assert stats["sent_decoded"] - before["sent_decoded"] == 4
+
+
+@pytest.mark.parametrize("name", ["json", "orjson"])
+def test_json_codecs(name, server):
+    pytest.importorskip(name)
+    codec = get_codec(name)
+    doc = {"data": [[1, 2.5], [3, None]], "name": "é"}
+    assert codec.loads(codec.dumps(doc)) == doc
+    assert codec.loads(memoryview(codec.dumps(doc))) == doc
+
+    server.routes["/latin"] = lambda handler: (
+        200,
+        {"Content-Type": "application/json; charset=latin-1"},
+        '{"name": "é"}'.encode("latin-1"),
+    )
+    s = REST("test", url=server.url, verbose=False)
+    s.codec = codec
+    assert s.get_one("latin") == {"name": "é"}
+
+
+def test_json_codec_numpy():
+    np = pytest.importorskip("numpy")
+    doc = {"data": np.arange(6.0).reshape(3, 2), "n": np.int64(3)}
+    for name in ("json", "orjson"):
+        try:
+            codec = get_codec(name)
+        except ImportError:
+            continue
+        assert codec.loads(codec.dumps(doc)) == {
+            "data": [[0, 1], [2, 3], [4, 5]],
+            "n": 3,
+        }
+
+
+def test_raw_format(server):
+    payload = bytes(range(256)) * 4
+    server.routes["/blob"] = lambda handler: (
+        200,
+        {"Content-Type": "application/octet-stream"},
+        payload,
+    )
+    s = REST("test", url=server.url, verbose=False)
+    res = s.http_get("blob", frmt="raw")
+    assert res == payload
+    assert res is s.last_response.content
+
+    server.routes["/text"] = lambda handler: (200, {}, "é")
+    assert s.get_one("text", frmt="raw") == "é".encode()
+    assert s.get_one("text", frmt="txt") == "é"
+
+    res = s.post_one("echo", frmt="raw", data=b"\xff")
+    assert isinstance(res, bytes)
+    assert json.loads(res)["body"] == "\xff"
+
+
+def test_circuit_breaker_states():
+    now = [0.0]
+    breaker = CircuitBreaker(
+        failure_threshold=2, reset_timeout=10, clock=lambda: now[0]
+    )
+    assert breaker.allow()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_in() == 10
+
+    now[0] = 10.0
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.snapshot() == dict(
+        state="closed", failures=0, total_failures=4, rejected=2, retry_in=0.0
+    )
+
+
+def test_circuit_breaker_rejects_failing_host(server):
+    server.routes["/down"] = lambda handler: (503, {}, {})
+    s = REST("test", url=server.url, verbose=False, requests_per_sec=100, retry=0)
+    s.settings.BREAKER_FAILURE_THRESHOLD = 3
+    try:
+        for _ in range(3):
+            assert s.get_one("down") == 503
+        with pytest.raises(CircuitOpenError) as err:
+            s.get_one("echo")
+        assert err.value.retry_in > 0
+        with pytest.raises(CircuitOpenError):
+            s.http_post("echo")
+        assert server.hits["/down"] == 3
+        assert "/echo" not in server.hits
+
+        host = server.url.split("//")[1]
+        state = s.circuit_breakers.snapshot()[host]
+        assert state["state"] == "open"
+        assert state["rejected"] == 2
+
+        # other hosts are not affected
+        assert s._get_circuit_breaker("http://example.org/x").allow()
+    finally:
+        s.settings.BREAKER_FAILURE_THRESHOLD = 5
+
+
+def test_circuit_open_skips_rate_limit(server):
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        requests_per_sec=2,
+        rate_limiter=LocalRateLimiter(),
+    )
+    breaker = s._get_circuit_breaker(server.url)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    start = time.monotonic()
+    for _ in range(4):
+        with pytest.raises(CircuitOpenError):
+            s.get_one("echo")
+        with pytest.raises(CircuitOpenError):
+            s.http_post("echo")
+    assert time.monotonic() - start < 0.5
+    # the budget of the host is untouched
+    assert s.rate_limiter.reserve(s._rate_key(server.url), 2) == 0.0
+
+
+def test_circuit_open_serves_cache(server, tmp_path):
+    server.routes["/catalog"] = lambda handler: (200, {}, {"a": [1]})
+    server.routes["/down"] = lambda handler: (503, {}, {})
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        requests_per_sec=100,
+        retry=0,
+        cache=True,
+        cache_dir=str(tmp_path),
+        memory_cache=False,
+    )
+    s.settings.BREAKER_FAILURE_THRESHOLD = 3
+    try:
+        assert s.get_one("catalog") == {"a": [1]}
+        for _ in range(3):
+            assert s.get_one("down") == 503
+        assert s.get_one("catalog") == {"a": [1]}
+        assert s.last_response.from_cache
+        with pytest.raises(CircuitOpenError):
+            s.get_one("echo")
+        assert server.hits["/catalog"] == 1
+        assert "/echo" not in server.hits
+    finally:
+        s.settings.BREAKER_FAILURE_THRESHOLD = 5
+
+
+def test_connect_and_read_timeouts(server):
+    server.routes["/slow"] = lambda handler: (time.sleep(0.5), (200, {}, [1]))[1]
+    s = REST("test", url=server.url, verbose=False, retry=0)
+    assert s._request_timeout() == (s.settings.CONNECT_TIMEOUT, s.TIMEOUT)
+    assert s._request_timeout(5) == (5, 5)
+    # the timeout of the caller is not overridden
+    assert s.get_one("slow", timeout=(1, 0.1)) is None
+    assert s.get_one("slow", timeout=(1, 2)) == [1]
+
+    with Deadline(1):
+        connect, read = s._request_timeout()
+        assert connect <= 1 and read <= 1
+    with Deadline(10):
+        with Deadline(60):  # cannot extend the enclosing deadline
+            assert s._request_timeout()[1] <= 10
+
+
+def test_deadline_covers_retries(server):
+    server.routes["/down"] = lambda handler: (503, {"Retry-After": "1"}, {})
+    s = REST("test", url=server.url, verbose=False, requests_per_sec=100)
+    s.retry_policy = RetryPolicy(total=5, backoff_factor=0, jitter=0)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        s.get_one("down", deadline=1.5)
+    assert time.monotonic() - start < 1.4
+    assert server.hits["/down"] == 2
+    # the host is not to blame
+    assert s._get_circuit_breaker(server.url).snapshot()["total_failures"] == 0
+
+
+def test_deadline_of_batch_calls(server):
+    server.routes["/slow"] = lambda handler: (time.sleep(1), (200, {}, [1]))[1]
+    s = REST("test", url=server.url, verbose=False, requests_per_sec=1000, burst=50)
+    s.settings.ASYNC_BACKEND = "threads"
+    start = time.monotonic()
+    res = s.http_get(["slow"] * 12, deadline=0.3)
+    assert time.monotonic() - start < 0.9
+    assert all(isinstance(r.value, DeadlineExceeded) for r in res)
+
+
+def test_request_metrics(server):
+    class Service(REST):
+        endpoint_templates = ("model/{ModelId}",)
+        revalidate_urls = ("flaky",)
+
+    def flaky(handler):
+        if server.hits["/flaky"] < 2:
+            return 503, {"Retry-After": "0"}, {}
+        return 200, {"ETag": '"1"'}, {"ok": True}
+
+    server.routes["/flaky"] = flaky
+    registry = MetricsRegistry()
+    s = Service("test", url=server.url, verbose=False, metrics=registry)
+    s.retry_policy = RetryPolicy(total=3, backoff_factor=0, jitter=0)
+    assert s._endpoint(server.url + "/model/abc") == "model/{ModelId}"
+    assert s._endpoint(server.url + "/item/42/") == "item/{id}"
+    assert s._endpoint("http://example.org/a/b") == "example.org/a/b"
+
+    s.get_one("model/abc")
+    s.get_one("model/xyz")
+    s.http_post("model/abc", data="x" * 10)
+    s.get_one("flaky")
+    s.get_one("flaky")  # revalidated
+
+    metrics = s.request_metrics
+    labels = dict(service="test", endpoint="model/{ModelId}")
+    assert metrics.requests.value(method="GET", status=200, **labels) == 2
+    assert metrics.requests.value(method="POST", status=200, **labels) == 1
+    assert metrics.duration.count(method="GET", **labels) == 2
+    assert metrics.sent.value(**labels) == 10
+    assert metrics.received.value(**labels) > 0
+    assert metrics.cache.value(result="miss", **labels) == 2
+    assert metrics.rate_limit_wait.count(**labels) == 3
+
+    labels["endpoint"] = "flaky"
+    assert metrics.retries.value(**labels) == 1
+    assert metrics.cache.value(result="revalidated", **labels) == 1
+
+    text = registry.export()
+    assert "# TYPE agroservices_requests_total counter" in text
+    assert (
+        'agroservices_requests_total{service="test",endpoint="model/{ModelId}",'
+        'method="GET",status="200"} 2'
+    ) in text.splitlines()
+    assert (
+        'agroservices_request_duration_seconds_bucket{service="test",'
+        'endpoint="model/{ModelId}",method="GET",le="+Inf"} 2'
+    ) in text.splitlines()
+
+
+def test_tracing(server):
+    server.routes["/down"] = lambda handler: (503, {}, {})
+    tracer = Tracer()
+    exporter = InMemoryExporter()
+    tracer.add_exporter(exporter)
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        requests_per_sec=1000,
+        burst=50,
+        retry=0,
+        tracer=tracer,
+    )
+    s.settings.ASYNC_BACKEND = "threads"
+    s.get_one("item/1")
+    s.http_post("echo", data="x" * 10, frmt="json")
+    s.http_get(["echo"] * 11)
+    with pytest.raises(DeadlineExceeded):
+        s.get_one("down", deadline=0)
+
+    get, post, batch_get = exporter.spans[0], exporter.spans[1], exporter.spans[-2]
+    assert get.name == "REST.get_one"
+    assert get.attributes["endpoint"] == "item/{id}"
+    assert get.attributes["status"] == 200
+    assert get.attributes["response_size"] > 0
+    assert get.duration > 0
+    assert post.name == "REST.post_one"
+    assert post.attributes["request_size"] == 10
+
+    # the calls of a batch, run in threads, are children of its span
+    assert batch_get.name == "REST.http_get"
+    assert batch_get.attributes["queries"] == 11
+    children = [span for span in exporter.spans if span.parent is batch_get]
+    assert len(children) == 11
+    assert all(span.trace_id == batch_get.trace_id for span in children)
+
+    assert exporter.spans[-1].error == "DeadlineExceeded"
+
+    tracer.remove_exporter(exporter)
+    exporter.clear()
+    s.get_one("echo")
+    assert exporter.spans == []
+
+
+def test_phase_timings(server):
+    doc = {"data": [[i, i + 0.5] for i in range(10000)]}
+    server.routes["/slow"] = lambda handler: (time.sleep(0.2), (200, {}, doc))[1]
+
+    def flaky(handler):
+        if server.hits["/flaky"] < 3:
+            return 503, {}, {}
+        return 200, {}, {"ok": True}
+
+    server.routes["/flaky"] = flaky
+    reported = []
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        requests_per_sec=2,
+        burst=1,
+        timings_hook=lambda url, timings: reported.append((url, timings)),
+    )
+    s.session.close()  # no connection to reuse
+    s.get_one("slow")
+    timings = s.last_response.timings
+    assert timings["connect"] > 0
+    assert timings["ttfb"] >= 0.2
+    assert timings["decode"] > 0
+    assert timings.total == pytest.approx(sum(timings.phases.values()))
+    assert reported == [(server.url + "/slow", timings)]
+
+    s.http_post("echo", frmt="json")
+    timings = s.last_response.timings
+    assert timings["rate_limit"] > 0.1  # 2 requests per second
+    assert timings["connect"] == 0  # the connection is reused
+    assert timings["send"] > 0
+
+    s.retry_policy = RetryPolicy(total=3, backoff_factor=0.1, jitter=0)
+    s._session = None  # mount the new policy
+    s.get_one("flaky")
+    assert s.last_response.timings["retry_wait"] >= 0.2
+
+
+@pytest.mark.parametrize("transport", sorted(TRANSPORTS))
+def test_retries_within_deadline(server, transport):
+    if transport == "httpx":
+        pytest.importorskip("httpx")
+    server.routes["/busy"] = lambda handler: (time.sleep(0.6), (503, {}, {}))[1]
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        requests_per_sec=100,
+        transport=transport,
+        retry=RetryPolicy(total=3, backoff_factor=0, jitter=0),
+    )
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        s.get_one("busy", deadline=1)
+    # the second attempt is cut at the deadline
+    assert time.monotonic() - start < 1.15
+    assert server.hits["/busy"] == 2
+
+
+@pytest.mark.parametrize("transport", sorted(TRANSPORTS))
+def test_transports(server, transport, tmp_path):
+    if transport == "httpx":
+        pytest.importorskip("httpx")
+    doc = {"data": list(range(1000))}
+    server.routes["/gzip"] = lambda handler: (
+        200,
+        {"Content-Encoding": "gzip"},
+        gzip.compress(json.dumps(doc).encode()),
+    )
+
+    def flaky(handler):
+        if server.hits["/flaky"] < 3:
+            return 503, {"Retry-After": "0"}, {}
+        return 200, {}, {"ok": True}
+
+    server.routes["/flaky"] = flaky
+    server.routes["/down"] = lambda handler: (503, {}, {})
+    registry = MetricsRegistry()
+    s = REST(
+        "test",
+        url=server.url,
+        verbose=False,
+        requests_per_sec=1000,
+        burst=50,
+        transport=transport,
+        cache=True,
+        cache_backend="memory",
+        cache_dir=str(tmp_path),
+        metrics=registry,
+    )
+    s.retry_policy = RetryPolicy(total=2, backoff_factor=0, jitter=0)
+    assert s.get_one("gzip") == doc
+    assert s.last_response.timings["transfer"] > 0
+    assert s.get_one("gzip") == doc
+    assert s.last_response.from_cache
+    assert s.http_post("echo", frmt="json", data="x")["body"] == "x"
+    assert s.get_one("flaky") == {"ok": True}
+    assert s.retry_stats.retries == 2
+    assert s.request_metrics.retries.value(service="test", endpoint="flaky") == 2
+    assert s.get_one("down") == 503
+    with pytest.raises(requests.exceptions.ConnectionError):
+        s.session.get("http://127.0.0.1:1/refused")
+    chunks = s.get_one("gzip", frmt="raw", stream=True)
+    assert json.loads(b"".join(chunks)) == doc